@@ -1,38 +1,94 @@
 from prompt_toolkit import PromptSession
-from prompt_toolkit.completion import WordCompleter
+from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from prompt_toolkit.completion import Completer, Completion, WordCompleter
+
+from dispatcher import COMMAND_NAME, COMMANDS
 
 # You need to install the external package in the terminal first: pip install prompt_toolkit
-commands = WordCompleter(
-    [
-        "close",
-        "exit",
-        "end",
-        "bye",
-        "hello",
-        "hi",
-        "change-phone",
-        "phone",
-        "all",
-        "delete",
-        "change-birthday",
-        "show-birthday",
-        "add-contact",
-        "birthdays",
-        "add-address",
-        "add-email",
-        "add-phone",
-        "findall",
-        "noteadd",
-        "notesall",
-        "notesedit",
-        "notesremove",
-        "findbytag",
-        "addtag",
-        "note-help",
-        "notes-help",
-        "notehelp",
-        "noteshelp",
-    ],
-    ignore_case=True,
-)
-session = PromptSession(completer=commands)
+# The words come from the dispatcher registry, so every registered command is offered
+commands = WordCompleter(lambda: sorted(COMMANDS), ignore_case=True)
+
+# Commands whose first argument is a contact name
+NAME_COMMANDS = {
+    "phone", "show-birthday", "delete", "add-phone", "add-address",
+    "change-birthday", "add-email", "change-phone", "fuzzy",
+}
+
+# Notes commands, by the position of the ":"-separated field holding a note title or a tag
+NOTE_FIELDS = {
+    "notesfind": {1: "titles"},
+    "notesedit": {1: "titles"},
+    "notesremove": {1: "titles"},
+    "addtag": {1: "titles", 2: "tags"},
+    "findbytag": {1: "tags"},
+}
+
+
+class BookCompleter(Completer):
+    """
+    Completer of the commands and of the contact names, note titles and tags they take.
+
+    The first word is completed from the registered commands. The arguments
+    are looked up by prefix in the books, whose prefix indexes answer in
+    about the same time whatever their size.
+
+    Args:
+        address_book (AddressBook): The book completing contact names.
+        note_book (NotesBook): The book completing note titles and tags."""
+
+    limit = 20
+
+    def __init__(self, address_book, note_book):
+        self.address_book = address_book
+        self.note_book = note_book
+
+    def get_completions(self, document, complete_event):
+        text = document.text_before_cursor.lstrip()
+        match = COMMAND_NAME.match(text)
+        if match is None or match.end() == len(text):
+            yield from commands.get_completions(document, complete_event)
+            return
+        verb, rest = match.group(), text[match.end():]
+        if verb in NAME_COMMANDS:
+            words = rest.split()
+            if rest[-1].isspace():
+                words.append("")
+            if len(words) != 1:
+                return
+            prefix = words[0]
+            found = self.address_book.complete_names(prefix, self.limit)
+        elif verb in NOTE_FIELDS:
+            fields = rest.split(":")
+            kind = NOTE_FIELDS[verb].get(len(fields) - 1)
+            if kind is None:
+                return
+            prefix = fields[-1].lstrip()
+            if kind == "titles":
+                found = self.note_book.complete_titles(prefix, self.limit)
+            else:
+                found = self.note_book.complete_tags(prefix, self.limit)
+        else:
+            return
+        for value in found:
+            yield Completion(value, start_position=-len(prefix))
+
+
+def create_session(address_book, note_book):
+    """
+    Create the prompt session of the interactive mode.
+
+    A session takes over the terminal, so it is only made once a terminal is
+    known to be there, instead of when this module is imported.
+
+    Args:
+        address_book (AddressBook): The book completing contact names.
+        note_book (NotesBook): The book completing note titles and tags.
+
+    Returns:
+        PromptSession: The session, with completion and suggestions from the history."""
+
+    return PromptSession(
+        completer=BookCompleter(address_book, note_book),
+        auto_suggest=AutoSuggestFromHistory(),
+        complete_while_typing=True,
+    )
@@ -0,0 +1,79 @@
+import sys
+import threading
+
+
+class Autosaver:
+    """
+    Background thread writing snapshots of journaled books.
+
+    Every mutation of a book is already in its journal; the autosaver folds
+    the journal into a new snapshot, so that the next start replays little,
+    without making the prompt wait for a whole book to be written. A book is
+    dirty from its first change after a snapshot; the dirty books are saved
+    every ``interval`` seconds, or as soon as ``changes`` changes have piled
+    up in one of them. Locking is enabled on the books, since they are now
+    read from two threads.
+
+    Args:
+        books (list): The journaled books to save.
+        interval (float, optional): Seconds between saves. Defaults to 60.
+        changes (int, optional): Changes that trigger a save right away. Defaults to 1000."""
+
+    def __init__(self, books, interval=60.0, changes=1000):
+        self.books = list(books)
+        self.interval = interval
+        self.changes = changes
+        # Changes since the last snapshot, by position of the book in self.books
+        self.dirty = [0] * len(self.books)
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="pyforce-autosave", daemon=True)
+
+    def start(self):
+        for book in self.books:
+            book.enable_locking()
+            book._autosaver = self
+        self._thread.start()
+
+    def changed(self, book):
+        # Called by the book for every journaled change, so it has to be cheap
+        index = next(i for i, known in enumerate(self.books) if known is book)
+        with self._condition:
+            self.dirty[index] += 1
+            if self.dirty[index] == self.changes:
+                self._condition.notify()
+
+    def stop(self):
+        """
+        Stop the thread after saving the books that are still dirty.
+
+        Returns:
+            None"""
+
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        for book in self.books:
+            book._autosaver = None
+
+    def _due(self):
+        return self._stopping or max(self.dirty, default=0) >= self.changes
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(self._due, timeout=self.interval)
+                stopping = self._stopping
+                dirty = [i for i, count in enumerate(self.dirty) if count]
+                for i in dirty:
+                    self.dirty[i] = 0
+            for i in dirty:
+                try:
+                    self.books[i].background_checkpoint()
+                except Exception as ex:
+                    print(f"Autosave failed young Jedi: {ex}", file=sys.stderr)
+                    with self._condition:
+                        self.dirty[i] += 1
+            if stopping:
+                return
@@ -0,0 +1,137 @@
+import asyncio
+import itertools
+import json
+import socket
+
+
+# Answers such as 'all' on a large book are long single lines
+RESPONSE_LIMIT = 1 << 28
+
+
+class Client:
+    """
+    Blocking client of a PyForce server.
+
+    Args:
+        path (str, optional): The Unix socket of the server. Defaults to None, for TCP.
+        host (str, optional): The TCP host. Defaults to "127.0.0.1".
+        port (int, optional): The TCP port. Defaults to 8765."""
+
+    def __init__(self, path=None, host="127.0.0.1", port=8765):
+        if path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rwb")
+        self.ids = itertools.count()
+
+    def call(self, command):
+        """
+        Run one command on the server.
+
+        Args:
+            command (str): The command line, as typed in the assistant.
+
+        Returns:
+            dict: The response with the keys "id", "command", "ok" and "result"."""
+
+        return self.pipeline([command])[0]
+
+    def pipeline(self, commands, window=256):
+        """
+        Send several commands at once and wait for all the answers.
+
+        The commands are sent in windows of ``window`` requests, so that the
+        answers never pile up on the server while it waits for us to read.
+
+        Args:
+            commands (iterable): The command lines.
+            window (int, optional): The most requests in flight. Defaults to 256.
+
+        Returns:
+            list: The responses, in the order of the commands."""
+
+        responses = []
+        commands = iter(commands)
+        while batch := list(itertools.islice(commands, window)):
+            for command in batch:
+                self.file.write(json.dumps({"id": next(self.ids), "command": command}).encode("utf-8") + b"\n")
+            self.file.flush()
+            responses.extend(self._read() for _ in batch)
+        return responses
+
+    def _read(self):
+        line = self.file.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection")
+        return json.loads(line)
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncClient:
+    """
+    Asyncio client of a PyForce server; several calls may be in flight at once.
+
+    Create it with ``await AsyncClient.connect(...)``, which takes the same
+    arguments as Client."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.ids = itertools.count()
+        self.pending = {}
+        self.receiver = asyncio.create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, path=None, host="127.0.0.1", port=8765):
+        if path:
+            reader, writer = await asyncio.open_unix_connection(path, limit=RESPONSE_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=RESPONSE_LIMIT)
+        return cls(reader, writer)
+
+    async def call(self, command):
+        """
+        Run one command on the server.
+
+        Args:
+            command (str): The command line, as typed in the assistant.
+
+        Returns:
+            dict: The response with the keys "id", "command", "ok" and "result"."""
+
+        request_id = next(self.ids)
+        future = self.pending[request_id] = asyncio.get_running_loop().create_future()
+        self.writer.write(json.dumps({"id": request_id, "command": command}).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        return await future
+
+    async def _receive(self):
+        try:
+            while line := await self.reader.readline():
+                response = json.loads(line)
+                future = self.pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("The server closed the connection"))
+            self.pending.clear()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+        await self.receiver
@@ -0,0 +1,144 @@
+from contextlib import redirect_stdout
+import io
+import re
+
+
+# Command name -> callable taking (command, address_book, note_book)
+COMMANDS = {}
+
+# Names of the commands that change a book
+WRITES = set()
+
+# Returned by a handler to end the session
+EXIT = object()
+
+# The command name is the first word, notes commands may glue it to a ":"
+COMMAND_NAME = re.compile(r"[^\s:]+")
+
+
+def command(*names, book="address", writes=False):
+    """
+    Register a handler for one or more command names.
+
+    Args:
+        *names (str): The command names, matched against the first word of the input.
+        book (str, optional): What the handler is called with: "address" for
+            (command, address_book), "notes" for (command, note_book) and None
+            for no arguments. Defaults to "address".
+        writes (bool, optional): True if the handler changes a book. Defaults to False.
+
+    Returns:
+        function: The decorator, which returns the handler unchanged."""
+
+    def register(handler):
+        if book == "address":
+            def call(line, address_book, note_book):
+                return handler(line, address_book)
+        elif book == "notes":
+            def call(line, address_book, note_book):
+                return handler(line, note_book)
+        else:
+            def call(line, address_book, note_book):
+                return handler()
+        for name in names:
+            COMMANDS[name] = call
+            if writes:
+                WRITES.add(name)
+        return handler
+
+    return register
+
+
+def get_handler(line):
+    """
+    Find the handler for an input line with one dict lookup.
+
+    Args:
+        line (str): The command typed by the user.
+
+    Returns:
+        callable or None: The handler taking (command, address_book, note_book),
+        or None if the command is unknown."""
+
+    match = COMMAND_NAME.match(line.strip())
+    return COMMANDS.get(match.group()) if match else None
+
+
+def render(result):
+    """
+    Turn a handler result into text.
+
+    Args:
+        result: What the handler returned: None, a string, or a generator of
+            lines for outputs that are printed while they are made.
+
+    Returns:
+        str or None: The text of the result, an ErrorMessage if a generator
+        ended with one."""
+
+    if result is None or isinstance(result, str):
+        return result
+    lines = list(result)
+    text = "\n".join(lines)
+    return ErrorMessage(text) if lines and isinstance(lines[-1], ErrorMessage) else text
+
+
+def command_name(line):
+    match = COMMAND_NAME.match(line.strip())
+    return match.group() if match else ""
+
+
+def is_write(line):
+    return command_name(line) in WRITES
+
+
+class ErrorMessage(str):
+    """A handler result telling the user what went wrong, printed like any other result."""
+
+
+def run_batch(lines, address_book, note_book, output):
+    """
+    Run commands without prompting and write one JSON result per command.
+
+    Blank lines and lines starting with "#" are skipped, and a close command
+    stops the batch. Whatever a handler prints is captured into its result.
+
+    Args:
+        lines (iterable): The commands, one per line.
+        address_book (AddressBook): The address book the commands work on.
+        note_book (NotesBook): The notes book the commands work on.
+        output (file): Where the results are written, one JSON object per line
+            with the keys "line", "command", "ok" and "result".
+
+    Returns:
+        tuple: The number of commands run and the number of them that failed."""
+
+    import json
+
+    executed = failed = 0
+    captured = io.StringIO()
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        handler = get_handler(line)
+        if handler is None:
+            text = ErrorMessage("Invalid command young Jedi. Try again!")
+        else:
+            with redirect_stdout(captured):
+                result = handler(line, address_book, note_book)
+                # Generators of lines print and fail while they are consumed, so they are rendered here
+                text = None if result is EXIT else render(result)
+            if result is EXIT:
+                break
+        printed = captured.getvalue()
+        if printed:
+            captured.seek(0)
+            captured.truncate()
+        ok = not isinstance(text, ErrorMessage)
+        text = printed.rstrip("\n") if text is None else printed + text
+        output.write(json.dumps({"line": number, "command": command_name(line), "ok": ok, "result": text}))
+        output.write("\n")
+        executed += 1
+        failed += not ok
+    return executed, failed
@@ -0,0 +1,209 @@
+import csv
+import os
+import re
+
+
+# Formatting characters people put in phone numbers, removed before validation
+PHONE_FORMATTING = re.compile(r"[\s().-]")
+PHONE_SEPARATORS = re.compile(r"[;,]")
+
+
+def _clean_phone(phone):
+    return PHONE_FORMATTING.sub("", phone)
+
+
+def read_csv(filename):
+    """
+    Stream contacts from a CSV file with a header row.
+
+    The columns are matched by name, ignoring case: name, phone or phones
+    (several numbers separated by ";" or ","), address, birthday and email.
+
+    Args:
+        filename (str): The name of the CSV file.
+
+    Returns:
+        generator: One dict per row, with the row's line number under "line"."""
+
+    with open(filename, newline="", encoding="utf-8-sig") as file:
+        reader = csv.DictReader(file)
+        for row in reader:
+            row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+            phones = row.get("phones") or row.get("phone") or ""
+            yield {
+                "line": reader.line_num,
+                "name": row.get("name", ""),
+                "phones": [_clean_phone(p) for p in PHONE_SEPARATORS.split(phones) if p.strip()],
+                "address": row.get("address") or None,
+                "birthday": row.get("birthday") or None,
+                "email": row.get("email") or None,
+            }
+
+
+def _unescape(value):
+    return re.sub(r"\\([nN,;\\])", lambda m: "\n" if m.group(1) in "nN" else m.group(1), value)
+
+
+def _vcard_birthday(value):
+    # vCard dates are YYYY-MM-DD or YYYYMMDD, the book uses DD.MM.YYYY
+    match = re.fullmatch(r"(\d{4})-?(\d{2})-?(\d{2})(T.*)?", value)
+    return f"{match[3]}.{match[2]}.{match[1]}" if match else value
+
+
+def _vcard_lines(file):
+    # Lines starting with a space or a tab continue the previous one
+    line, line_number = None, 0
+    for number, raw in enumerate(file, 1):
+        raw = raw.rstrip("\r\n")
+        if raw[:1] in (" ", "\t") and line is not None:
+            line += raw[1:]
+            continue
+        if line is not None:
+            yield line_number, line
+        line, line_number = raw, number
+    if line is not None:
+        yield line_number, line
+
+
+def read_vcard(filename):
+    """
+    Stream contacts from a vCard file.
+
+    FN (or N), TEL, ADR, BDAY and EMAIL properties are read; all TEL numbers
+    become phones of the contact.
+
+    Args:
+        filename (str): The name of the vCard file.
+
+    Returns:
+        generator: One dict per card, with the line of BEGIN:VCARD under "line"."""
+
+    with open(filename, encoding="utf-8-sig") as file:
+        card = None
+        for line_number, line in _vcard_lines(file):
+            key, _, value = line.partition(":")
+            name = key.split(";")[0].split(".")[-1].upper()
+            if name == "BEGIN" and value.upper() == "VCARD":
+                card = {"line": line_number, "name": "", "phones": [],
+                        "address": None, "birthday": None, "email": None}
+            elif card is None:
+                continue
+            elif name == "END":
+                yield card
+                card = None
+            elif name == "FN":
+                card["name"] = _unescape(value).strip()
+            elif name == "N" and not card["name"]:
+                family, given = (value.split(";") + ["", ""])[:2]
+                card["name"] = " ".join(filter(None, (_unescape(given), _unescape(family))))
+            elif name == "TEL":
+                card["phones"].append(_clean_phone(value.removeprefix("tel:")))
+            elif name == "ADR" and card["address"] is None:
+                parts = [_unescape(part).strip() for part in value.split(";")]
+                card["address"] = ", ".join(filter(None, parts)) or None
+            elif name == "BDAY":
+                card["birthday"] = _vcard_birthday(value.strip())
+            elif name == "EMAIL" and card["email"] is None:
+                card["email"] = value.strip()
+
+
+def read_contacts(filename):
+    """
+    Stream contacts from a CSV or vCard file, chosen by the file extension.
+
+    Args:
+        filename (str): The name of the file.
+
+    Raises:
+        ValueError: If the file type is not supported.
+
+    Returns:
+        generator: The contacts as dicts accepted by AddressBook.bulk_import."""
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return read_csv(filename)
+    if extension in (".vcf", ".vcard"):
+        return read_vcard(filename)
+    raise ValueError(f"Unsupported file type '{extension}', use .csv or .vcf")
+
+
+def write_csv(filename, records):
+    """
+    Write contacts to a CSV file that read_csv reads back.
+
+    Args:
+        filename (str): The name of the CSV file.
+        records (iterable): The records, written in their order.
+
+    Returns:
+        int: The number of contacts written."""
+
+    written = 0
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "phones", "address", "birthday", "email"])
+        for record in records:
+            writer.writerow([
+                record.name.value,
+                ";".join(sorted(phone.value for phone in record.phones)),
+                record.address.value if record.address else "",
+                record.birthday.value if record.birthday else "",
+                record.email.value if record.email else "",
+            ])
+            written += 1
+    return written
+
+
+def _escape(value):
+    return re.sub(r"([,;\\])", r"\\\1", value).replace("\n", "\\n")
+
+
+def write_vcard(filename, records):
+    """
+    Write contacts to a vCard 3.0 file that read_vcard reads back.
+
+    Args:
+        filename (str): The name of the vCard file.
+        records (iterable): The records, written in their order.
+
+    Returns:
+        int: The number of contacts written."""
+
+    written = 0
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        for record in records:
+            lines = ["BEGIN:VCARD", "VERSION:3.0", f"FN:{_escape(record.name.value)}"]
+            lines.extend(f"TEL:{phone.value}" for phone in sorted(record.phones, key=lambda phone: phone.value))
+            if record.address:
+                lines.append(f"ADR:;;{_escape(record.address.value)};;;;")
+            if record.birthday:
+                lines.append(f"BDAY:{record.get_birthday_date().isoformat()}")
+            if record.email:
+                lines.append(f"EMAIL:{record.email.value}")
+            lines.append("END:VCARD")
+            file.write("\r\n".join(lines) + "\r\n")
+            written += 1
+    return written
+
+
+def write_contacts(filename, records):
+    """
+    Write contacts to a CSV or vCard file, chosen by the file extension.
+
+    Args:
+        filename (str): The name of the file.
+        records (iterable): The records, written in their order.
+
+    Raises:
+        ValueError: If the file type is not supported.
+
+    Returns:
+        int: The number of contacts written."""
+
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        return write_csv(filename, records)
+    if extension in (".vcf", ".vcard"):
+        return write_vcard(filename, records)
+    raise ValueError(f"Unsupported file type '{extension}', use .csv or .vcf")
@@ -0,0 +1,1073 @@
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from heapq import heapify, heappop, heappush
+from itertools import chain, count
+from math import log
+import re
+
+
+class NgramIndex:
+    """
+    Inverted n-gram index for substring search over keyed documents.
+
+    Every document is split into overlapping n-grams, and each n-gram keeps
+    a posting set of the keys whose document contains it. A substring query
+    intersects the postings of its own n-grams and then verifies the few
+    remaining candidates, so the cost depends on the number of matches rather
+    than on the total amount of indexed text."""
+
+    def __init__(self, n=3):
+        self.n = n
+        self.postings = defaultdict(set)
+        self.documents = {}
+        self.order = {}
+        self._counter = count()
+
+    def grams(self, text):
+        """
+        Split a text into the set of its n-grams.
+
+        Args:
+            text (str): The text to be split.
+
+        Returns:
+            set: The distinct n-grams of the text."""
+
+        # Joining the characters of n shifted copies is faster than slicing at every position
+        return set(map("".join, zip(*(text[i:] for i in range(self.n)))))
+
+    def add(self, key, document):
+        """
+        Index a document, replacing the previous document stored for the key.
+
+        Only the n-grams that actually changed are touched, and the key keeps
+        its original position in the result order.
+
+        Args:
+            key (str): The key of the document.
+            document (str): The text to be indexed.
+
+        Returns:
+            None"""
+
+        old_document = self.documents.get(key)
+        if old_document == document:
+            return
+        old_grams = self.grams(old_document) if old_document is not None else set()
+        new_grams = self.grams(document)
+        for gram in old_grams - new_grams:
+            self._unpost(gram, key)
+        for gram in new_grams - old_grams:
+            self.postings[gram].add(key)
+        self.documents[key] = document
+        if key not in self.order:
+            self.order[key] = next(self._counter)
+
+    def update(self, items):
+        """
+        Index many documents at once.
+
+        The n-grams of the keys not indexed yet are gathered for the whole
+        batch, then every posting set is extended once; the documents of
+        keys already indexed are replaced through add.
+
+        Args:
+            items (iterable): The (key, document) pairs to be indexed.
+
+        Returns:
+            None"""
+
+        documents = self.documents
+        grouped = defaultdict(list)
+        for key, document in items:
+            if key in documents:
+                self.add(key, document)
+                continue
+            documents[key] = document
+            self.order[key] = next(self._counter)
+            for gram in self.grams(document):
+                grouped[gram].append(key)
+        postings = self.postings
+        for gram, keys in grouped.items():
+            postings[gram].update(keys)
+
+    def discard(self, key):
+        """
+        Remove the document stored for the key, if any.
+
+        Args:
+            key (str): The key of the document.
+
+        Returns:
+            None"""
+
+        document = self.documents.pop(key, None)
+        if document is None:
+            return
+        for gram in self.grams(document):
+            self._unpost(gram, key)
+        del self.order[key]
+
+    def clear(self):
+        self.postings.clear()
+        self.documents.clear()
+        self.order.clear()
+
+    def search(self, substring):
+        """
+        Find the keys whose document contains the substring.
+
+        Args:
+            substring (str): The text to look for.
+
+        Returns:
+            list: The matching keys in the order they were first indexed."""
+
+        if len(substring) < self.n:
+            candidates = self.documents
+        else:
+            posting_lists = sorted(
+                (self.postings.get(gram, ()) for gram in self.grams(substring)),
+                key=len,
+            )
+            if not posting_lists[0]:
+                return []
+            candidates = set(posting_lists[0]).intersection(*posting_lists[1:])
+        documents = self.documents
+        found = [key for key in candidates if substring in documents[key]]
+        found.sort(key=self.order.__getitem__)
+        return found
+
+    def estimate(self, substring):
+        """
+        Bound the number of keys whose document contains the substring, without searching.
+
+        Args:
+            substring (str): The text to look for.
+
+        Returns:
+            int: The length of the shortest posting list of its n-grams, or
+            the number of documents if it is shorter than an n-gram."""
+
+        if len(substring) < self.n:
+            return len(self.documents)
+        return min(len(self.postings.get(gram, ())) for gram in self.grams(substring))
+
+    def _unpost(self, gram, key):
+        keys = self.postings[gram]
+        keys.discard(key)
+        if not keys:
+            del self.postings[gram]
+
+
+def edit_distance(first, second, limit):
+    """
+    Compute the Levenshtein distance between two strings, giving up past a limit.
+
+    Args:
+        first (str): The first string.
+        second (str): The second string.
+        limit (int): The largest distance of interest.
+
+    Returns:
+        int: The distance, or limit + 1 if it is larger than the limit."""
+
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    # Only the cells within limit of the diagonal can stay within the limit
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(second) + 1)]
+    for i, first_char in enumerate(first, 1):
+        current = [over] * (len(second) + 1)
+        if i <= limit:
+            current[0] = i
+        best = current[0]
+        for j in range(max(1, i - limit), min(len(second), i + limit) + 1):
+            value = previous[j - 1] + (first_char != second[j - 1])
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            current[j] = value if value < over else over
+            if value < best:
+                best = value
+        if best > limit:
+            return over
+        previous = current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    """
+    Trigram index finding the keys closest to a misspelt one.
+
+    Keys are lowercased and padded, so that their first and last letters
+    get trigrams of their own, and their trigrams are posted per key length.
+    A key within d edits of the query is at most d characters longer or
+    shorter and shares all but at most 3 * d of the query trigrams, so it
+    has to appear in one of the 3 * d + 1 rarest posting lists of the query
+    among the lengths in reach. Only the keys in those lists are counted
+    against the other lists, and the ones sharing enough trigrams are
+    checked by edit distance; a query so short that a close key may share
+    none of its trigrams reads every key of a length in reach instead.
+    The search starts with d = 0 and widens until k keys are found or the
+    largest distance is reached, so the answer is exact and a close typo
+    reads only a few short posting lists, not the whole index."""
+
+    def __init__(self):
+        # (length, trigram) -> the keys of that lowercased length having the trigram
+        self.postings = defaultdict(set)
+        self.lengths = defaultdict(set)
+        self.keys = set()
+
+    @staticmethod
+    def grams(key):
+        """
+        Split a key into the set of its padded, lowercased trigrams.
+
+        Args:
+            key (str): The key to be split.
+
+        Returns:
+            set: The distinct trigrams of the key."""
+
+        padded = f"  {key.lower()} "
+        return set(map("".join, zip(padded, padded[1:], padded[2:])))
+
+    def add(self, key):
+        if key in self.keys:
+            return
+        self.keys.add(key)
+        length = len(key.lower())
+        self.lengths[length].add(key)
+        for gram in self.grams(key):
+            self.postings[length, gram].add(key)
+
+    def update(self, keys):
+        # Gather the postings of the new keys, then extend every posting set once
+        grouped = defaultdict(list)
+        for key in keys:
+            if key in self.keys:
+                continue
+            self.keys.add(key)
+            length = len(key.lower())
+            self.lengths[length].add(key)
+            for gram in self.grams(key):
+                grouped[length, gram].append(key)
+        for posting, new_keys in grouped.items():
+            self.postings[posting].update(new_keys)
+
+    def discard(self, key):
+        if key not in self.keys:
+            return
+        self.keys.discard(key)
+        length = len(key.lower())
+        keys = self.lengths[length]
+        keys.discard(key)
+        if not keys:
+            del self.lengths[length]
+        for gram in self.grams(key):
+            keys = self.postings[length, gram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[length, gram]
+
+    def clear(self):
+        self.postings.clear()
+        self.lengths.clear()
+        self.keys.clear()
+
+    def nearest(self, key, k=3, max_distance=None):
+        """
+        Find the indexed keys closest to a key.
+
+        Args:
+            key (str): The possibly misspelt key.
+            k (int, optional): The number of keys to return. Defaults to 3.
+            max_distance (int, optional): The largest edit distance of a
+                returned key. Defaults to a quarter of the key length, but at least 2.
+
+        Returns:
+            list: Up to k (key, distance) pairs, closest first, then sharing the most trigrams."""
+
+        if max_distance is None:
+            max_distance = max(2, len(key) // 4)
+        query = key.lower()
+        grams = self.grams(key)
+        postings = self.postings
+        # Every key within limit edits is found, so the search widens only while fewer than k are
+        for limit in range(max_distance + 1):
+            reach = range(len(query) - limit, len(query) + limit + 1)
+            lengths = [length for length in reach if length in self.lengths]
+            posting_lists = sorted(
+                ([postings.get((length, gram), ()) for length in lengths] for gram in grams),
+                key=lambda lists: sum(map(len, lists)),
+            )
+            needed = len(grams) - 3 * limit
+            shared = Counter()
+            if needed <= 0:
+                # A close key may share none of the trigrams, so every key of a length in reach is a candidate
+                for length in lengths:
+                    shared.update(dict.fromkeys(self.lengths[length], 0))
+            for lists in posting_lists[:3 * limit + 1]:
+                for keys in lists:
+                    shared.update(keys)
+            # The commoner lists only add to the counts of the keys already found
+            candidates = set(shared)
+            for lists in posting_lists[3 * limit + 1:]:
+                for keys in lists:
+                    shared.update(candidates.intersection(keys))
+            found = []
+            for candidate, count in shared.items():
+                if count >= needed:
+                    distance = edit_distance(query, candidate.lower(), limit)
+                    if distance <= limit:
+                        found.append((distance, -count, candidate))
+            if len(found) >= k:
+                break
+        found.sort()
+        return [(candidate, distance) for distance, _, candidate in found[:k]]
+
+
+class PrefixIndex:
+    """
+    Sorted vocabulary completing prefixes by binary search, ignoring case.
+
+    The casefolded keys are kept in sorted buckets of a bounded size, so
+    adding or removing a key moves at most a bucket instead of the whole
+    vocabulary, and a completion is a bisection followed by a slice. Every
+    key has a reference count, since several owners may add the same key,
+    such as a tag used by many notes."""
+
+    bucket_size = 1000
+
+    def __init__(self):
+        self.counts = {}
+        # Casefolded key -> the sorted keys folding to it
+        self.folds = {}
+        self.buckets = []
+        self.maxes = []
+
+    def _bucket(self, folded):
+        return min(bisect_left(self.maxes, folded), len(self.buckets) - 1)
+
+    def add(self, key):
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        if count:
+            return
+        folded = key.casefold()
+        keys = self.folds.get(folded)
+        if keys is not None:
+            insort(keys, key)
+            return
+        self.folds[folded] = [key]
+        if not self.buckets:
+            self.buckets.append([folded])
+            self.maxes.append(folded)
+            return
+        i = self._bucket(folded)
+        bucket = self.buckets[i]
+        insort(bucket, folded)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.bucket_size:
+            half = self.bucket_size
+            self.buckets[i:i + 1] = [bucket[:half], bucket[half:]]
+            self.maxes[i:i + 1] = [bucket[half - 1], bucket[-1]]
+
+    def update(self, keys):
+        """
+        Add many keys at once, sorting them together with the indexed ones.
+
+        Resorting costs as much as the whole vocabulary, so keys fewer than
+        the indexed ones are inserted into their buckets one by one instead.
+
+        Args:
+            keys (iterable): The keys to be added.
+
+        Returns:
+            None"""
+
+        keys = list(keys)
+        if len(keys) < len(self.counts):
+            for key in keys:
+                self.add(key)
+            return
+        for key in keys:
+            self.counts[key] = self.counts.get(key, 0) + 1
+        self.folds.clear()
+        for key in sorted(self.counts):
+            self.folds.setdefault(key.casefold(), []).append(key)
+        folded = sorted(self.folds)
+        size = self.bucket_size
+        self.buckets = [folded[i:i + size] for i in range(0, len(folded), size)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+
+    def discard(self, key):
+        count = self.counts.get(key)
+        if count is None:
+            return
+        if count > 1:
+            self.counts[key] = count - 1
+            return
+        del self.counts[key]
+        folded = key.casefold()
+        keys = self.folds[folded]
+        keys.remove(key)
+        if keys:
+            return
+        del self.folds[folded]
+        i = self._bucket(folded)
+        bucket = self.buckets[i]
+        del bucket[bisect_left(bucket, folded)]
+        if bucket:
+            self.maxes[i] = bucket[-1]
+        else:
+            del self.buckets[i]
+            del self.maxes[i]
+
+    def clear(self):
+        self.counts.clear()
+        self.folds.clear()
+        self.buckets.clear()
+        self.maxes.clear()
+
+    def complete(self, prefix, limit=20):
+        """
+        Find the keys starting with a prefix, whatever their case.
+
+        Args:
+            prefix (str): The beginning of the keys.
+            limit (int, optional): The largest number of keys to return. Defaults to 20.
+
+        Returns:
+            list: Up to limit keys in alphabetical order."""
+
+        prefix = prefix.casefold()
+        i = bisect_left(self.maxes, prefix)
+        if i == len(self.buckets):
+            return []
+        start = bisect_left(self.buckets[i], prefix)
+        found = []
+        while i < len(self.buckets) and len(found) < limit:
+            for folded in self.buckets[i][start:start + limit - len(found)]:
+                if not folded.startswith(prefix):
+                    return found
+                # The keys folding to the same text may be more than the room left
+                found.extend(self.folds[folded][:limit - len(found)])
+                if len(found) == limit:
+                    return found
+            i += 1
+            start = 0
+        return found
+
+    def irange(self, start=None, stop=None, after=None):
+        """
+        Iterate over the keys in alphabetical order, whatever their case, from a seek position.
+
+        The first key is found by bisecting the bucket maxima and then one
+        bucket, so a range costs O(log n) plus the keys it gives. The index
+        must not change while the generator is consumed.
+
+        Args:
+            start (str, optional): The first key, or where it would be. Defaults to the first key.
+            stop (str, optional): Stop before the keys folding to it or after it. Defaults to the end.
+            after (str, optional): Start right after this key instead, to resume an earlier iteration.
+
+        Returns:
+            generator: The keys; the keys folding to the same text come in their own order."""
+
+        low = (after if after is not None else start or "").casefold()
+        high = stop.casefold() if stop is not None else None
+        i = bisect_left(self.maxes, low)
+        position = bisect_left(self.buckets[i], low) if i < len(self.buckets) else 0
+        while i < len(self.buckets):
+            for folded in self.buckets[i][position:]:
+                if high is not None and folded >= high:
+                    return
+                keys = self.folds.get(folded, ())
+                if after is not None and folded == low:
+                    keys = keys[bisect_right(keys, after):]
+                yield from keys
+            i += 1
+            position = 0
+
+
+# NumPy is optional and slow to import, so it is looked for on the first birthday query; None if it is missing
+numpy = False
+
+# Packed month << 5 | day codes are below this, and code 0 is no day
+CODES = 12 << 5 | 32
+FEBRUARY_29 = 2 << 5 | 29
+
+
+def _load_numpy():
+    global numpy
+    if numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+    return numpy
+
+
+class BirthdayArray:
+    """
+    Packed arrays of the birthdays of keys, answering windowed queries over the whole set at once.
+
+    Every key has a slot in two parallel arrays: its month and day packed as
+    month << 5 | day, and its birth year. Packed codes grow with the date,
+    so with NumPy a window is one or two ranges of codes, matched by
+    vectorized comparisons over the whole array. Without NumPy, the slots
+    are sorted into one array per code on the first query and kept there,
+    so a window reads only the slots of its days. Slots keep the order the
+    keys were first added in, and removed slots are reclaimed once they are
+    the majority.
+
+    Birthdays on the 29th of February are reported on the 28th of February
+    in non-leap years, so such contacts are never skipped."""
+
+    def __init__(self):
+        self.keys = []
+        self.slots = {}
+        self.codes = array("H")
+        self.years = array("H")
+        self.removed = 0
+        # The slots of every code, in order; only made when NumPy is missing
+        self.days = None
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, key, month, day, year):
+        """
+        Put the birthday of the key in the arrays, replacing its earlier one.
+
+        Args:
+            key (str): The key to be added.
+            month (int): The birthday month.
+            day (int): The birthday day.
+            year (int): The birth year.
+
+        Returns:
+            None"""
+
+        code = month << 5 | day
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self.slots[key] = len(self.keys)
+            self.keys.append(key)
+            self.codes.append(code)
+            self.years.append(year)
+            if self.days is not None:
+                self.days[code].append(slot)
+            return
+        if self.days is not None and self.codes[slot] != code:
+            self._unpost(slot)
+            insort(self.days[code], slot)
+        self.codes[slot] = code
+        self.years[slot] = year
+
+    def discard(self, key):
+        """
+        Remove the birthday of the key, if it is there.
+
+        Args:
+            key (str): The key to be removed.
+
+        Returns:
+            None"""
+
+        slot = self.slots.pop(key, None)
+        if slot is None:
+            return
+        if self.days is not None:
+            self._unpost(slot)
+        self.keys[slot] = None
+        self.codes[slot] = 0
+        self.removed += 1
+        if self.removed > len(self.slots):
+            self._compact()
+
+    def clear(self):
+        self.__init__()
+
+    def upcoming(self, start, num_of_days, ages=False):
+        """
+        Get the birthdays within a window of days.
+
+        Args:
+            start (datetime.date): The first day of the window.
+            num_of_days (int): The length of the window in days.
+            ages (bool, optional): Give (key, age) pairs with the age the key
+                turns on the date instead of the keys. Defaults to False.
+
+        Returns:
+            dict: A chronologically ordered mapping of dates to the keys
+            celebrating on them, without the dates that have no birthdays."""
+
+        found = {}
+        # No code comes twice within 365 days, so longer windows are queried a year at a time
+        for offset in range(0, max(num_of_days, 0), 365):
+            self._upcoming(start + timedelta(days=offset), min(num_of_days - offset, 365), ages, found)
+        return found
+
+    def _upcoming(self, start, num_of_days, ages, found):
+        dates = [start + timedelta(days=offset) for offset in range(num_of_days)]
+        day_codes = []
+        for day in dates:
+            if day.month == 2 and day.day == 28 and not isleap(day.year):
+                day_codes.append((day.month << 5 | day.day, FEBRUARY_29))
+            else:
+                day_codes.append((day.month << 5 | day.day,))
+        for day, slots in zip(dates, self._hits(day_codes)):
+            if not slots:
+                continue
+            keys = list(map(self.keys.__getitem__, slots))
+            if ages:
+                keys = [(key, day.year - year) for key, year in zip(keys, map(self.years.__getitem__, slots))]
+            found[day] = keys
+
+    def _hits(self, day_codes):
+        # The slots of every day of the window, in order
+        np = _load_numpy()
+        if np is None:
+            if self.days is None:
+                self.days = [array("I") for _ in range(CODES)]
+                for slot, code in enumerate(self.codes):
+                    self.days[code].append(slot)
+            return [
+                self.days[codes[0]] if len(codes) == 1 else sorted(chain.from_iterable(self.days[code] for code in codes))
+                for codes in day_codes
+            ]
+        if not self.keys:
+            return [()] * len(day_codes)
+        offsets = np.full(CODES, -1, dtype=np.int16)
+        for offset, codes in enumerate(day_codes):
+            offsets[list(codes)] = offset
+        # The window is one range of codes, or two if it wraps around the new year
+        low, high = day_codes[0][0], max(day_codes[-1])
+        codes = np.frombuffer(self.codes, dtype=np.uint16)
+        if low <= high:
+            slots = np.flatnonzero((codes >= low) & (codes <= high))
+        else:
+            slots = np.flatnonzero((codes >= low) | (codes <= high))
+        # Only the slots in the range are looked up; removed slots have code 0 and no offset
+        found = offsets[codes[slots]]
+        hit = found >= 0
+        slots, found = slots[hit], found[hit]
+        ends = np.cumsum(np.bincount(found, minlength=len(day_codes))).tolist()
+        slots = slots[np.argsort(found, kind="stable")].tolist()
+        return [slots[start:end] for start, end in zip([0] + ends, ends)]
+
+    def select(self, month=None, day=None):
+        """
+        Get the keys born in a month, on a day of any month, or on a date.
+
+        Args:
+            month (int, optional): The month, or None for every month.
+            day (int, optional): The day of the month, or None for every day.
+
+        Returns:
+            list: The keys in the order they were first added."""
+
+        months = [month] if month else range(1, 13)
+        days = [day] if day else range(1, 32)
+        # The codes in increasing order make one "day" of _hits
+        codes = tuple(month << 5 | day for month in months for day in days)
+        return list(map(self.keys.__getitem__, self._hits([codes])[0]))
+
+    def items(self):
+        """
+        Get the birthdays in the arrays.
+
+        Returns:
+            generator: (key, month, day, year) tuples in the order the keys were first added."""
+
+        for key, code, year in zip(self.keys, self.codes, self.years):
+            if key is not None:
+                yield key, code >> 5, code & 31, year
+
+    def _unpost(self, slot):
+        slots = self.days[self.codes[slot]]
+        del slots[bisect_left(slots, slot)]
+
+    def _compact(self):
+        live = [slot for slot in range(len(self.keys)) if self.keys[slot] is not None]
+        self.keys = [self.keys[slot] for slot in live]
+        self.codes = array("H", (self.codes[slot] for slot in live))
+        self.years = array("H", (self.years[slot] for slot in live))
+        self.slots = {key: slot for slot, key in enumerate(self.keys)}
+        self.removed = 0
+        self.days = None
+
+
+def isleap(year):
+    # calendar.isleap, without loading calendar and the locale support it imports at startup
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+def next_birthday(month, day, after):
+    """
+    Get the first birthday on or after a date.
+
+    Args:
+        month (int): The birthday month.
+        day (int): The birthday day.
+        after (datetime.date): The first day it may fall on.
+
+    Returns:
+        datetime.date: The birthday, on the 28th of February in non-leap years for the 29th."""
+
+    for year in (after.year, after.year + 1):
+        birthday = date(year, month, 28 if (month, day) == (2, 29) and not isleap(year) else day)
+        if birthday >= after:
+            return birthday
+
+
+class BirthdayHeap:
+    """
+    Min-heap of the next birthday of every key.
+
+    The earliest birthday is always at the top, so reminders only look at
+    the top of the heap, whatever the number of keys. A changed or removed
+    key leaves its old entry behind, which is skipped when it reaches the
+    top; the heap is rebuilt once such entries outnumber the live ones."""
+
+    def __init__(self):
+        # (ordinal of the birthday, sequence number, key) entries
+        self.heap = []
+        # key -> (sequence number of its live entry, month, day, year)
+        self.births = {}
+        self._counter = count()
+
+    def __len__(self):
+        return len(self.births)
+
+    def add(self, key, month, day, year, after):
+        """
+        Schedule the next birthday of the key, unless its birth date is unchanged.
+
+        Args:
+            key (str): The key.
+            month (int): The birthday month.
+            day (int): The birthday day.
+            year (int): The birth year.
+            after (datetime.date): The first day the birthday may fall on.
+
+        Returns:
+            datetime.date: The scheduled birthday, or None if it was already scheduled."""
+
+        birth = self.births.get(key)
+        if birth is not None and birth[1:] == (month, day, year):
+            return None
+        birthday = next_birthday(month, day, after)
+        self._push(key, birthday, month, day, year)
+        if birth is not None:
+            self._compact()
+        return birthday
+
+    def update(self, items, after):
+        """
+        Schedule many birthdays at once, for keys not in the heap yet.
+
+        Args:
+            items (iterable): (key, month, day, year) tuples.
+            after (datetime.date): The first day the birthdays may fall on.
+
+        Returns:
+            None"""
+
+        # There are only 366 birthdays a year, whatever the number of keys
+        ordinals = {}
+        for key, month, day, year in items:
+            ordinal = ordinals.get((month, day))
+            if ordinal is None:
+                ordinal = ordinals[month, day] = next_birthday(month, day, after).toordinal()
+            sequence = next(self._counter)
+            self.births[key] = (sequence, month, day, year)
+            self.heap.append((ordinal, sequence, key))
+        heapify(self.heap)
+
+    def discard(self, key):
+        """
+        Unschedule the key, if it is there.
+
+        Args:
+            key (str): The key to be removed.
+
+        Returns:
+            None"""
+
+        if self.births.pop(key, None) is not None:
+            self._compact()
+
+    def clear(self):
+        self.__init__()
+
+    def peek(self):
+        """
+        Get the earliest scheduled birthday.
+
+        Returns:
+            datetime.date: The birthday, or None if the heap is empty."""
+
+        heap = self.heap
+        while heap and not self._live(heap[0]):
+            heappop(heap)
+        return date.fromordinal(heap[0][0]) if heap else None
+
+    def pop_until(self, last):
+        """
+        Take the birthdays up to a date and schedule the following ones.
+
+        Args:
+            last (datetime.date): The last day to take.
+
+        Returns:
+            list: (date, key, age) tuples of the birthdays taken, in order."""
+
+        taken = []
+        while (first := self.peek()) is not None and first <= last:
+            key = heappop(self.heap)[2]
+            _, month, day, year = self.births[key]
+            taken.append((first, key, first.year - year))
+            self._push(key, next_birthday(month, day, first + timedelta(days=1)), month, day, year)
+        return taken
+
+    def _live(self, entry):
+        birth = self.births.get(entry[2])
+        return birth is not None and birth[0] == entry[1]
+
+    def _push(self, key, birthday, month, day, year):
+        sequence = next(self._counter)
+        self.births[key] = (sequence, month, day, year)
+        heappush(self.heap, (birthday.toordinal(), sequence, key))
+
+    def _compact(self):
+        if len(self.heap) > 2 * len(self.births) + 64:
+            self.heap = [entry for entry in self.heap if self._live(entry)]
+            heapify(self.heap)
+
+
+class TermIndex:
+    """
+    Inverted index mapping exact terms, such as phone numbers, to keys.
+
+    Each key may own several terms and each term may belong to several keys."""
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.terms = {}
+
+    def add(self, key, terms):
+        """
+        Index the terms of a key, replacing the terms indexed for it before.
+
+        Args:
+            key (str): The key owning the terms.
+            terms (iterable): The terms of the key.
+
+        Returns:
+            None"""
+
+        terms = frozenset(terms)
+        old_terms = self.terms.get(key, frozenset())
+        if old_terms == terms and key in self.terms:
+            return
+        for term in old_terms - terms:
+            self._unpost(term, key)
+        for term in terms - old_terms:
+            self.postings[term][key] = None
+        self.terms[key] = terms
+
+    def discard(self, key):
+        """
+        Remove all terms of the key, if any.
+
+        Args:
+            key (str): The key to be removed.
+
+        Returns:
+            None"""
+
+        for term in self.terms.pop(key, ()):
+            self._unpost(term, key)
+
+    def clear(self):
+        self.postings.clear()
+        self.terms.clear()
+
+    def lookup(self, term):
+        """
+        Get the keys owning a term.
+
+        Args:
+            term (str): The term to look for.
+
+        Returns:
+            list: The keys in the order they got the term."""
+
+        return list(self.postings.get(term, ()))
+
+    def _unpost(self, term, key):
+        keys = self.postings[term]
+        del keys[key]
+        if not keys:
+            del self.postings[term]
+
+
+class TextIndex:
+    """
+    Tokenized inverted index ranking documents with BM25.
+
+    Queries are words separated by spaces. All words have to match unless
+    the query is split into alternatives with OR, and a word ending with *
+    matches every indexed word starting with it."""
+
+    token_pattern = re.compile(r"\w+")
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.vocabulary = []
+        self.lengths = {}
+        self.terms = {}
+        self.total_length = 0
+
+    @classmethod
+    def tokenize(cls, text):
+        return cls.token_pattern.findall(text.lower())
+
+    def add(self, key, text):
+        """
+        Index a text, replacing the text indexed for the key before.
+
+        Args:
+            key: The key of the document.
+            text (str): The text to be indexed.
+
+        Returns:
+            None"""
+
+        self.discard(key)
+        tokens = self.tokenize(text)
+        frequencies = Counter(tokens)
+        for term, frequency in frequencies.items():
+            if term not in self.postings:
+                insort(self.vocabulary, term)
+            self.postings[term][key] = frequency
+        self.terms[key] = tuple(frequencies)
+        self.lengths[key] = len(tokens)
+        self.total_length += len(tokens)
+
+    def discard(self, key):
+        """
+        Remove the text indexed for the key, if any.
+
+        Args:
+            key: The key of the document.
+
+        Returns:
+            None"""
+
+        if key not in self.lengths:
+            return
+        self.total_length -= self.lengths.pop(key)
+        for term in self.terms.pop(key):
+            keys = self.postings[term]
+            del keys[key]
+            if not keys:
+                del self.postings[term]
+                del self.vocabulary[bisect_left(self.vocabulary, term)]
+
+    def clear(self):
+        self.postings.clear()
+        self.vocabulary.clear()
+        self.lengths.clear()
+        self.terms.clear()
+        self.total_length = 0
+
+    def expand(self, word):
+        """
+        Get the indexed terms a query word stands for.
+
+        Args:
+            word (str): A query word, possibly ending with * for prefix matching.
+
+        Returns:
+            list: The matching indexed terms."""
+
+        if not word.endswith("*"):
+            return [word] if word in self.postings else []
+        prefix = word[:-1]
+        start = bisect_left(self.vocabulary, prefix)
+        end = bisect_left(self.vocabulary, prefix + "\U0010ffff")
+        return self.vocabulary[start:end]
+
+    @classmethod
+    def parse(cls, query):
+        """
+        Split a query into alternatives of words that all have to match.
+
+        Args:
+            query (str): The query, with alternatives separated by OR.
+
+        Returns:
+            list: The non-empty lists of normalized words, one per alternative."""
+
+        groups = [[]]
+        for word in query.split():
+            if word == "OR":
+                groups.append([])
+            elif tokens := cls.tokenize(word):
+                # Punctuation inside a word splits it like the indexed text
+                if word.endswith("*"):
+                    tokens[-1] += "*"
+                groups[-1].extend(tokens)
+        return [words for words in groups if words]
+
+    def search(self, query):
+        """
+        Find and rank the documents matching a query.
+
+        Args:
+            query (str): The words to look for, optionally combined with OR.
+
+        Returns:
+            list: (key, score) pairs, best matches first."""
+
+        matched = set()
+        scored_terms = set()
+        for words in self.parse(query):
+            expansions = sorted((self.expand(word) for word in words), key=len)
+            candidates = None
+            for terms in expansions:
+                keys = set()
+                for term in terms:
+                    keys.update(self.postings[term])
+                candidates = keys if candidates is None else candidates & keys
+                if not candidates:
+                    break
+            if candidates:
+                matched |= candidates
+                for terms in expansions:
+                    scored_terms.update(terms)
+
+        if not matched:
+            return []
+        count_documents = len(self.lengths)
+        average_length = self.total_length / count_documents or 1
+        scores = dict.fromkeys(matched, 0.0)
+        for term in scored_terms:
+            keys = self.postings[term]
+            idf = log(1 + (count_documents - len(keys) + 0.5) / (len(keys) + 0.5))
+            for key in matched if len(matched) < len(keys) else keys:
+                frequency = keys.get(key)
+                if frequency and key in scores:
+                    norm = self.k1 * (1 - self.b + self.b * self.lengths[key] / average_length)
+                    scores[key] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])
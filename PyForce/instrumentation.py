@@ -0,0 +1,249 @@
+from bisect import bisect_left
+import threading
+from time import perf_counter
+from types import GeneratorType
+
+from dispatcher import ErrorMessage
+
+# Checked by input_error on every command; while it is False nothing is measured
+enabled = False
+
+# Imported by enable(memory=True), so that starting without stats does not load it
+tracemalloc = None
+
+# Upper bounds of the latency histogram buckets in seconds, from 10 us to 10 s; the last bucket is unbounded
+BUCKETS = tuple(mantissa * 10.0 ** exponent for exponent in range(-5, 1) for mantissa in (1, 2, 5)) + (10.0,)
+
+_stats = {}
+_lock = threading.Lock()
+
+
+class CommandStats:
+    """
+    Call count, latency histogram and allocations of one command.
+
+    Allocations are only known while tracemalloc traces them, so they are
+    averaged over the traced calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS) + 1)
+        self.traced = 0
+        self.allocated = 0
+        self.peak = 0
+
+    def record(self, elapsed, failed=False, allocated=None, peak=None):
+        self.calls += 1
+        self.errors += failed
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        self.histogram[bisect_left(BUCKETS, elapsed)] += 1
+        if allocated is not None:
+            self.traced += 1
+            self.allocated += allocated
+            self.peak = max(self.peak, peak)
+
+    def percentile(self, fraction):
+        """
+        Estimate a latency percentile from the histogram.
+
+        Args:
+            fraction (float): The fraction of the calls, such as 0.99.
+
+        Returns:
+            float: The upper bound of the bucket holding the percentile, or
+            the slowest call if it is past the last bound."""
+
+        rank = fraction * self.calls
+        seen = 0
+        for bound, count in zip(BUCKETS, self.histogram):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_seconds": self.total,
+            "mean_seconds": self.total / self.calls if self.calls else 0.0,
+            "p50_seconds": self.percentile(0.50),
+            "p99_seconds": self.percentile(0.99),
+            "max_seconds": self.max,
+            "histogram": {
+                f"<={bound:g}s" if i < len(BUCKETS) else f">{BUCKETS[-1]:g}s": count
+                for i, (bound, count) in enumerate(zip(BUCKETS + (None,), self.histogram))
+                if count
+            },
+            "mean_allocated_bytes": self.allocated / self.traced if self.traced else None,
+            "peak_allocated_bytes": self.peak if self.traced else None,
+        }
+
+
+def enable(memory=False):
+    """
+    Start measuring the commands.
+
+    Args:
+        memory (bool, optional): Also trace the memory allocated by the
+            commands with tracemalloc, which slows every allocation down. Defaults to False.
+
+    Returns:
+        None"""
+
+    global enabled, tracemalloc
+    if memory:
+        import tracemalloc
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+
+def measure(name, func, *args, **kwargs):
+    """
+    Run a command and record its latency and allocations under its name.
+
+    A command streaming its result as a generator does most of its work
+    while the lines are consumed, so that time is added when the generator
+    is exhausted or closed.
+
+    Args:
+        name (str): The name of the command.
+        func (function): The command handler.
+        *args: The arguments of the handler.
+        **kwargs: The keyword arguments of the handler.
+
+    Returns:
+        The result of the handler."""
+
+    tracing = tracemalloc is not None and tracemalloc.is_tracing()
+    if tracing:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+    started = perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = perf_counter() - started
+    allocated = peak = None
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        allocated, peak = current - before, peak - before
+    failed = isinstance(result, ErrorMessage)
+    if isinstance(result, GeneratorType):
+        return _measure_lines(name, result, elapsed, allocated, peak)
+    _record(name, elapsed, failed, allocated, peak)
+    return result
+
+
+def _measure_lines(name, lines, elapsed, allocated, peak):
+    try:
+        while True:
+            started = perf_counter()
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            finally:
+                elapsed += perf_counter() - started
+            yield line
+    finally:
+        _record(name, elapsed, False, allocated, peak)
+
+
+def _record(name, elapsed, failed, allocated, peak):
+    # Commands may run on several threads in server mode
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = CommandStats()
+        stats.record(elapsed, failed, allocated, peak)
+
+
+def snapshot():
+    """
+    Get the statistics of every measured command.
+
+    Returns:
+        dict: Command names mapped to dicts of their statistics."""
+
+    with _lock:
+        return {name: stats.as_dict() for name, stats in _stats.items()}
+
+
+def _format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-6:.0f} us"
+
+
+def _format_bytes(size):
+    if size is None:
+        return "-"
+    for unit, scale in (("MiB", 1 << 20), ("KiB", 1 << 10)):
+        if abs(size) >= scale:
+            return f"{size / scale:.1f} {unit}"
+    return f"{size:.0f} B"
+
+
+def report():
+    """
+    Describe the statistics as a table, the commands taking the most time first.
+
+    Returns:
+        generator: The lines of the table."""
+
+    rows = sorted(snapshot().items(), key=lambda item: item[1]["total_seconds"], reverse=True)
+    yield (
+        f"{'command':<16} {'calls':>7} {'errors':>6} {'mean':>10} {'p50':>10} {'p99':>10} {'max':>10}"
+        f" {'alloc':>10} {'peak':>10}"
+    )
+    for name, stats in rows:
+        yield (
+            f"{name:<16} {stats['calls']:>7} {stats['errors']:>6} {_format_seconds(stats['mean_seconds']):>10}"
+            f" {_format_seconds(stats['p50_seconds']):>10} {_format_seconds(stats['p99_seconds']):>10}"
+            f" {_format_seconds(stats['max_seconds']):>10} {_format_bytes(stats['mean_allocated_bytes']):>10}"
+            f" {_format_bytes(stats['peak_allocated_bytes']):>10}"
+        )
+
+
+def export(filename):
+    """
+    Write the statistics to a file, as CSV if its name ends with .csv and as JSON otherwise.
+
+    Args:
+        filename (str): The name of the file.
+
+    Returns:
+        None"""
+
+    import csv
+    import json
+
+    stats = snapshot()
+    if filename.lower().endswith(".csv"):
+        columns = [key for key in CommandStats().as_dict() if key != "histogram"]
+        with open(filename, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(["command", *columns])
+            for name, values in stats.items():
+                writer.writerow([name, *(values[column] for column in columns)])
+    else:
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump({"buckets_seconds": BUCKETS, "commands": stats}, file, indent=2)
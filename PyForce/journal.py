@@ -0,0 +1,351 @@
+from contextlib import contextmanager, redirect_stdout
+import gc
+import io
+import os
+import pickle
+
+from locking import writes
+
+
+class Journal:
+    """
+    Append-only write-ahead log kept next to a pickled snapshot.
+
+    The snapshot file holds the pickled data exactly as ``save_to_file`` writes
+    it, followed by the sequence number of the last entry it includes. Every
+    mutation is appended to ``<filename>.journal`` as a small pickled entry and
+    flushed to the operating system right away, while fsync is batched every
+    ``sync_every`` entries. A checkpoint rewrites the snapshot and empties the
+    log, which keeps the replay at startup bounded."""
+
+    def __init__(self, filename, sync_every=32, checkpoint_every=1000):
+        self.filename = filename
+        self.log_filename = filename + ".journal"
+        self.sync_every = sync_every
+        self.checkpoint_every = checkpoint_every
+        self.seq = 0
+        self.entries = 0
+        self.unsynced = 0
+        self.generation = 0
+        self._file = None
+
+    def load(self):
+        """
+        Read the snapshot and the log entries written after it.
+
+        A torn entry at the end of the log, left by a crash in the middle of
+        a write, is cut off.
+
+        Returns:
+            tuple: The snapshot data (None if there is no snapshot) and the list
+            of (target, operation, arguments) entries to be replayed."""
+
+        data, snapshot_seq = self.load_snapshot()
+        entries = []
+        self.seq = snapshot_seq
+        if os.path.exists(self.log_filename):
+            with open(self.log_filename, "r+b") as file:
+                size = os.fstat(file.fileno()).st_size
+                good_offset = 0
+                while good_offset < size:
+                    try:
+                        seq, target, operation, args = pickle.load(file)
+                    except (EOFError, pickle.UnpicklingError, ValueError):
+                        file.truncate(good_offset)
+                        break
+                    good_offset = file.tell()
+                    if seq > snapshot_seq:
+                        entries.append((target, operation, args))
+                        self.seq = seq
+        self.entries = len(entries)
+        return data, entries
+
+    def load_snapshot(self):
+        """
+        Read the snapshot file.
+
+        Returns:
+            tuple: The snapshot data (None if there is no snapshot) and the
+            sequence number of the last log entry it includes."""
+
+        if not os.path.exists(self.filename):
+            return None, 0
+        with open(self.filename, "rb") as file:
+            data = pickle.load(file)
+            try:
+                return data, pickle.load(file)
+            except EOFError:
+                return data, 0
+
+    def open(self):
+        self._file = open(self.log_filename, "ab")
+
+    def append(self, target, operation, *args):
+        """
+        Append a mutation to the log.
+
+        Args:
+            target: The object the operation applies to, None for the book itself.
+            operation (str): The name of the method that was called.
+            *args: The arguments of the call.
+
+        Returns:
+            bool: True if the log grew past the checkpoint threshold."""
+
+        self.seq += 1
+        pickle.dump((self.seq, target, operation, args), self._file)
+        self._file.flush()
+        self.entries += 1
+        self.unsynced += 1
+        if self.unsynced >= self.sync_every:
+            self.sync()
+        return self.entries >= self.checkpoint_every
+
+    def sync(self):
+        if self._file is not None and self.unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.unsynced = 0
+
+    def checkpoint(self, data):
+        """
+        Write a new snapshot of the data and empty the log.
+
+        The snapshot is written to a temporary file and atomically renamed,
+        and it records the sequence number it covers, so a crash at any point
+        leaves either the old snapshot with the full log or the new one.
+
+        Args:
+            data: The data to be pickled into the snapshot.
+
+        Returns:
+            None"""
+
+        payload, seq, offset, generation = self.begin_checkpoint(data)
+        temp_filename = self.write_snapshot(payload, seq, self.filename + ".tmp")
+        self.end_checkpoint(temp_filename, seq, offset, generation)
+
+    # A checkpoint in three steps, so that a background thread only has to stop
+    # the writers of the book while the data is copied and the files renamed
+
+    def begin_checkpoint(self, data):
+        """
+        Serialize the data for a snapshot; the data must not change meanwhile.
+
+        Args:
+            data: The data to be pickled into the snapshot.
+
+        Returns:
+            tuple: The pickled data, the sequence number it covers, the size
+            of the log at that point and the number of checkpoints so far."""
+
+        seq, offset, generation = self.position()
+        return self.serialize(data), seq, offset, generation
+
+    def position(self):
+        """
+        Tell how far the log goes, for a snapshot of the data as it is now.
+
+        Returns:
+            tuple: The sequence number of the last entry, the size of the log
+            and the number of checkpoints so far."""
+
+        offset = self._file.tell() if self._file is not None else 0
+        return self.seq, offset, self.generation
+
+    def serialize(self, data):
+        return pickle.dumps(data)
+
+    def write_snapshot(self, payload, seq, temp_filename):
+        with open(temp_filename, "wb") as file:
+            file.write(payload)
+            pickle.dump(seq, file)
+            file.flush()
+            os.fsync(file.fileno())
+        return temp_filename
+
+    def end_checkpoint(self, temp_filename, seq, offset, generation):
+        """
+        Put a written snapshot in place and drop the log entries it covers.
+
+        Entries appended after the snapshot was taken are kept: they are copied
+        to a new log which then atomically replaces the old one. A snapshot
+        overtaken by another checkpoint is thrown away.
+
+        Args:
+            temp_filename (str): The file the snapshot was written to.
+            seq (int): The sequence number covered by the snapshot.
+            offset (int): The size of the log when the snapshot was taken.
+            generation (int): The number of checkpoints when it was taken.
+
+        Returns:
+            bool: True if the snapshot was put in place."""
+
+        if generation != self.generation:
+            os.remove(temp_filename)
+            return False
+        os.replace(temp_filename, self.filename)
+        self.generation += 1
+        if self._file is None:
+            self.entries = 0
+        elif self._file.tell() == offset:
+            self._file.truncate(0)
+            self._file.seek(0)
+            self.entries = 0
+        else:
+            temp_filename = self.log_filename + ".tmp"
+            with open(self.log_filename, "rb") as log, open(temp_filename, "wb") as file:
+                log.seek(offset)
+                file.write(log.read())
+                file.flush()
+                os.fsync(file.fileno())
+            self._file.close()
+            os.replace(temp_filename, self.log_filename)
+            self._file = open(self.log_filename, "ab")
+            self.entries = self.seq - seq
+        self.unsynced = 0
+        return True
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+
+@contextmanager
+def paused_collection():
+    """
+    Pause the cyclic garbage collector inside the block.
+
+    A copy of a book made for a checkpoint adds as many objects as the book
+    has records; allocating them would set off a collection of the whole heap,
+    which takes longer than the copy itself. The copy is freed by reference
+    counting once serialized, so there is nothing for the collector to do."""
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class Journaled:
+    """
+    Mixin storing the mutations of a book in a Journal.
+
+    Subclasses call ``_log`` after every successful mutation and implement
+    ``_snapshot``, ``_restore`` and ``_apply``, and ``_snapshot_copy`` to be
+    checkpointed in the background."""
+
+    _journal = None
+    # The Journal class, subclasses may store their snapshot in another format
+    journal_class = Journal
+    # The Autosaver checkpointing the book in the background, if any
+    _autosaver = None
+
+    def open_journal(self, filename, **options):
+        """
+        Load the book from the snapshot and the log, then start journaling.
+
+        Args:
+            filename (str): The name of the snapshot file.
+            **options: The Journal options.
+
+        Returns:
+            bool: True if any saved data was found."""
+
+        journal = self.journal_class(filename, **options)
+        loaded = self._replay(journal)
+        journal.open()
+        self._journal = journal
+        return loaded
+
+    def load_journal(self, filename):
+        """
+        Load the book from the snapshot and the log without journaling further.
+
+        Args:
+            filename (str): The name of the snapshot file.
+
+        Returns:
+            bool: True if any saved data was found."""
+
+        return self._replay(self.journal_class(filename))
+
+    def _replay(self, journal):
+        data, entries = journal.load()
+        if data is not None:
+            self._restore(data)
+        with redirect_stdout(io.StringIO()):
+            for target, operation, args in entries:
+                self._apply(target, operation, args)
+        return data is not None or bool(entries)
+
+    @writes
+    def checkpoint(self):
+        if self._journal is not None:
+            self._journal.checkpoint(self._snapshot())
+
+    @contextmanager
+    def deferred_sync(self):
+        """
+        Skip the fsync of the log inside the block and checkpoint the book once at its end.
+
+        Entries are still written to the log right away and checkpoints still
+        happen every ``checkpoint_every`` entries, so a crash in the middle of
+        a long batch loses at most what the operating system had not written."""
+
+        journal = self._journal
+        if journal is None:
+            yield
+            return
+        sync_every, journal.sync_every = journal.sync_every, float("inf")
+        try:
+            yield
+        finally:
+            journal.sync_every = sync_every
+            self.checkpoint()
+
+    def background_checkpoint(self):
+        """
+        Checkpoint the book from another thread without stopping its readers.
+
+        Writers wait only while the records are copied and while the log is
+        swapped; the copy is serialized and written to disk without any lock.
+        Locking must be enabled on the book.
+
+        Returns:
+            None"""
+
+        journal = self._journal
+        if journal is None:
+            return
+        with paused_collection():
+            with self._lock.reading():
+                data = self._snapshot_copy()
+                seq, offset, generation = journal.position()
+            payload = journal.serialize(data)
+            del data
+        temp_filename = journal.write_snapshot(payload, seq, journal.filename + ".autosave.tmp")
+        with self._lock.writing():
+            if self._journal is journal:
+                journal.end_checkpoint(temp_filename, seq, offset, generation)
+            else:
+                os.remove(temp_filename)
+
+    def close_journal(self):
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _log(self, target, operation, *args):
+        if self._journal is None:
+            return
+        due = self._journal.append(target, operation, *args)
+        if self._autosaver is not None:
+            self._autosaver.changed(self)
+        elif due:
+            self.checkpoint()
@@ -0,0 +1,22 @@
+"""
+Entry point of the pyforce console script.
+
+The modules of PyForce import each other by their bare names, as when
+main.py is run from this directory, so the launcher puts the directory on
+the path and hands over to main.main. It imports nothing else: everything
+the chosen mode does not need, such as prompt_toolkit, sqlite3 or the
+server, is only imported by the code that uses it.
+"""
+import os
+import sys
+
+
+def launch():
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from main import main
+
+    return main()
+
+
+if __name__ == "__main__":
+    sys.exit(launch())
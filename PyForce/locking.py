@@ -0,0 +1,142 @@
+from contextlib import contextmanager
+from functools import wraps
+import threading
+
+
+class ReadWriteLock:
+    """
+    Lock letting any number of threads read at once, or one thread write.
+
+    Waiting writers are preferred, so a steady stream of readers cannot
+    starve them. The lock is reentrant: a reading thread may read again,
+    and the writing thread may read or write again. A reading thread may
+    not start writing, since two such threads would wait for each other."""
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._waiting_writers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        me = threading.get_ident()
+        depth = getattr(self._local, "reads", 0)
+        with self._condition:
+            if self._writer != me and not depth:
+                while self._writer is not None or self._waiting_writers:
+                    self._condition.wait()
+            self._readers += 1
+        self._local.reads = depth + 1
+
+    def release_read(self):
+        self._local.reads -= 1
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        me = threading.get_ident()
+        with self._condition:
+            if self._writer == me:
+                self._write_depth += 1
+                return
+            if getattr(self._local, "reads", 0):
+                raise RuntimeError("Cannot write while holding the read lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._condition:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
+
+
+def reads(method):
+    """
+    Run a method under the read lock of its object, if locking is enabled.
+
+    Args:
+        method (function): A method of an object with a ``_lock`` attribute.
+
+    Returns:
+        function: The wrapped method."""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock = getattr(self, "_lock", None)
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+
+    return wrapper
+
+
+def writes(method):
+    """
+    Run a method under the write lock of its object, if locking is enabled.
+
+    Args:
+        method (function): A method of an object with a ``_lock`` attribute.
+
+    Returns:
+        function: The wrapped method."""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        lock = getattr(self, "_lock", None)
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+
+    return wrapper
+
+
+class Lockable:
+    """
+    Mixin for books that may be shared between threads.
+
+    Locking is off by default and costs one attribute lookup per call.
+    After ``enable_locking`` the methods marked with ``reads`` run
+    concurrently with each other, and those marked with ``writes``, which
+    include every mutation of the book and of its records, run alone."""
+
+    _lock = None
+
+    def enable_locking(self):
+        if self._lock is None:
+            self._lock = ReadWriteLock()
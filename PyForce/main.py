@@ -1,11 +1,17 @@
+import argparse
+import os
+import sys
+
 import models
 from models import *
 from datetime import datetime
+from itertools import chain, islice
 from modelsfornotes import *
+from storage import open_storage
+from dispatcher import EXIT, ErrorMessage, command, command_name, get_handler, run_batch
+import instrumentation
 import threading
-
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-from autocomplete import session
+from collections.abc import Iterator
 
 
 LOGO_VADER = r"""
@@ -81,23 +87,52 @@ LOGO_R2D2 = r"""
 
 
 def input_error(func):
-    def wrapper(*args, **kwargs):
+    def error_message(ex):
+        if isinstance(ex, ContactNotFound):
+            if suggestions := ex.suggestions():
+                names = ", ".join(name for name, _ in suggestions)
+                return ErrorMessage(f"There is no such сontact young Padawan. Did you mean: {names}?")
+            return ErrorMessage("There is no such сontact young Padawan. <add-contact> first!")
+        if isinstance(ex, KeyError):
+            return ErrorMessage("There is no such сontact young Padawan. <add-contact> first!")
+        if isinstance(ex, ValueError):
+            return ErrorMessage(f"{str(ex)}. Make sure you provide data in the correct format. Enter <?> for the instructions")
+        if isinstance(ex, IndexError):
+            return ErrorMessage("Provide a name and a phone number please young Jedi.")
+        if isinstance(ex, TypeError):
+            return ErrorMessage("Please use correct number of arguments young Padawan")
+        return ErrorMessage(f"Unexpected exception young Jedi {ex}: in def {func.__name__}()")
+
+    def guarded_lines(lines):
+        # Long outputs fail while their lines are consumed, so the error becomes the last line
+        try:
+            yield from lines
+        except Exception as ex:
+            yield error_message(ex)
+
+    def guarded(*args, **kwargs):
         try:
-            return func(*args, **kwargs)
-        except KeyError:
-            return "There is no such сontact young Padawan. <add-contact> first!"
-        except ValueError as e:
-            return f"{str(e)}. Make sure you provide data in the correct format. Enter <?> for the instructions"
-        except IndexError:
-            return "Provide a name and a phone number please young Jedi."
-        except TypeError:
-            return "Please use correct number of arguments young Padawan"
+            result = func(*args, **kwargs)
         except Exception as ex:
-            print(f"Unexpected exception young Jedi {ex}: in def {func.__name__}()")
+            return error_message(ex)
+        return guarded_lines(result) if isinstance(result, Iterator) else result
+
+    def wrapper(*args, **kwargs):
+        if not instrumentation.enabled:
+            return guarded(*args, **kwargs)
+        # Handlers registered with book=None get no command line
+        name = command_name(args[0]) if args else func.__name__
+        return instrumentation.measure(name, guarded, *args, **kwargs)
 
     return wrapper
 
 
+@command("close", "exit", "end", "bye", book=None)
+def handle_exit():
+    return EXIT
+
+
+@command("hello", "hi", book=None)
 @input_error
 def handle_hello():
     return "Greetings! How can I help you young Jedi?"
@@ -127,7 +162,13 @@ FIELD_NAME_TO_USER_OUTPUT_MAP = {
 }
 
 
+# False in batch mode, where there is nobody to answer the questions of a command
+INTERACTIVE = True
+
+
 def continuous_field_input(field_class_name):
+    if not INTERACTIVE:
+        raise ValueError(f"{field_class_name} must be given on the command line in batch mode")
     field_class = getattr(models, field_class_name, None)
     while True:
         field_value = input(FIELD_NAME_TO_USER_OUTPUT_MAP.get(field_class_name)[0])
@@ -140,18 +181,25 @@ def continuous_field_input(field_class_name):
     return field_value
 
 
+@command("add-contact", writes=True)
 @input_error
 def handle_add(command, address_book):
-    _ = command.split()
-    name = continuous_field_input("Name")
-    phone = continuous_field_input("Phone")
-    address = continuous_field_input("Address")
-    birthday = continuous_field_input("Birthday")
-    email = continuous_field_input("Email")
+    _, *fields = command.split()
+    if fields:
+        # add-contact <name> <phone> [<address> [<birthday> [<email>]]], "-" skips a field
+        name, phone, address, birthday, email = (fields + [None] * 3)[:5]
+        address, birthday, email = (None if value == "-" else value for value in (address, birthday, email))
+    else:
+        name = continuous_field_input("Name")
+        phone = continuous_field_input("Phone")
+        address = continuous_field_input("Address")
+        birthday = continuous_field_input("Birthday")
+        email = continuous_field_input("Email")
     address_book.add_record(name, phone, address, birthday, email)
     return "Contact added. May the Force be with you!"
 
 
+@command("change-phone", writes=True)
 @input_error
 def handle_change(command, address_book):  # change of phone number
     _, name, old_phone, new_phone = command.split()
@@ -160,6 +208,7 @@ def handle_change(command, address_book):  # change of phone number
     return "Contact changed."
 
 
+@command("phone")
 @input_error
 def handle_phone(command, address_book):
     _, name = command.split()
@@ -167,6 +216,17 @@ def handle_phone(command, address_book):
     return f"Phone numbers for {name}: {','.join(str(s.value) for s in record.phones)}"
 
 
+@command("whois")
+@input_error
+def handle_whois(command, address_book):
+    _, phone = command.split()
+    records = address_book.find_by_phone(phone)
+    if not records:
+        return f"No contact owns the phone {phone} young Jedi."
+    return f"Phone {phone} belongs to: {', '.join(record.name.value for record in records)}"
+
+
+@command("delete", writes=True)
 @input_error
 def handle_delete(command, address_book):
     _, name = command.split()
@@ -174,15 +234,118 @@ def handle_delete(command, address_book):
     return f"Deleted {name}"
 
 
-@input_error
-def handle_all(address_book):
-    if address_book.data:
-        result = f"All records ({address_book.count_records()}):\n"
-        return result + "\n".join([f"{v}" for k, v in address_book.data.items()])
+def parse_paging(words):
+    """
+    Take the --page, --size and --limit options out of the words of a command.
+
+    Args:
+        words (list): The words of the command after its name.
+
+    Raises:
+        ValueError: If an option is not followed by a positive number.
+
+    Returns:
+        tuple: The other words, the first and the end position of the rows
+        to show (None for no end) and the page number (None without --page).
+        --size without --page shows the first page."""
+
+    options = {"--page": None, "--size": None, "--limit": None}
+    rest = []
+    words = iter(words)
+    for word in words:
+        if word not in options:
+            rest.append(word)
+            continue
+        value = next(words, "")
+        if not value.isdigit() or int(value) < 1:
+            raise ValueError(f"{word} needs a positive number")
+        options[word] = int(value)
+    page, size, limit = options["--page"], options["--size"], options["--limit"]
+    if page or size:
+        page_number, size = page or 1, size or 50
+        start, stop = (page_number - 1) * size, page_number * size
     else:
+        start, stop = 0, None
+    if limit is not None:
+        stop = start + limit if stop is None else min(stop, start + limit)
+    return rest, start, stop, page
+
+
+def parse_name_range(words):
+    """
+    Take the --from, --to and --after options out of the words of a command.
+
+    A name runs until the next option, so it may have spaces.
+
+    Args:
+        words (list): The words of the command after its name.
+
+    Raises:
+        ValueError: If an option is not followed by a name.
+
+    Returns:
+        tuple: The other words and a dict of the names given, under the keys
+        "first", "last" and "after" of AddressBook.iter_by_name."""
+
+    options = {"--from": "first", "--to": "last", "--after": "after"}
+    rest = []
+    names = {}
+    option = None
+    for word in words:
+        if word in options:
+            option = word
+            names[option] = []
+        elif option is not None and not word.startswith("--"):
+            names[option].append(word)
+        else:
+            option = None
+            rest.append(word)
+    for option, parts in names.items():
+        if not parts:
+            raise ValueError(f"{option} needs a name")
+    return rest, {options[option]: " ".join(parts) for option, parts in names.items()}
+
+
+def list_page(records, size, names):
+    # One record more than the page is read, to tell whether another page follows
+    last = None
+    for shown, record in enumerate(records):
+        if shown == size:
+            until = f" --to {names['last']}" if "last" in names else ""
+            yield f"Next page young Jedi: all --after {last}{until} --size {size}"
+            return
+        last = record.name.value
+        yield str(record)
+
+
+@command("all")
+@input_error
+def handle_all(command, address_book):
+    _, *words = command.split()
+    words, start, stop, page = parse_paging(words)
+    words, names = parse_name_range(words)
+    if words:
+        raise TypeError
+    count = address_book.count_records()
+    if not count:
         return "Data is empty, nothing to show"
+    title = f"All records ({count}):" if page is None else f"All records ({count}), page {page}:"
+    # Records come in name order off the sorted name index and are formatted one at a time while they are printed
+    records = islice(address_book.iter_by_name(**names), start, None if stop is None else stop + 1)
+    return chain([title], list_page(records, None if stop is None else stop - start, names))
+
+
+@command("export")
+@input_error
+def handle_export(command, address_book):
+    from importers import write_contacts
+
+    _, filename = command.split(maxsplit=1)
+    written = write_contacts(filename, address_book.iter_by_name())
+    return f"Exported {written} contact(s) to {filename} in name order."
 
 
+@command("add-phone", writes=True)
 @input_error
 def handle_add_phone(command, address_book):
     _, name, phone = command.split()
@@ -190,6 +353,7 @@ def handle_add_phone(command, address_book):
     return f"Phone added for {name}."
 
 
+@command("add-address", writes=True)
 @input_error
 def handle_add_address(command, address_book):
     _, name, address = command.split()
@@ -197,6 +361,7 @@ def handle_add_address(command, address_book):
     return f"Address added for {name}."
 
 
+@command("change-birthday", writes=True)
 @input_error
 def handle_add_birthday(command, address_book):
     _, name, birthday = command.split()
@@ -204,6 +369,7 @@ def handle_add_birthday(command, address_book):
     return f"Birthday added for {name}."
 
 
+@command("add-email", writes=True)
 @input_error
 def handle_add_email(command, address_book):
     _, name, email = command.split()
@@ -211,16 +377,92 @@ def handle_add_email(command, address_book):
     return f"Email added for {name}."
 
 
+@command("findall")
 @input_error
 def handle_find_by_criteria(command, address_book):
-    _, criteria = command.split()
+    _, *words = command.split()
+    words, start, stop, _ = parse_paging(words)
+    (criteria,) = words
     if len(criteria) < 3:
         return "Please enter min. 3 symbols for search criteria"
-    records = address_book.find_by_criteria(criteria)
-    result = f"Found {len(records)} record(s) for criteria - {criteria} :\n"
-    return "\n".join(records)
+    records = islice(address_book.iter_matches(criteria), start, stop)
+    return (address_book._describe_match(record) for record in records)
 
 
+@command("query")
+@input_error
+def handle_query(command, address_book):
+    _, *words = command.split()
+    words, start, stop, _ = parse_paging(words)
+    explain = "--explain" in words
+    text = " ".join(word for word in words if word != "--explain")
+    if explain:
+        return address_book.explain(text)
+    records = address_book.query(text)
+    if not records:
+        return "No contact matches the query young Jedi. These aren't the droids you're looking for."
+    return (address_book._describe_match(record) for record in islice(records, start, stop))
+
+
+@command("fuzzy")
+@input_error
+def handle_fuzzy(command, address_book):
+    _, name = command.split()
+    suggestions = address_book.suggest_names(name, 5)
+    if not suggestions:
+        return f"No name close to {name} young Jedi. These aren't the droids you're looking for."
+    return "\n".join(f"{found} ({distance} edit(s) away)" for found, distance in suggestions)
+
+
+@command("stats")
+@input_error
+def handle_stats(command, address_book):
+    _, *words = command.split(maxsplit=2)
+    action = words[0] if words else "show"
+    if action == "show":
+        if not instrumentation.enabled and not instrumentation.snapshot():
+            return "Stats are off young Padawan. Turn them on with 'stats on' or 'stats on memory'."
+        return instrumentation.report()
+    if action == "on":
+        instrumentation.enable(memory=words[1:] == ["memory"])
+        return "Stats are on. The Force is watching every command."
+    if action == "off":
+        instrumentation.disable()
+        return "Stats are off."
+    if action == "reset":
+        instrumentation.reset()
+        return "Stats reset."
+    if action == "export":
+        (filename,) = words[1:]
+        instrumentation.export(filename)
+        return f"Stats exported to {filename}."
+    raise ValueError(f"Unknown stats action {action}")
+
+
+@command("import", writes=True)
+@input_error
+def handle_import(command, address_book):
+    import csv
+    from importers import read_contacts
+
+    _, filename = command.split(maxsplit=1)
+    if not os.path.isfile(filename):
+        return f"File {filename} not found young Padawan."
+    rows = read_contacts(filename)
+    report_filename = f"{filename}.rejected.csv"
+    with open(report_filename, "w", newline="", encoding="utf-8") as report:
+        writer = csv.writer(report)
+        writer.writerow(["line", "name", "reason"])
+        imported, rejected = address_book.bulk_import(
+            rows, on_reject=lambda row, reason: writer.writerow([row.get("line"), row.get("name"), reason])
+        )
+    if not rejected:
+        os.remove(report_filename)
+        return f"Imported {imported} contact(s). May the Force be with you!"
+    return f"Imported {imported} contact(s), rejected {rejected} row(s). See {report_filename} for the reasons."
+
+
+@command("show-birthday")
 @input_error
 def handle_show_birthday(command, address_book):
     _, name = command.split()
@@ -231,37 +473,87 @@ def handle_show_birthday(command, address_book):
         return f"No birthday found for {name}."
 
 
+@command("birthdays")
+@input_error
+def handle_birthdays(command, address_book):
+    parts = command.split()
+    if len(parts) == 1:
+        num_of_days = 7  # Default value
+    elif len(parts) == 2 and parts[1].isdigit():
+        num_of_days = int(parts[1])
+    else:
+        return "Invalid command format. Please use 'birthdays' or 'birthdays <number>'."
+    if address_book.count_records() > 0:
+        handle_all_birthdays(address_book, num_of_days)
+    else:
+        return "No contacts young Jedi. Please add contacts"
+
+
+@command("birthdays-month")
+@input_error
+def handle_birthdays_month(command, address_book):
+    parts = command.split()
+    if len(parts) == 1:
+        month = None  # The current month
+    elif len(parts) == 2 and parts[1].isdigit() and 1 <= int(parts[1]) <= 12:
+        month = int(parts[1])
+    else:
+        return "Invalid command format. Please use 'birthdays-month' or 'birthdays-month <1-12>'."
+    birthdays = address_book.birthdays_in_month(month)
+    if not birthdays:
+        return "No birthdays this month young Jedi."
+    # A day of a big book may have thousands of birthdays, so the lines are made while they are printed
+    return (
+        f"{day.strftime('%d.%m')}: {', '.join(f'{name} (turns {age})' for name, age in people)}"
+        for day, people in birthdays.items()
+    )
+
+
+@command("?", "help", "how", book=None)
 def print_supported_commands():
     print(
         f"{LOGO_C3PO}\n"
         "'add-contact then <enter>. Successively type in <name><phone><birthday><address><email>'\n"
+        "'add-contact <name> <phone> [<address> <birthday> <email>]' to add a contact in one line, '-' skips a field\n"
         "'add-phone <name> <phone>'to add a phone to the existing contact\n"
         "'add-email <name> <email>' to add an e-mail to the existing contact\n"
         "'add-email <name> <phone> <email>' to add an e-mail to the existing contact\n"  # change e-mail
         "'add-address <name> <actual-adвress-in-one-string>' to add an address the existing contact\n"
         "'add-note <name> <phone> <note>' to add note you must\n"
         "'change-phone <name> <old phone> <new phone>' to change phone\n"
-        "'findall <criteria> search of contacts by criteria from 3 symbols\n"
+        "'findall <criteria> [--limit <n>] [--page <n> --size <n>]' search of contacts by criteria from 3 symbols\n"
+        "'query <query> [--explain] [--limit <n>] [--page <n> --size <n>]' search of contacts by fields, such as\n"
+        "  'query email:gmail.com birthday.month:3'; see the README for the fields, AND, OR, NOT and parentheses\n"
+        "'fuzzy <name>' to find the contact names closest to a misspelt one\n"
+        "'import <file.csv|file.vcf>' to import contacts from a CSV or vCard file\n"
+        "'stats [on [memory]|off|reset|export <file.json|file.csv>]' to see how long every command takes\n"
         "'phone <name>' to see a phone and a name input\n"
+        "'whois <phone>' to see which contact owns the phone\n"
         "'show-birthday <name>' to see birthday date for the contact\n"
         "'change-birthday <name> <DD.MM.YYYY>'\n"  #  re-write
         "'birthdays' to see upcoming birthdays for the next 7 days\n"
         "'birthdays <number of days>'-> if you want to specify for how many days forward you want a list of birthdays\n"
-        "'all' to see all the addressbook\n"
+        "'birthdays-month [<1-12>]' to see the birthdays of this or another month and the age each contact turns\n"
+        "'all' to see all the addressbook in name order, 'all --page <n> --size <n>' page by page, 'all --limit <n>' the first ones\n"
+        "'all --from <name> --to <name>' the names in a range, 'all --after <name> --size <n>' the page after a name\n"
+        "'export <file.csv|file.vcf>' to write the contacts in name order to a CSV or vCard file\n"
         "'delete' <name>  to delete the contact\n"
         "'notes-help' if you want to see intstructions on how to add notes\n"
         "'close' to end the assistant"
     )
 
 
+@command("note-help", "notes-help", "notehelp", "noteshelp", book=None)
 def print_notes_help_commands():
     print(
         f"{LOGO_R2D2}\n"
         " If you want to add notes follow the instructions below: \n"
         "'<noteadd : title : note >' - to add a note\n"
+        "'<noteadd : title : note : tag, tag>' - to add a note with tags in one line\n"
         "'type in <tag, tag, tag>' if you want tags\n"
         "'<notesall>' - to print all notes\n"
         "'<notesfind : title>' - search a note by title\n"
+        "'<notessearch words>' - search notes by words, best matches first; use OR for alternatives and word* for prefixes\n"
         "'<notesedit : title>' - search by title and re-write\n"
         "'<findbytag : title>' - find a note by tag\n"
         "'<addtag:title :<tag>>' add tag to a note by title\n"
@@ -269,15 +561,23 @@ def print_notes_help_commands():
     )
 
 
+@command("noteadd", book="notes", writes=True)
 @input_error
 def handle_notes_add(command, note_book):
-    _, title, text = command.split(":")
+    _, title, text, *tags = command.split(":")
     title = title.strip()
     text = text.strip()
+    if len(tags) > 1:
+        raise TypeError
     note_book.addnote(title, text)
-    tags_to_add = input(
-        'Note was added.\nDo you want to add tags?\nIf yes, write separate by ",", if not, put "n": '
-    )
+    if tags:
+        tags_to_add = tags[0]
+    elif INTERACTIVE:
+        tags_to_add = input(
+            'Note was added.\nDo you want to add tags?\nIf yes, write separate by ",", if not, put "n": '
+        )
+    else:
+        tags_to_add = "n"
     if tags_to_add != "n":
         tags = tags_to_add.split(",")
         for newtag in tags:
@@ -288,18 +588,27 @@ def handle_notes_add(command, note_book):
                 print(f"Note with title'{title}' was not found")
 
 
+@command("notesall", book="notes")
+@input_error
+def handle_notes_all(command, note_book):
+    note_book.all()
+
+
+@command("notesedit", book="notes", writes=True)
 @input_error
 def handle_notes_edit(command, note_book):
     _, title, new_text = command.split(":")
     note_book.editbytitle(title, new_text)
 
 
+@command("notesremove", book="notes", writes=True)
 @input_error
 def handle_notes_remove(command, note_book):
     _, title = command.split(":")
     note_book.removenote(title)
 
 
+@command("notesfind", book="notes")
 @input_error
 def handle_notes_find(command, note_book):
     _, title = command.split(":")
@@ -312,6 +621,21 @@ def handle_notes_find(command, note_book):
         print("No such note")
 
 
+@command("notessearch", book="notes")
+@input_error
+def handle_notes_search(command, note_book):
+    query = command[len("notessearch"):].strip(" :")
+    found = note_book.searchbytext(query)
+    if not found:
+        print("No notes match these words")
+    else:
+        for note in found:
+            print(
+                f"title: {note['title']} | Note: {note['note']} | Tags: {', '.join(note['tags'])}"
+            )
+
+
+@command("findbytag", book="notes")
 @input_error
 def handle_findbytag(command, note_book):
     _, tag = command.split(":")
@@ -325,6 +649,7 @@ def handle_findbytag(command, note_book):
             )
 
 
+@command("addtag", book="notes", writes=True)
 @input_error
 def handle_addtag(command, note_book):
     _, title, tag = command.split(":")
@@ -335,112 +660,193 @@ def handle_addtag(command, note_book):
     )
 
 
-def main():
-    try:
-        with open("contacts", "rb"):
-            pass
-        file_exists = True
-    except FileNotFoundError:
-        file_exists = False
+def read_commands(address_book, note_book, background_output=False):
+    """
+    Read the commands typed by the user.
 
-    try:
-        with open("notes", "rb"):
-            pass
-        file_notes_exists = True
-    except FileNotFoundError:
-        file_notes_exists = False
-
-    address_book = AddressBook()
-    note_book = NotesBook([])
-
-    if file_exists:
-        address_book.load_from_file("contacts")
-        print("AddressBook data loaded from file.")
-    else:
-        print("No data found in AddressBook file. Creating a new one.")
+    prompt_toolkit, with its completion and suggestions, is only loaded when
+    both stdin and stdout are a terminal; piped input is read with input().
 
-    if file_notes_exists:
-        note_book.load_from_file("notes")
-        print("NotesBook data loaded from file.")
-    else:
-        print("No data found in NotesBook file. Creating a new one.")
+    Args:
+        address_book (AddressBook): The book completing contact names.
+        note_book (NotesBook): The book completing note titles and tags.
+        background_output (bool, optional): Whether another thread prints while
+            the prompt is shown, so that its lines go above the prompt. Defaults to False.
 
-    while True:
-        command = session.prompt(
-            "Enter a command: ",
-            auto_suggest=AutoSuggestFromHistory(),
-            complete_while_typing=True,
-        )
-        if command in ["close", "exit", "end", "bye"]:
-            address_book.save_to_file("contacts")
+    Returns:
+        generator: The commands, until the input ends."""
+
+    if not (sys.stdin.isatty() and sys.stdout.isatty()):
+        while True:
+            try:
+                yield input("Enter a command: ")
+            except EOFError:
+                return
+
+    from contextlib import nullcontext
+    from prompt_toolkit.patch_stdout import patch_stdout
+
+    from autocomplete import create_session
+
+    session = create_session(address_book, note_book)
+    with patch_stdout() if background_output else nullcontext():
+        while True:
+            try:
+                yield session.prompt("Enter a command: ")
+            except EOFError:
+                return
+
+
+def run_interactive(address_book, note_book, background_output=False):
+    for command in read_commands(address_book, note_book, background_output):
+        handler = get_handler(command)
+        if handler is None:
+            print("Invalid command young Jedi. Try again!")
+            print_supported_commands()
+            continue
+        result = handler(command, address_book, note_book)
+        if result is EXIT:
             print(f"{LOGO_VADER}\nGood bye! May the Force be with you!")
-            note_book.save_to_file("notes")
 
             break
-        elif command in ["hello", "hi"]:
-            print(handle_hello())
-
-        elif command.startswith("change-phone"):
-            print(handle_change(command, address_book))
-        elif command.startswith("phone"):
-            print(handle_phone(command, address_book))
-        elif command == "all":
-            print(handle_all(address_book))
-        elif command.startswith("delete"):
-            print(handle_delete(command, address_book))
-        elif command.startswith("change-birthday"):
-            print(handle_add_birthday(command, address_book))
-        elif command.startswith("show-birthday"):
-            print(handle_show_birthday(command, address_book))
-        elif command.startswith("add-contact"):
-            print(handle_add(command, address_book))
-        elif command.startswith("birthdays"):
-            parts = command.split()
-            if len(parts) == 1:
-                num_of_days = 7  # Default value
-            elif len(parts) == 2 and parts[1].isdigit():
-                num_of_days = int(parts[1])
-            else:
-                print(
-                    "Invalid command format. Please use 'birthdays' or 'birthdays <number>'."
-                )
-                continue
-            if address_book.count_records() > 0:
-                handle_all_birthdays(address_book, num_of_days)
-            else:
-                print("No contacts young Jedi. Please add contacts")
-        elif command in ["?", "help", "how"]:
-            print_supported_commands()
-        elif command in ["note-help", "notes-help", "notehelp", "noteshelp"]:
-            print_notes_help_commands()
-        elif command.startswith("add-address"):
-            print(handle_add_address(command, address_book))
-        elif command.startswith("add-email"):
-            print(handle_add_email(command, address_book))
-        elif command.startswith("add-phone"):
-            print(handle_add_phone(command, address_book))
-        elif command.startswith("findall"):
-            print(handle_find_by_criteria(command, address_book))
-        elif command == "birthdays":
-            handle_all_birthdays(address_book)
-        elif command.startswith("noteadd"):
-            handle_notes_add(command, note_book)
-        elif command.startswith("notesall"):
-            note_book.all()
-        elif command.startswith("notesedit"):
-            handle_notes_edit(command, note_book)
-        elif command.startswith("notesremove"):
-            handle_notes_remove(command, note_book)
-        elif command.startswith("notesfind"):
-            handle_notes_find(command, note_book)
-        elif command.startswith("findbytag"):
-            handle_findbytag(command, note_book)
-        elif command.startswith("addtag"):
-            handle_addtag(command, note_book)
+        if isinstance(result, str):
+            print(result)
+        elif result is not None:
+            # Long outputs come as generators of lines, printed as they are made
+            for line in result:
+                print(line)
+
+
+def run_batch_file(filename, storage, address_book, note_book):
+    """
+    Run the commands of a file, or of stdin for "-", and save the books once at the end.
+
+    Args:
+        filename (str): The name of the file with one command per line.
+        storage: The storage the books were opened from.
+        address_book (AddressBook): The address book.
+        note_book (NotesBook): The notes book.
+
+    Returns:
+        int: The exit status, 1 if any command failed."""
+
+    global INTERACTIVE
+    INTERACTIVE = False
+    file = sys.stdin if filename == "-" else open(filename, encoding="utf-8")
+    try:
+        with storage.batch(address_book, note_book):
+            executed, failed = run_batch(file, address_book, note_book, sys.stdout)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+        storage.close(address_book, note_book)
+    print(f"{executed} command(s) run, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def start_reminders(args, address_book):
+    """
+    Start reminding of birthdays, if asked to on the command line.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        address_book (AddressBook): The book whose birthdays are reminded.
+
+    Returns:
+        Reminders: The running reminders, or None if none were asked for."""
+
+    if not (args.remind or args.remind_log or args.remind_hook):
+        return None
+    from reminders import Reminders, log_reminders, print_reminder, run_hook
+
+    notifiers = [print_reminder]
+    if args.remind_log:
+        notifiers.append(log_reminders(args.remind_log))
+    if args.remind_hook:
+        notifiers.append(run_hook(args.remind_hook))
+    reminders = Reminders(address_book, notifiers, args.remind_days)
+    reminders.start()
+    return reminders
+
+
+def run_server(args, address_book, note_book):
+    import asyncio
+    from server import Server
+
+    global INTERACTIVE
+    INTERACTIVE = False
+    server = Server(address_book, note_book, workers=args.workers)
+    asyncio.run(server.serve(path=args.socket, host=args.host, port=args.port))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pyforce", description="Personal assistant for contacts and notes")
+    parser.add_argument("mode", nargs="?", choices=["serve"], help="'serve' to share the books with local clients")
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="run the commands of FILE ('-' for stdin) without prompting and print one JSON result per line",
+    )
+    parser.add_argument("--socket", metavar="PATH", help="serve on a Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1", help="the TCP host to serve on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8765, help="the TCP port to serve on (default: 8765)")
+    parser.add_argument(
+        "--autosave-interval", type=float, default=60.0, help="seconds between background saves (default: 60)"
+    )
+    parser.add_argument(
+        "--autosave-changes", type=int, default=1000, help="changes that trigger a background save (default: 1000)"
+    )
+    parser.add_argument("--workers", type=int, default=8, help="threads running the commands of clients (default: 8)")
+    parser.add_argument("--stats", action="store_true", help="measure the latency of every command for 'stats'")
+    parser.add_argument(
+        "--stats-memory", action="store_true", help="also trace the memory allocated by every command (slower)"
+    )
+    parser.add_argument("--remind", action="store_true", help="remind of birthdays while the assistant runs")
+    parser.add_argument(
+        "--remind-days", type=int, default=0, metavar="N", help="remind N days before the birthday (default: 0)"
+    )
+    parser.add_argument("--remind-log", metavar="FILE", help="also append the reminders to FILE (implies --remind)")
+    parser.add_argument(
+        "--remind-hook",
+        metavar="COMMAND",
+        help="also run COMMAND for every reminder, with PYFORCE_NAME, PYFORCE_BIRTHDAY and PYFORCE_AGE set"
+        " (implies --remind)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.stats or args.stats_memory:
+        instrumentation.enable(memory=args.stats_memory)
+
+    storage = open_storage()
+    address_book, file_exists = storage.open_address_book()
+    note_book, file_notes_exists = storage.open_notes_book()
+
+    if args.batch:
+        return run_batch_file(args.batch, storage, address_book, note_book)
+    storage.autosave(address_book, note_book, args.autosave_interval, args.autosave_changes)
+    reminders = start_reminders(args, address_book)
+    try:
+        if args.mode == "serve":
+            return run_server(args, address_book, note_book)
+
+        if file_exists:
+            print("AddressBook data loaded from file.")
         else:
-            print("Invalid command young Jedi. Try again!")
-            print_supported_commands()
+            print("No data found in AddressBook file. Creating a new one.")
+
+        if file_notes_exists:
+            print("NotesBook data loaded from file.")
+        else:
+            print("No data found in NotesBook file. Creating a new one.")
+
+        run_interactive(address_book, note_book, background_output=reminders is not None)
+    finally:
+        # The reminders may still be reading the book, which closing unmaps
+        if reminders is not None:
+            reminders.stop()
+        storage.close(address_book, note_book)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
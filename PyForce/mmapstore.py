@@ -0,0 +1,467 @@
+from collections.abc import MutableMapping
+import mmap
+import os
+import pickle
+import struct
+import threading
+
+from indexes import BirthdayArray, FuzzyIndex, NgramIndex, PrefixIndex, TermIndex
+from journal import Journal
+from locking import reads, writes
+from models import AddressBook, Record
+
+# File layout: the header, the records as length-prefixed pickled Record states
+# in insertion order, the UTF-8 names, then one fixed-size index entry per
+# record sorted by name, so that a name is found by binary search on the mapping
+MAGIC = b"PYFMAP01"
+HEADER = struct.Struct("<8sQQQQ")  # magic, journal seq, count, names offset, index offset
+ENTRY = struct.Struct("<QIQ")  # name offset, name length, record offset
+LENGTH = struct.Struct("<I")
+
+
+class ContactMap:
+    """
+    Read-only, memory-mapped contact map file.
+
+    Opening the file only reads its header, whatever the number of records;
+    records are unpickled when they are looked up or streamed.
+
+    Args:
+        filename (str): The name of the map file."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as file:
+            self.mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.seq, self.count, self.names_offset, self.index_offset = HEADER.unpack_from(self.mapping)
+        if magic != MAGIC:
+            self.mapping.close()
+            raise ValueError(f"{filename} is not a contact map file")
+
+    def __len__(self):
+        return self.count
+
+    def _name(self, position):
+        name_offset, name_length, _ = ENTRY.unpack_from(self.mapping, self.index_offset + position * ENTRY.size)
+        return self.mapping[name_offset:name_offset + name_length]
+
+    def _find(self, name):
+        key = name.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._name(low) == key:
+            return ENTRY.unpack_from(self.mapping, self.index_offset + low * ENTRY.size)[2]
+        return None
+
+    def _state(self, offset):
+        (length,) = LENGTH.unpack_from(self.mapping, offset)
+        start = offset + LENGTH.size
+        return pickle.loads(self.mapping[start:start + length])
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def get(self, name):
+        """
+        Look a record up by name.
+
+        Args:
+            name (str): The name of the contact.
+
+        Returns:
+            tuple: The Record state, or None if there is no such contact."""
+
+        offset = self._find(name)
+        return None if offset is None else self._state(offset)
+
+    def names(self):
+        """
+        Stream the names of the contacts in sorted order, without reading the records.
+
+        Returns:
+            generator: The names."""
+
+        for position in range(self.count):
+            yield self._name(position).decode("utf-8")
+
+    def states(self):
+        """
+        Stream the Record states in insertion order.
+
+        Returns:
+            generator: The states, read one by one off the mapping."""
+
+        offset = HEADER.size
+        while offset < self.names_offset:
+            (length,) = LENGTH.unpack_from(self.mapping, offset)
+            start = offset + LENGTH.size
+            yield pickle.loads(self.mapping[start:start + length])
+            offset = start + length
+
+    def close(self):
+        self.mapping.close()
+
+    @staticmethod
+    def write(filename, states, seq):
+        """
+        Write a contact map file.
+
+        Args:
+            filename (str): The name of the file.
+            states (iterable): The Record states, in insertion order.
+            seq (int): The sequence number of the last journal entry included.
+
+        Returns:
+            None"""
+
+        with open(filename, "wb") as file:
+            file.write(bytes(HEADER.size))
+            entries = []
+            for state in states:
+                blob = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+                entries.append((state[0].encode("utf-8"), file.tell()))
+                file.write(LENGTH.pack(len(blob)))
+                file.write(blob)
+            names_offset = file.tell()
+            entries.sort()
+            index = bytearray()
+            for name, record_offset in entries:
+                index += ENTRY.pack(file.tell(), len(name), record_offset)
+                file.write(name)
+            index_offset = file.tell()
+            file.write(index)
+            file.seek(0)
+            file.write(HEADER.pack(MAGIC, seq, len(entries), names_offset, index_offset))
+
+
+class MappedJournal(Journal):
+    """Journal whose snapshot is a contact map file instead of a pickle."""
+
+    def load_snapshot(self):
+        if not os.path.exists(self.filename):
+            return None, 0
+        contact_map = ContactMap(self.filename)
+        return contact_map, contact_map.seq
+
+    def serialize(self, data):
+        # The map is streamed to its file here instead of being pickled in memory
+        payload = self.filename + ".map.tmp"
+        ContactMap.write(payload, data.states(), self.seq)
+        return payload
+
+    def write_snapshot(self, payload, seq, temp_filename):
+        with open(payload, "rb+") as file:
+            os.fsync(file.fileno())
+        os.replace(payload, temp_filename)
+        return temp_filename
+
+
+class MappedContacts(MutableMapping):
+    """
+    Dict-like view of a contact map with the changes made since it was written.
+
+    Changed and added records are kept in memory, deleted names are
+    remembered, and everything else is read off the mapping on access.
+    Recently read records are cached, so that a record looked up twice in a
+    row is the same object."""
+
+    cache_size = 4096
+
+    def __init__(self, book, contact_map=None):
+        self.book = book
+        self.map = contact_map
+        self.changed = {}
+        self.deleted = set()
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+
+    def _hydrate(self, state):
+        record = Record.__new__(Record)
+        record.__setstate__(state)
+        record._book = self.book
+        return record
+
+    def _in_map(self, name):
+        return self.map is not None and name not in self.deleted and name in self.map
+
+    def __getitem__(self, name):
+        record = self.changed.get(name)
+        if record is not None:
+            return record
+        with self._cache_lock:
+            record = self._cache.get(name)
+        if record is not None:
+            return record
+        state = self.map.get(name) if self.map is not None and name not in self.deleted else None
+        if state is None:
+            raise KeyError(name)
+        record = self._hydrate(state)
+        with self._cache_lock:
+            if len(self._cache) >= self.cache_size:
+                del self._cache[next(iter(self._cache))]
+            record = self._cache.setdefault(name, record)
+        return record
+
+    def __setitem__(self, name, record):
+        self.changed[name] = record
+        self.deleted.discard(name)
+        with self._cache_lock:
+            self._cache.pop(name, None)
+
+    def __delitem__(self, name):
+        if self.changed.pop(name, None) is None and not self._in_map(name):
+            raise KeyError(name)
+        if self.map is not None and name in self.map:
+            self.deleted.add(name)
+        with self._cache_lock:
+            self._cache.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self.changed or self._in_map(name)
+
+    def __len__(self):
+        count = len(self.map) - len(self.deleted) if self.map is not None else 0
+        return count + sum(1 for name in self.changed if self.map is None or name not in self.map)
+
+    def __iter__(self):
+        if self.map is not None:
+            for state in self.map.states():
+                if state[0] not in self.deleted:
+                    yield state[0]
+        for name in list(self.changed):
+            if self.map is None or name not in self.map:
+                yield name
+
+    def values(self):
+        """
+        Stream the records in insertion order, reading the unchanged ones off the mapping.
+
+        Returns:
+            generator: The records bound to the book."""
+
+        if self.map is not None:
+            for state in self.map.states():
+                name = state[0]
+                if name in self.deleted:
+                    continue
+                record = self.changed.get(name)
+                yield record if record is not None else self._hydrate(state)
+        for name, record in list(self.changed.items()):
+            if self.map is None or name not in self.map:
+                yield record
+
+    def items(self):
+        return ((record.name.value, record) for record in self.values())
+
+    def names(self):
+        if self.map is not None:
+            for name in self.map.names():
+                if name not in self.deleted:
+                    yield name
+        for name in list(self.changed):
+            if self.map is None or name not in self.map:
+                yield name
+
+    def states(self):
+        """
+        Stream the Record states of the book as it is now, for a new map file.
+
+        Returns:
+            generator: The states in insertion order."""
+
+        if self.map is not None:
+            for state in self.map.states():
+                name = state[0]
+                if name in self.deleted:
+                    continue
+                record = self.changed.get(name)
+                yield state if record is None else record.__getstate__()
+        for name, record in self.changed.items():
+            if self.map is None or name not in self.map:
+                yield record.__getstate__()
+
+    def remap(self, contact_map):
+        # A new map file includes every change, so the overlay starts empty again
+        if self.map is not None:
+            self.map.close()
+        self.map = contact_map
+        self.changed.clear()
+        self.deleted.clear()
+        with self._cache_lock:
+            self._cache.clear()
+
+    def close(self):
+        self.remap(None)
+
+
+class MappedAddressBook(AddressBook):
+    """
+    AddressBook reading its records from a memory-mapped contact map.
+
+    Opening the book maps the file and replays the journal of changes made
+    since it was written, so startup does not depend on the size of the
+    book. Records are hydrated when they are looked up; the name, phone,
+    search and birthday indexes are built from the mapping the first time
+    they are needed and kept in memory from then on. A checkpoint writes a
+    new map file including every change and maps it instead."""
+
+    journal_class = MappedJournal
+
+    def __init__(self):
+        self.data = MappedContacts(self)
+        # Built from the records of the map on first use, then kept up to date
+        self._name_index = None
+        self._name_prefixes = None
+        self._search_index = None
+        self._phone_index = None
+        self._birthdays = None
+
+    def _index(self, record):
+        record._book = self
+        if self._name_index is not None:
+            self._name_index.add(record.name.value)
+        if self._name_prefixes is not None:
+            self._name_prefixes.add(record.name.value)
+        self._reindex(record)
+
+    def _unindex(self, record):
+        record._book = None
+        if self._name_index is not None:
+            self._name_index.discard(record.name.value)
+        if self._name_prefixes is not None:
+            self._name_prefixes.discard(record.name.value)
+        if self._search_index is not None:
+            self._search_index.discard(record.name.value)
+        if self._phone_index is not None:
+            self._phone_index.discard(record.name.value)
+        if self._birthdays is not None:
+            self._birthdays.discard(record.name.value)
+        self._birthday_changed(record.name.value, None)
+
+    def _reindex(self, record):
+        if self._search_index is not None:
+            self._search_index.add(record.name.value, record.get_search_string())
+        self._reindex_phones_and_birthday(record)
+
+    def _reindex_phones_and_birthday(self, record):
+        if self._phone_index is not None:
+            self._phone_index.add(record.name.value, (phone.value for phone in record.phones))
+        if self._birthdays is None and self._reminders is None:
+            return
+        birthday_date = record.get_birthday_date()
+        if self._birthdays is not None:
+            if birthday_date:
+                self._birthdays.add(record.name.value, birthday_date.month, birthday_date.day, birthday_date.year)
+            else:
+                self._birthdays.discard(record.name.value)
+        self._birthday_changed(record.name.value, birthday_date)
+
+    def _rebuild_indexes(self):
+        pass
+
+    def _store_batch(self, records, added):
+        for name, record in records.items():
+            self.data[name] = record
+            record._book = self
+            self._reindex_phones_and_birthday(record)
+        if self._search_index is not None:
+            self._search_index.update((name, record.get_search_string()) for name, record in records.items())
+        if self._name_index is not None:
+            self._name_index.update(added)
+        if self._name_prefixes is not None:
+            self._name_prefixes.update(added)
+
+    def _record_changed(self, record, operation, *args):
+        self.data[record.name.value] = record
+        self._reindex(record)
+        self._log(record.name.value, operation, *args)
+
+    @reads
+    def suggest_names(self, name, k=3):
+        if self._name_index is None:
+            name_index = FuzzyIndex()
+            for contact_name in self.data.names():
+                name_index.add(contact_name)
+            self._name_index = name_index
+        return self._name_index.nearest(name, k)
+
+    @reads
+    def _sorted_names(self):
+        if self._name_prefixes is None:
+            name_prefixes = PrefixIndex()
+            name_prefixes.update(self.data.names())
+            self._name_prefixes = name_prefixes
+        return self._name_prefixes
+
+    def _phone_terms(self):
+        if self._phone_index is None:
+            phone_index = TermIndex()
+            for record in self.data.values():
+                phone_index.add(record.name.value, (phone.value for phone in record.phones))
+            self._phone_index = phone_index
+        return self._phone_index
+
+    def _search_postings(self):
+        if self._search_index is None:
+            search_index = NgramIndex()
+            search_index.update((record.name.value, record.get_search_string()) for record in self.data.values())
+            self._search_index = search_index
+        return self._search_index
+
+    def _birthday_array(self):
+        if self._birthdays is None:
+            birthdays = BirthdayArray()
+            for record in self.data.values():
+                birthday_date = record.get_birthday_date()
+                if birthday_date:
+                    birthdays.add(record.name.value, birthday_date.month, birthday_date.day, birthday_date.year)
+            self._birthdays = birthdays
+        return self._birthdays
+
+    def _query_order(self, names):
+        # The indexes keep the names in the order they were added, the order of the book
+        return names
+
+    @writes
+    def checkpoint(self):
+        if self._journal is not None:
+            self._journal.checkpoint(self.data)
+            self.data.remap(ContactMap(self._journal.filename))
+
+    def background_checkpoint(self):
+        # A new map must replace the overlay atomically, so it is written in the foreground
+        self.checkpoint()
+
+    @writes
+    def save_to_file(self, filename):
+        if self._journal is not None and self._journal.filename == filename:
+            self.checkpoint()
+            return
+        with open(filename, "wb") as file:
+            pickle.dump(dict(self.data.items()), file)
+
+    def _snapshot(self):
+        return self.data
+
+    def _restore(self, data):
+        self._name_index = None
+        self._name_prefixes = None
+        self._search_index = None
+        self._phone_index = None
+        self._birthdays = None
+        if isinstance(data, ContactMap):
+            self.data.remap(data)
+            return
+        self.data.close()
+        for name, record in data.items():
+            self.data[name] = record
+            self._index(record)
+
+    def close_journal(self):
+        super().close_journal()
+        self.data.close()
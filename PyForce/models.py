@@ -1,15 +1,37 @@
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import date, datetime
+from functools import lru_cache
 import pickle
 import re
+from sys import intern
+
+from indexes import BirthdayArray, FuzzyIndex, NgramIndex, PrefixIndex, TermIndex
+from journal import Journaled
+from locking import Lockable, reads, writes
 
 
 class Field:
+    __slots__ = ("value",)
+
     def __init__(self, value):
         self.value = value
 
+    @classmethod
+    def _unchecked(cls, value):
+        # Build a field around a value that was validated when it was stored
+        field = cls.__new__(cls)
+        field.value = value
+        return field
+
+    def __getstate__(self):
+        return {"value": self.value}
+
+    def __setstate__(self, state):
+        self.value = state["value"]
+
 
 class Name(Field):
+    __slots__ = ()
+
     def __init__(self, name: str):
         if not self.is_valid(name):
             raise ValueError("Invalid Name")
@@ -30,6 +52,8 @@ class Name(Field):
 
 
 class Phone(Field):
+    __slots__ = ()
+
     def __init__(self, number):
         if not self.is_valid(number):
             raise ValueError("Invalid phone number. Phone number must be 10 digits young Padawan")
@@ -48,8 +72,27 @@ class Phone(Field):
 
         return len(number) == 10 and number.isdigit()
 
+    def __eq__(self, other):
+        if isinstance(other, Phone):
+            return self.value == other.value
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.value)
+
+    @staticmethod
+    def pack(number):
+        # Ten ASCII digits fit in an int, other digits accepted by isdigit() stay text
+        return int(number) if number.isascii() else number
+
+    @staticmethod
+    def unpack(packed):
+        return f"{packed:010d}" if isinstance(packed, int) else packed
+
 
 class Address(Field):
+    __slots__ = ()
+
     def __init__(self, address):
         if not self.is_valid(address):
             raise ValueError("Invalid Address young Padawan")
@@ -74,6 +117,8 @@ class Address(Field):
 
 
 class Birthday(Field):
+    __slots__ = ()
+
     date_format = "%d.%m.%Y"
 
     def __init__(self, date):
@@ -100,8 +145,42 @@ class Birthday(Field):
         except ValueError:
             return False
 
+    def to_date(self):
+        """
+        Convert the birthday to a date object.
+
+        Returns:
+            datetime.date: The date of birth."""
+
+        return datetime.strptime(self.value, self.date_format).date()
+
+    @classmethod
+    def pack(cls, date):
+        # Kept as typed, so it is shown and found the way it was entered; equal dates share a string
+        cls.ordinal(date)
+        return intern(date)
+
+    @classmethod
+    @lru_cache(maxsize=1 << 16)
+    def ordinal(cls, date):
+        # Cached, as a book holds a few tens of thousands of distinct dates at most
+        try:
+            return datetime.strptime(date, cls.date_format).toordinal()
+        except ValueError:
+            raise ValueError(
+                "Invalid birthday date. Birthday date must be <DD.MM.YYYY> format"
+            )
+
+    @staticmethod
+    def unpack(ordinal):
+        # Records pickled with the birthday as an ordinal only have its DD.MM.YYYY form left
+        birthday_date = date.fromordinal(ordinal)
+        return f"{birthday_date.day:02d}.{birthday_date.month:02d}.{birthday_date.year:04d}"
+
 
 class Email(Field):
+    __slots__ = ()
+
     def __init__(self, email):
         if not self.is_valid(email):
             raise ValueError("Invalid Email. Do or do not. There is no try")
@@ -122,13 +201,130 @@ class Email(Field):
 
 
 class Record:
+    # Fields are kept packed to save memory: phones as integers and the birthday
+    # as the interned text it was entered as. The Field objects are rebuilt when
+    # they are accessed.
+    __slots__ = ("_name", "_phones", "_address", "_birthday", "_email", "_book")
+
     def __init__(self, name, phone, address=None, birthday=None, email=None):
-        self.name = Name(name)
-        self.phones = {Phone(phone)}
-        self.address = Address(address) if address else None
-        self.birthday = Birthday(birthday) if birthday else None
-        self.email = Email(email) if email else None
+        self._book = None
+        self._name = intern(Name(name).value)
+        self._phones = Phone.pack(Phone(phone).value)
+        self._address = Address(address).value if address else None
+        self._birthday = Birthday.pack(birthday) if birthday else None
+        self._email = Email(email).value if email else None
+
+    def __getstate__(self):
+        return (self._name, self._phones, self._address, self._birthday, self._email)
 
+    def copy(self):
+        """
+        Copy the record without its book; the packed fields are shared, as they are immutable.
+
+        Returns:
+            Record: The copy."""
+
+        record = Record.__new__(Record)
+        record._book = None
+        record._name, record._phones, record._address = self._name, self._phones, self._address
+        record._birthday, record._email = self._birthday, self._email
+        return record
+
+    def __setstate__(self, state):
+        self._book = None
+        if isinstance(state, dict):
+            # Records pickled before the packed layout keep their Field objects
+            self._name = intern(state["name"].value)
+            self._packed_phones = dict.fromkeys(Phone.pack(p.value) for p in state["phones"])
+            self._address = state["address"].value if state.get("address") else None
+            birthday = state.get("birthday")
+            self._birthday = Birthday.pack(birthday.value) if birthday else None
+            self._email = state["email"].value if state.get("email") else None
+        else:
+            self._name, self._phones, self._address, self._birthday, self._email = state
+            self._name = intern(self._name)
+            if isinstance(self._birthday, int):
+                self._birthday = Birthday.unpack(self._birthday)
+            if self._birthday is not None:
+                self._birthday = intern(self._birthday)
+
+    @classmethod
+    def from_values(cls, name, phones, address=None, birthday=None, email=None):
+        """
+        Rebuild a record from stored field values.
+
+        Args:
+            name (str): The name of the contact.
+            phones (iterable): The phone numbers of the contact, possibly none.
+            address (str, optional): The address of the contact. Defaults to None.
+            birthday (str, optional): The birthday of the contact. Defaults to None.
+            email (str, optional): The email address of the contact. Defaults to None.
+
+        Returns:
+            Record: The rebuilt record."""
+
+        record = cls.__new__(cls)
+        record._book = None
+        record._name = intern(Name(name).value)
+        record._packed_phones = dict.fromkeys(Phone.pack(Phone(phone).value) for phone in phones)
+        record._address = Address(address).value if address else None
+        record._birthday = Birthday.pack(birthday) if birthday else None
+        record._email = Email(email).value if email else None
+        return record
+
+    @property
+    def _packed_phones(self):
+        # Most contacts have a single phone, which is stored without a tuple around it
+        return self._phones if isinstance(self._phones, tuple) else (self._phones,)
+
+    @_packed_phones.setter
+    def _packed_phones(self, phones):
+        phones = tuple(phones)
+        self._phones = phones[0] if len(phones) == 1 else phones
+
+    @property
+    def name(self):
+        return Name._unchecked(self._name)
+
+    @property
+    def phones(self):
+        # A new set on every access, phones are changed through the Record methods
+        return {Phone._unchecked(Phone.unpack(phone)) for phone in self._packed_phones}
+
+    @property
+    def address(self):
+        return Address._unchecked(self._address) if self._address is not None else None
+
+    @property
+    def birthday(self):
+        if self._birthday is None:
+            return None
+        return Birthday._unchecked(self._birthday)
+
+    @property
+    def email(self):
+        return Email._unchecked(self._email) if self._email is not None else None
+
+    def _merge(self, other):
+        # Take the phones and the set fields of another record of the same contact
+        self._packed_phones = dict.fromkeys(self._packed_phones + other._packed_phones)
+        if other._address is not None:
+            self._address = other._address
+        if other._birthday is not None:
+            self._birthday = other._birthday
+        if other._email is not None:
+            self._email = other._email
+
+    @property
+    def _lock(self):
+        # Records share the lock of their book
+        return self._book._lock if self._book is not None else None
+
+    def _changed(self, operation, *args):
+        if self._book is not None:
+            self._book._record_changed(self, operation, *args)
+
+    @writes
     def add_phone(self, phone):
         """
         Add a phone number to the object.
@@ -141,12 +337,16 @@ class Record:
         """
 
         if Phone.is_valid(phone):
-            self.phones.add(Phone(phone))
+            packed = Phone.pack(phone)
+            if packed not in self._packed_phones:
+                self._packed_phones += (packed,)
+            self._changed("add_phone", phone)
         else:
             raise ValueError(
                 "Invalid phone number. Phone number must be 10 digits young Jedi"
             )
 
+    @writes
     def add_address(self, address):
         """
         Add an address to the object.
@@ -161,10 +361,12 @@ class Record:
             None"""
 
         if Address.is_valid(address):
-            self.address = Address(address)
+            self._address = Address(address).value
+            self._changed("add_address", address)
         else:
             raise ValueError("Invalid Address young Padawan")
 
+    @writes
     def add_birthday(self, birthday):
         """
         Add a birthday to the object.
@@ -181,12 +383,14 @@ class Record:
         if not birthday:
             return
         if Birthday.is_valid(birthday):
-            self.birthday = Birthday(birthday)
+            self._birthday = Birthday.pack(birthday)
+            self._changed("add_birthday", birthday)
         else:
             raise ValueError(
                 "Invalid birthday date. Birthday date must be <DD.MM.YYYY> format"
             )
 
+    @writes
     def add_email(self, email):
         """
         Add an email address to the object.
@@ -201,10 +405,12 @@ class Record:
             None"""
 
         if Email.is_valid(email):
-            self.email = Email(email)
+            self._email = Email(email).value
+            self._changed("add_email", email)
         else:
             raise ValueError("Invalid Email. Do or do not. There is no try")
 
+    @writes
     def remove_phone(self, phone):
         """
         Remove a phone number from the object.
@@ -218,13 +424,13 @@ class Record:
         Returns:
             None"""
 
-        for p in self.phones:
-            if p.value == phone:
-                self.phones.remove(p)
-                break
-        else:
+        packed = Phone.pack(phone) if Phone.is_valid(phone) else None
+        if packed is None or packed not in self._packed_phones:
             raise KeyError("Phone number not found youn Jedi")
+        self._packed_phones = (p for p in self._packed_phones if p != packed)
+        self._changed("remove_phone", phone)
 
+    @writes
     def edit_phone(self, old_phone, new_phone):
         """
         Edit a phone number by replacing the old phone number with a new phone number.
@@ -243,12 +449,14 @@ class Record:
         if not Phone.is_valid(new_phone):
             raise ValueError("Invalid new phone number. Phone must be 10 digits young Jedi")
 
-        for p in self.phones:
-            if p.value == old_phone:
-                p.value = new_phone
-                break
-        else:
+        old_packed = Phone.pack(old_phone) if Phone.is_valid(old_phone) else None
+        if old_packed is None or old_packed not in self._packed_phones:
             raise KeyError("Phone number not found young Jedi. I've got a bad feeling about this")
+        new_packed = Phone.pack(new_phone)
+        self._packed_phones = dict.fromkeys(
+            new_packed if p == old_packed else p for p in self._packed_phones
+        )
+        self._changed("edit_phone", old_phone, new_phone)
 
     def find_phone(self, phone):
         """
@@ -263,11 +471,11 @@ class Record:
         Returns:
             Phone: The Phone object representing the found phone number."""
 
-        for p in self.phones:
-            if p.value == phone:
-                return p
+        if Phone.is_valid(phone) and Phone.pack(phone) in self._packed_phones:
+            return Phone._unchecked(phone)
         raise KeyError("Phone number not found. I've got a bad feeling about this")
 
+    @writes
     def edit_address(self, address: str):
         """
         Edit the address by adding a new address.
@@ -280,6 +488,7 @@ class Record:
 
         self.add_address(address)
 
+    @writes
     def edit_email(self, email: str):
         """
         Edit the email address by adding a new email.
@@ -300,16 +509,24 @@ class Record:
             list: A list of phone numbers."""
 
         return self.phones
-      
 
-    def get_birthday(self):      
+    def get_birthday(self):
         """
         Get the birthday associated with the object.
 
         Returns:
             Birthday or None: The birthday of the object, or None if not set."""
-        
-        return self.birthday.value if self.birthday else "None"
+
+        return self._birthday if self._birthday is not None else "None"
+
+    def get_birthday_date(self):
+        """
+        Get the birthday as a date object.
+
+        Returns:
+            datetime.date or None: The date of birth, or None if not set."""
+
+        return date.fromordinal(Birthday.ordinal(self._birthday)) if self._birthday is not None else None
 
     def get_address(self):
         """
@@ -317,8 +534,8 @@ class Record:
 
         Returns:
             str or None: The address of the object, or None if not set."""
-        
-        return self.address.value if self.address else "None"
+
+        return self._address if self._address is not None else "None"
 
     def get_email(self):
         """
@@ -326,11 +543,26 @@ class Record:
 
         Returns:
             str or None: The email address of the object, or None if not set."""
-        
-        return self.email.value if self.email else "None"
 
+        return self._email if self._email is not None else "None"
 
+    def get_search_string(self):
+        """
+        Get the text that <findall> criteria are matched against.
 
+        Returns:
+            str: The name, phones, address, birthday and email joined together."""
+
+        return (
+            self._name
+            + "".join(Phone.unpack(phone) for phone in self._packed_phones)
+            + self.get_address()
+            + self.get_birthday()
+            + self.get_email()
+        )
+
+
+    @reads
     def __str__(self):
         """
         Return a string representation of the Contact object.
@@ -338,17 +570,88 @@ class Record:
         Returns:
             str: The string representation of the Contact object."""
 
-        birthday = f", birthday: {str(self.birthday.value)}" if self.birthday else ""
-        address = f", address: {str(self.address.value)}" if self.address else ""
-        email = f", email: {str(self.email.value)}" if self.email else ""
-        phones = ",".join([f"{v.value}" for v in self.phones])
-        return f"Contact name: {self.name.value}, phones: {phones}{birthday}{address}{email}"
+        birthday = f", birthday: {self.get_birthday()}" if self._birthday is not None else ""
+        address = f", address: {self._address}" if self._address is not None else ""
+        email = f", email: {self._email}" if self._email is not None else ""
+        phones = ",".join([Phone.unpack(phone) for phone in self._packed_phones])
+        return f"Contact name: {self._name}, phones: {phones}{birthday}{address}{email}"
+
+
+class ContactNotFound(KeyError):
+    """
+    KeyError raised for an unknown contact name, able to suggest close names.
+
+    Args:
+        book (AddressBook): The book that was searched.
+        name (str): The name that was not found."""
+
+    def __init__(self, book, name):
+        super().__init__("Name not found young Jedi. Enter <?> to find out all commands")
+        self.book = book
+        self.name = name
 
+    def suggestions(self, k=3):
+        return self.book.suggest_names(self.name, k)
+
+
+class AddressBook(Lockable, Journaled):
+    # Set by the Reminders scheduling the birthdays of the book
+    _reminders = None
 
-class AddressBook:
     def __init__(self):
         self.data = {}
-
+        self._search_index = NgramIndex()
+        self._birthdays = BirthdayArray()
+        self._phone_index = TermIndex()
+        self._name_index = FuzzyIndex()
+        self._name_prefixes = PrefixIndex()
+
+    def _index(self, record):
+        record._book = self
+        self._name_index.add(record.name.value)
+        self._name_prefixes.add(record.name.value)
+        self._reindex(record)
+
+    def _unindex(self, record):
+        record._book = None
+        name = record.name.value
+        self._name_index.discard(name)
+        self._name_prefixes.discard(name)
+        self._search_index.discard(name)
+        self._birthdays.discard(name)
+        self._phone_index.discard(name)
+        self._birthday_changed(name, None)
+
+    def _record_changed(self, record, operation, *args):
+        self._reindex(record)
+        self._log(record.name.value, operation, *args)
+
+    def _reindex(self, record):
+        name = record.name.value
+        self._search_index.add(name, record.get_search_string())
+        self._phone_index.add(name, (phone.value for phone in record.phones))
+        birthday_date = record.get_birthday_date()
+        if birthday_date:
+            self._birthdays.add(name, birthday_date.month, birthday_date.day, birthday_date.year)
+        else:
+            self._birthdays.discard(name)
+        self._birthday_changed(name, birthday_date)
+
+    def _birthday_changed(self, name, birthday_date):
+        # Called for every change of a record, whether its birthday changed or not
+        if self._reminders is not None:
+            self._reminders.birthday_changed(name, birthday_date)
+
+    def _rebuild_indexes(self):
+        self._name_index.clear()
+        self._name_prefixes.clear()
+        self._search_index.clear()
+        self._birthdays.clear()
+        self._phone_index.clear()
+        for record in self.data.values():
+            self._index(record)
+
+    @writes
     def add_record(self, name, phone, address=None, birthday=None, email=None):
         """
         Add a record to the address book.
@@ -372,8 +675,104 @@ class AddressBook:
             if email:
                 self.data[name].add_email(email)
         else:
-            self.data[name] = Record(name, phone, address, birthday, email)
+            record = Record(name, phone, address, birthday, email)
+            self.data[name] = record
+            self._index(record)
+            self._log(None, "add_record", name, phone, address, birthday, email)
 
+    def bulk_import(self, rows, batch_size=1000, on_reject=None):
+        """
+        Import contacts from an iterable of rows, such as the readers of importers.
+
+        Rows are consumed in batches: each batch is validated through the
+        Field checks, merged into the book like add_record does, journaled as
+        one entry and indexed once, so memory use does not grow with the input.
+
+        Args:
+            rows (iterable): Dicts with "name", "phones" (or a single "phone"),
+                and optional "address", "birthday" and "email" keys.
+            batch_size (int, optional): The number of rows per batch. Defaults to 1000.
+            on_reject (callable, optional): Called with a rejected row and the reason.
+
+        Returns:
+            tuple: The numbers of imported and rejected rows."""
+
+        imported = rejected = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                count, _ = self._import_rows(batch, on_reject)
+                imported += count
+                rejected += len(batch) - count
+                batch = []
+        if batch:
+            count, _ = self._import_rows(batch, on_reject)
+            imported += count
+            rejected += len(batch) - count
+        if imported:
+            self.checkpoint()
+        return imported, rejected
+
+    @writes
+    def _import_rows(self, rows, on_reject):
+        records = []
+        for row in rows:
+            phones = row.get("phones") or ([row["phone"]] if row.get("phone") else [])
+            try:
+                if not phones:
+                    raise ValueError("No phone number")
+                records.append(
+                    Record.from_values(
+                        row.get("name") or "",
+                        phones,
+                        row.get("address"),
+                        row.get("birthday"),
+                        row.get("email"),
+                    )
+                )
+            except ValueError as e:
+                if on_reject is not None:
+                    on_reject(row, str(e))
+        if records:
+            self._import_batch(records)
+            self._log(None, "_import_batch", records)
+        return len(records), len(rows) - len(records)
+
+    def _import_batch(self, records):
+        touched = {}
+        added = []
+        for record in records:
+            name = record.name.value
+            existing = touched.get(name) or self.data.get(name)
+            if existing is None:
+                touched[name] = record
+                added.append(name)
+            else:
+                existing._merge(record)
+                touched[name] = existing
+        self._store_batch(touched, added)
+
+    def _store_batch(self, records, added):
+        # Index the batch one index at a time, gathering the postings of all its records.
+        # Only the added names are new to the name indexes; a merged contact is already there.
+        for name, record in records.items():
+            self.data[name] = record
+            record._book = self
+        self._name_index.update(added)
+        self._name_prefixes.update(added)
+        self._search_index.update((name, record.get_search_string()) for name, record in records.items())
+        for name, record in records.items():
+            self._phone_index.add(name, (phone.value for phone in record.phones))
+        for name, record in records.items():
+            birthday_date = record.get_birthday_date()
+            if birthday_date:
+                self._birthdays.add(name, birthday_date.month, birthday_date.day, birthday_date.year)
+            else:
+                self._birthdays.discard(name)
+            self._birthday_changed(name, birthday_date)
+
+    @reads
     def count_records(self):
         """
         Count the number of records in the object.
@@ -383,6 +782,7 @@ class AddressBook:
 
         return len(self.data)
 
+    @reads
     def find(self, name):
         """
         Find a record by name in the object.
@@ -399,21 +799,207 @@ class AddressBook:
         if name in self.data:
             return self.data[name]
         else:
-            raise KeyError("Name not found young Jedi. Enter <?> to find out all commands")
-    
+            raise ContactNotFound(self, name)
+
+    @reads
+    def suggest_names(self, name, k=3):
+        """
+        Find the contact names closest to a possibly misspelt one.
+
+        Args:
+            name (str): The name to look for.
+            k (int, optional): The number of names to return. Defaults to 3.
+
+        Returns:
+            list: Up to k (name, edit distance) pairs, closest first."""
+
+        return self._name_index.nearest(name, k)
+
+    @reads
+    def complete_names(self, prefix, limit=20):
+        """
+        Find the contact names starting with a prefix, whatever their case.
+
+        Args:
+            prefix (str): The beginning of the names.
+            limit (int, optional): The largest number of names to return. Defaults to 20.
+
+        Returns:
+            list: Up to limit names in alphabetical order."""
+
+        return self._sorted_names().complete(prefix, limit)
+
+    def _sorted_names(self):
+        return self._name_prefixes
+
+    def _phone_terms(self):
+        return self._phone_index
+
+    def _search_postings(self):
+        return self._search_index
+
+    @reads
+    def find_by_phone(self, phone):
+        """
+        Find the records owning a phone number.
+
+        Args:
+            phone (str): The phone number to look for.
+
+        Returns:
+            list: The records with this phone number, possibly none."""
+
+        return [self.data[name] for name in self._phone_terms().lookup(phone)]
+
+    def iter_records(self):
+        """
+        Stream the records in insertion order.
+
+        The book must not change while the generator is consumed; it does not
+        take the read lock, since it may be suspended for a long time.
+
+        Returns:
+            generator: The records, one at a time."""
+
+        yield from self.data.values()
+
+    def iter_by_name(self, first=None, last=None, after=None):
+        """
+        Stream the records in alphabetical order of their names, whatever their case.
+
+        The order is kept by the sorted name index, so the first record is
+        found by a binary search and nothing is sorted. Like iter_records,
+        the generator does not take the read lock.
+
+        Args:
+            first (str, optional): Start with this name, or where it would be. Defaults to the first name.
+            last (str, optional): End with the names starting with this one. Defaults to the last name.
+            after (str, optional): Start right after this name instead, to resume an earlier listing.
+
+        Returns:
+            generator: The records, one at a time."""
+
+        for name in self._names_between(first, last, after):
+            yield self.data[name]
+
+    def _names_between(self, first, last, after):
+        # The names starting with last sort before last followed by the highest character
+        stop = last + "\U0010ffff" if last is not None else None
+        return self._sorted_names().irange(first, stop, after)
+
+    def iter_matches(self, criteria):
+        """
+        Stream the records containing the criteria in any of their fields.
+
+        The lookup goes through the n-gram index, so only the records sharing
+        every n-gram of the criteria are compared with it. Like iter_records,
+        the generator does not take the read lock.
+
+        Args:
+            criteria (str): The substring to search for.
+
+        Returns:
+            generator: The matching records in insertion order."""
+
+        for name in self._search_postings().search(criteria):
+            yield self.data[name]
+
+    @reads
     def find_by_criteria(self, criteria):
-        records = []
-        for name, record in self.data.items():
-            sourcestring = name + ''.join(str(s.value) for s in record.get_phones()) + record.get_address() + record.get_birthday() + record.get_email() 
-            if criteria in sourcestring:
-                birthday = f", birthday: {str(record.get_birthday())}"
-                address = f", address: {str(record.get_address())}" 
-                email = f", email: {str(record.get_email())}"
-                phones = ",".join([f"{v.value}" for v in record.get_phones()])
-                targetstring = f"Contact name: {name}, phones: {phones}{birthday}{address}{email}"
-                records.append(targetstring)
-        return records
+        """
+        Find the records containing the criteria in any of their fields.
+
+        Args:
+            criteria (str): The substring to search for.
+
+        Returns:
+            list: The descriptions of the matching records."""
+
+        return [self._describe_match(record) for record in self.iter_matches(criteria)]
+
+    def _access_path(self, predicate):
+        # The indexes able to narrow a query predicate down, for plan_query
+        from query import AccessPath
+
+        field, value = predicate.field, predicate.value
+        if field == "name" and predicate.exact:
+            found = [value] if value in self.data else []
+            return AccessPath("name dict", predicate, len(found), lambda: found)
+        if field == "phone" and predicate.exact:
+            names = self._phone_terms().lookup(value)
+            return AccessPath("phone map", predicate, len(names), lambda: names)
+        if field in ("birthday.month", "birthday.day") or (field == "has" and value == "birthday"):
+            month = value if field == "birthday.month" else None
+            day = value if field == "birthday.day" else None
+            birthdays = self._birthday_array()
+            # Birthdays are spread evenly enough over the 12 * 31 month and day codes for an estimate
+            estimate = len(birthdays) * (1 if month else 12) * (1 if day else 31) // 372
+            return AccessPath("birthday calendar", predicate, estimate, lambda: birthdays.select(month, day))
+        if field in (None, "name", "phone", "address", "email", "birthday"):
+            # The search string holds every field, so its n-grams narrow down any text
+            index = self._search_postings()
+            return AccessPath("n-gram postings", predicate, index.estimate(value), lambda: index.search(value))
+        return None
+
+    def _query_order(self, names):
+        return sorted(names, key=self._search_postings().order.__getitem__)
+
+    @reads
+    def query(self, text):
+        """
+        Find the contacts matching a query of field predicates.
+
+        The query is answered through the most selective index it can use,
+        unless that index gives a large part of the book, and only the
+        contacts found there are checked against it; see query.parse_query
+        for the syntax.
+
+        Args:
+            text (str): The query, such as 'email:gmail.com birthday.month:3'.
+
+        Raises:
+            ValueError: If the query cannot be parsed.
+
+        Returns:
+            list: The matching records in insertion order."""
 
+        # The query language is only loaded by the commands using it
+        from query import plan_query
+
+        plan = plan_query(text, self._access_path, len(self.data))
+        if plan.path is None:
+            records = self.data.values()
+        else:
+            records = map(self.data.__getitem__, self._query_order(plan.path.lookup()))
+        return [record for record in records if plan.query.matches(record)]
+
+    @reads
+    def explain(self, text):
+        """
+        Describe how a query would be answered, without answering it.
+
+        Args:
+            text (str): The query.
+
+        Raises:
+            ValueError: If the query cannot be parsed.
+
+        Returns:
+            list: The lines of the description."""
+
+        from query import plan_query
+
+        return plan_query(text, self._access_path, len(self.data)).explain()
+
+    @staticmethod
+    def _describe_match(record):
+        birthday = f", birthday: {str(record.get_birthday())}"
+        address = f", address: {str(record.get_address())}"
+        email = f", email: {str(record.get_email())}"
+        phones = ",".join([f"{v.value}" for v in record.get_phones()])
+        return f"Contact name: {record.name.value}, phones: {phones}{birthday}{address}{email}"
+
+    @writes
     def delete(self, name):
         """
         Delete a record by name from the object.
@@ -428,10 +1014,12 @@ class AddressBook:
             None"""
 
         if name in self.data:
-            del self.data[name]
+            self._unindex(self.data.pop(name))
+            self._log(None, "delete", name)
         else:
-            raise KeyError("Name not found young Jedi. Enter <?> to find out all commands")
+            raise ContactNotFound(self, name)
 
+    @writes
     def save_to_file(self, filename):
         """
         Save the object to a file.
@@ -442,9 +1030,13 @@ class AddressBook:
         Returns:
             None"""
 
+        if self._journal is not None and self._journal.filename == filename:
+            self.checkpoint()
+            return
         with open(filename, "wb") as file:
             pickle.dump(self.data, file)
 
+    @writes
     def load_from_file(self, filename):
         """
         Load data from a file and update the object.
@@ -456,7 +1048,73 @@ class AddressBook:
             None"""
 
         with open(filename, "rb") as file:
-            self.data = pickle.load(file)
+            self._restore(pickle.load(file))
+
+    def _snapshot(self):
+        return self.data
+
+    def _snapshot_copy(self):
+        return {name: record.copy() for name, record in self.data.items()}
+
+    def _restore(self, data):
+        self.data = data
+        self._rebuild_indexes()
+
+    def _apply(self, target, operation, args):
+        if target is None:
+            getattr(self, operation)(*args)
+        else:
+            getattr(self.data[target], operation)(*args)
+
+    def _birthday_array(self):
+        return self._birthdays
+
+    @reads
+    def upcoming_birthdays(self, num_of_days=7, start=None, ages=False):
+        """
+        Get the contacts celebrating their birthday within a window of days.
+
+        Args:
+            num_of_days (int, optional): The length of the window. Defaults to 7.
+            start (datetime.date, optional): The first day of the window. Defaults to today.
+            ages (bool, optional): Give (name, age) pairs with the age the
+                contact turns on the date instead of the names. Defaults to False.
+
+        Returns:
+            dict: A chronologically ordered mapping of dates to the names
+            of the contacts celebrating on them."""
+
+        if start is None:
+            start = datetime.now().date()
+        return self._birthday_array().upcoming(start, num_of_days, ages)
+
+    @reads
+    def birthdays(self):
+        """
+        Get the birthday of every contact that has one.
+
+        Returns:
+            list: (name, month, day, year) tuples."""
+
+        return list(self._birthday_array().items())
+
+    def birthdays_in_month(self, month=None, year=None):
+        """
+        Get the contacts celebrating their birthday in a month, with the age they turn.
+
+        Args:
+            month (int, optional): The month. Defaults to the current month.
+            year (int, optional): The year. Defaults to the current year.
+
+        Returns:
+            dict: A chronologically ordered mapping of dates to (name, age)
+            pairs of the contacts celebrating on them."""
+
+        from calendar import monthrange
+
+        today = datetime.now().date()
+        first = date(year or today.year, month or today.month, 1)
+        return self.upcoming_birthdays(monthrange(first.year, first.month)[1], first, ages=True)
 
     def get_birthdays_per_week(self):
         """
@@ -469,19 +1127,11 @@ class AddressBook:
         """
 
         today = datetime.now().date()
-        next_week = today + timedelta(days=7)
         upcoming_birthdays = {day: [] for day in range(7)}
 
-        for name, record in self.data.items():
-            if record.birthday:
-                birthday_date = datetime.strptime(
-                    record.birthday.value, "%d.%m.%Y"
-                ).date()
-                if today <= birthday_date < next_week:
-                    day = (birthday_date - today).days
-                    if day < 0:
-                        day += 365
-                    upcoming_birthdays[day].append((name, birthday_date))
+        for birthday_date, names in self.upcoming_birthdays(7, today).items():
+            day = (birthday_date - today).days
+            upcoming_birthdays[day].extend((name, birthday_date) for name in names)
 
         return upcoming_birthdays
 
@@ -490,34 +1140,15 @@ def handle_all_birthdays(address_book, num_of_days=7):
     if num_of_days > 365:
         print(f"Maximum range for the birthday list is 1 year. Got '{num_of_days}'")
         return
-    
-    birthdays_by_date = defaultdict(list)
-
-    today = datetime.now().date()
-
-    for name, record in address_book.data.items():
-        if record.birthday:
-            birthday_date = datetime.strptime(record.birthday.value, "%d.%m.%Y").date()
-
-            for i in range(num_of_days):
-                future_date = today + timedelta(days=i)
-                if (
-                    birthday_date.day == future_date.day
-                    and birthday_date.month == future_date.month
-                ):
-                    birthdays_by_date[future_date].append(name)
-
-    upcoming_dates = [
-            today + timedelta(days=day_offset) for day_offset in range(num_of_days)]
-    
-    if not any(date in [today + timedelta(days=i) for i in range(num_of_days)] for date in birthdays_by_date):
+
+    birthdays_by_date = address_book.upcoming_birthdays(num_of_days)
+
+    if not birthdays_by_date:
         print(f"No birthdays in the next {num_of_days} days young Jedi.")
     else:
         for date, names in birthdays_by_date.items():
-            if date in [today + timedelta(days=i) for i in range(num_of_days)]:
-                day_of_week = date.strftime("%A")
-                if day_of_week == "Saturday":
-                    day_of_week = "Monday"
-                names = [name.capitalize() for name in names]
-                print(f"{day_of_week} ({date.strftime('%d.%m')}): {', '.join(names)}")   
-
+            day_of_week = date.strftime("%A")
+            if day_of_week == "Saturday":
+                day_of_week = "Monday"
+            names = [name.capitalize() for name in names]
+            print(f"{day_of_week} ({date.strftime('%d.%m')}): {', '.join(names)}")
@@ -1,7 +1,12 @@
 from collections import defaultdict
 from datetime import datetime, timedelta
 import pickle
-from collections import UserDict, UserList
+from collections import UserDict
+from itertools import count
+
+from indexes import PrefixIndex, TermIndex, TextIndex
+from journal import Journaled
+from locking import Lockable, reads, writes
 
 
 class Field:
@@ -10,63 +15,197 @@ class Field:
 
 
 class Notes(UserDict):
+    # The notes book the note belongs to, notified about every change
+    _book = None
+
     def __init__(self, title, note, tags=None):
         super().__init__()
         self.data["title"] = title.strip()
         self.data["note"] = note.strip()
         self.data["tags"] = tags or []
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("_book", None)
+        state.pop("_key", None)
+        return state
+
+    @property
+    def _lock(self):
+        # Notes share the lock of their book
+        return self._book._lock if self._book is not None else None
+
+    @writes
     def addtag(self, tag):
         self.data["tags"].append(tag)
+        if self._book is not None:
+            self._book._note_changed(self, "addtag", tag)
+
+
+class NotesBook(Lockable, Journaled):
+    """
+    Book of notes, kept in an insertion-ordered dict keyed by a sequence
+    number, so a note can be removed without scanning the others. Every
+    change goes through append, remove or the data setter, which keep the
+    title, tag, text and prefix indexes in step with the notes.
+
+    Args:
+        notes (iterable, optional): The notes to start with."""
+
+    def __init__(self, notes=()):
+        self._notes = {}
+        self._counter = count()
+        self._title_index = TermIndex()
+        self._tag_index = TermIndex()
+        self._text_index = TextIndex()
+        self._title_prefixes = PrefixIndex()
+        self._tag_prefixes = PrefixIndex()
+        self.data = notes
+
+    # A copy of the notes in their order; assigning it replaces every note
+    @property
+    @reads
+    def data(self):
+        return list(self._notes.values())
+
+    @data.setter
+    @writes
+    def data(self, notes):
+        self.clear()
+        for note in notes:
+            self.append(note)
+
+    @reads
+    def __iter__(self):
+        return iter(list(self._notes.values()))
+
+    @reads
+    def __len__(self):
+        return len(self._notes)
 
+    def clear(self):
+        for note in self._notes.values():
+            note._book = None
+        self._notes.clear()
+        self._title_index.clear()
+        self._tag_index.clear()
+        self._text_index.clear()
+        self._title_prefixes.clear()
+        self._tag_prefixes.clear()
 
-class NotesBook(UserList):
-    def __init__(self, *args):
-        super().__init__(*args)
+    def append(self, note):
+        note._key = next(self._counter)
+        note._book = self
+        self._notes[note._key] = note
+        self._title_index.add(note._key, (note.data["title"],))
+        self._tag_index.add(note._key, note.data["tags"])
+        self._index_text(note)
+        self._title_prefixes.add(note.data["title"])
+        for tag in note.data["tags"]:
+            self._tag_prefixes.add(tag)
 
+    def remove(self, note):
+        del self._notes[note._key]
+        note._book = None
+        self._title_index.discard(note._key)
+        self._tag_index.discard(note._key)
+        self._text_index.discard(note._key)
+        self._title_prefixes.discard(note.data["title"])
+        for tag in note.data["tags"]:
+            self._tag_prefixes.discard(tag)
+
+    def _index_text(self, note):
+        self._text_index.add(note._key, f"{note.data['title']} {note.data['note']}")
+
+    @writes
     def addnote(self, *args):
         newnote = Notes(*args)
         self.append(newnote)
+        self._log(None, "addnote", *args)
+
+    def _note_changed(self, note, operation, *args):
+        self._tag_index.add(note._key, note.data["tags"])
+        self._tag_prefixes.add(*args)
+        self._log(note.data["title"], operation, *args)
 
+    @reads
     def searchbytitle(self, title):
         # Return the note with matching title, title have to be unique
-        for note in self:
-            if note.data["title"] == title:
-                return note
+        for key in self._title_index.lookup(title):
+            return self._notes[key]
         return None
 
+    @reads
+    def complete_titles(self, prefix, limit=20):
+        # Return the note titles starting with the prefix, whatever their case
+        return self._title_prefixes.complete(prefix, limit)
+
+    @reads
+    def complete_tags(self, prefix, limit=20):
+        # Return the tags starting with the prefix, whatever their case
+        return self._tag_prefixes.complete(prefix, limit)
+
+    @writes
     def removenote(self, title):
         note_to_remove = self.searchbytitle(title)
         if note_to_remove:
             self.remove(note_to_remove)
+            self._log(None, "removenote", title)
             print("Note deleted")
 
+    @reads
     def searchbytag(self, tag):
         # Return list of notes with matching tags
-        found = []
-        for note in self:
-            if tag in note.data["tags"]:
-                found.append(note)
-        return found
+        return [self._notes[key] for key in sorted(self._tag_index.lookup(tag))]
+
+    @reads
+    def searchbytext(self, query, limit=None):
+        # Return notes matching the words of the query, best matches first
+        found = self._text_index.search(query)[:limit]
+        return [self._notes[key] for key, score in found]
 
+    @writes
     def editbytitle(self, title, newnote):
         note_to_edit = self.searchbytitle(title)
         if note_to_edit is not None:
             note_to_edit.data["note"] = newnote
+            self._index_text(note_to_edit)
+            self._log(None, "editbytitle", title, newnote)
             print("Text was changed")
 
+    @reads
     def all(self):
         for note in self:
             print(
                 f"title: {note['title']} | Note: {note['note']} | Tags: {', '.join(note['tags'])}"
             )
-        if self == []:
+        if not self:
             print("No notes")
 
+    @writes
     def save_to_file(self, filename):
+        if self._journal is not None and self._journal.filename == filename:
+            self.checkpoint()
+            return
         with open(filename, "wb") as file:
             pickle.dump(self.data, file)
 
+    @writes
     def load_from_file(self, filename):
         with open(filename, "rb") as file:
-            self.data = pickle.load(file)
+            self._restore(pickle.load(file))
+
+    def _snapshot(self):
+        return self.data
+
+    def _snapshot_copy(self):
+        return [Notes(note["title"], note["note"], list(note["tags"])) for note in self._notes.values()]
+
+    def _restore(self, data):
+        self.data = data
+
+    def _apply(self, target, operation, args):
+        if target is None:
+            getattr(self, operation)(*args)
+        else:
+            self.searchbytitle(target).addtag(*args)
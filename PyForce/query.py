@@ -0,0 +1,310 @@
+from itertools import chain
+import re
+
+# Fields compared as text, the numbers of the birthday, and what has: checks
+TEXT_FIELDS = ("name", "phone", "address", "email", "birthday")
+NUMBER_FIELDS = {"birthday.day": (1, 31), "birthday.month": (1, 12), "birthday.year": (1, 9999)}
+HAS_FIELDS = ("phone", "address", "email", "birthday")
+KEYWORDS = ("AND", "OR", "NOT")
+
+# A contact found through an index costs about three times as much as one read by a scan
+INDEX_FRACTION = 1 / 3
+
+# A parenthesis, or a word that may hold double-quoted parts with spaces or parentheses in them
+TOKEN = re.compile(r'\s*(?:([()])|((?:[^\s()"]|"[^"]*")+))')
+PREDICATE = re.compile(r"([a-z.]+)([:=])(.*)", re.S)
+
+
+class Predicate:
+    """
+    A condition on one field of a contact.
+
+    With ":" a text field has to contain the value and with "=" to be equal
+    to it; a contact with several phones matches if one of them does. The
+    birthday numbers are always compared for equality, has: checks that a
+    field is set, and a word without a field is looked for anywhere in the
+    contact, like findall does.
+
+    Args:
+        field (str): The field, or None for the whole contact.
+        value (str or int): The value compared with the field.
+        exact (bool, optional): Whether the field has to be equal to the value. Defaults to False."""
+
+    def __init__(self, field, value, exact=False):
+        self.field = field
+        self.value = value
+        self.exact = exact
+
+    def matches(self, record):
+        field, value = self.field, self.value
+        if field is None:
+            return value in record.get_search_string()
+        if field == "has":
+            return bool(field_values(record, value))
+        if field in NUMBER_FIELDS:
+            birthday = record.get_birthday_date()
+            return birthday is not None and getattr(birthday, field[len("birthday."):]) == value
+        values = field_values(record, field)
+        if self.exact:
+            return value in values
+        return any(value in text for text in values)
+
+    def __str__(self):
+        value = str(self.value)
+        if not value or re.search(r'[\s()"]', value) or value in KEYWORDS:
+            value = f'"{value}"'
+        if self.field is None:
+            return value
+        operator = "=" if self.exact and self.field in TEXT_FIELDS else ":"
+        return f"{self.field}{operator}{value}"
+
+
+class Not:
+    def __init__(self, operand):
+        self.operand = operand
+
+    def matches(self, record):
+        return not self.operand.matches(record)
+
+    def __str__(self):
+        operand = self.operand
+        return f"NOT ({operand})" if isinstance(operand, (And, Or)) else f"NOT {operand}"
+
+
+class And:
+    def __init__(self, operands):
+        self.operands = operands
+
+    def matches(self, record):
+        return all(operand.matches(record) for operand in self.operands)
+
+    def __str__(self):
+        return " AND ".join(f"({operand})" if isinstance(operand, Or) else str(operand) for operand in self.operands)
+
+
+class Or:
+    def __init__(self, operands):
+        self.operands = operands
+
+    def matches(self, record):
+        return any(operand.matches(record) for operand in self.operands)
+
+    def __str__(self):
+        return " OR ".join(str(operand) for operand in self.operands)
+
+
+def field_values(record, field):
+    """
+    Get the values of a text field of a contact.
+
+    Args:
+        record (Record): The contact.
+        field (str): One of TEXT_FIELDS.
+
+    Returns:
+        list: The values, empty if the field is not set."""
+
+    if field == "name":
+        return [record.name.value]
+    if field == "phone":
+        return [phone.value for phone in record.phones]
+    value = getattr(record, field)
+    return [value.value] if value is not None else []
+
+
+def parse_query(text):
+    """
+    Parse a query into a tree of predicates.
+
+    Predicates next to each other all have to match; they are combined with
+    OR and NOT otherwise, NOT binding tighter than AND and AND than OR, and
+    grouped with parentheses. Values with spaces are put in double quotes,
+    like address:"Jedi Temple".
+
+    Args:
+        text (str): The query, such as 'email:gmail.com birthday.month:3'.
+
+    Raises:
+        ValueError: If the query is empty, unbalanced or has an unknown field.
+
+    Returns:
+        The root node: a Predicate, And, Or or Not."""
+
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"Unclosed quote in the query {text}")
+        tokens.append(match.group(1) or match.group(2))
+        position = match.end()
+    if not tokens:
+        raise ValueError("The query is empty")
+    tokens.reverse()
+    node = _parse_or(tokens)
+    if tokens:
+        raise ValueError(f"Unexpected {tokens[-1]} in the query")
+    return node
+
+
+def _parse_or(tokens):
+    operands = [_parse_and(tokens)]
+    while tokens and tokens[-1] == "OR":
+        tokens.pop()
+        operands.append(_parse_and(tokens))
+    return operands[0] if len(operands) == 1 else Or(operands)
+
+
+def _parse_and(tokens):
+    operands = [_parse_not(tokens)]
+    while tokens and tokens[-1] not in ("OR", ")"):
+        if tokens[-1] == "AND":
+            tokens.pop()
+        operands.append(_parse_not(tokens))
+    return operands[0] if len(operands) == 1 else And(operands)
+
+
+def _parse_not(tokens):
+    if not tokens:
+        raise ValueError("The query ends too early")
+    token = tokens.pop()
+    if token == "NOT":
+        return Not(_parse_not(tokens))
+    if token == "(":
+        node = _parse_or(tokens)
+        if not tokens or tokens.pop() != ")":
+            raise ValueError("Unbalanced parentheses in the query")
+        return node
+    if token in ("AND", "OR", ")"):
+        raise ValueError(f"Unexpected {token} in the query")
+    return _parse_predicate(token)
+
+
+def _parse_predicate(word):
+    match = PREDICATE.fullmatch(word)
+    if match is None:
+        return Predicate(None, word.replace('"', ""))
+    field, operator, value = match.groups()
+    value = value.replace('"', "")
+    if field == "has":
+        if value not in HAS_FIELDS:
+            raise ValueError(f"has: takes one of {', '.join(HAS_FIELDS)}")
+        return Predicate(field, value)
+    if field in NUMBER_FIELDS:
+        low, high = NUMBER_FIELDS[field]
+        if not value.isdigit() or not low <= int(value) <= high:
+            raise ValueError(f"{field} takes a number from {low} to {high}")
+        return Predicate(field, int(value), exact=True)
+    if field not in TEXT_FIELDS:
+        raise ValueError(f"Unknown query field {field}")
+    if not value:
+        raise ValueError(f"{field}{operator} needs a value")
+    return Predicate(field, value, exact=operator == "=")
+
+
+class AccessPath:
+    """
+    A way of finding the contacts that may match a predicate without reading the whole book.
+
+    Args:
+        index (str): The name of the index, shown by explain.
+        condition (str): What is looked up in the index.
+        estimate (int): About how many contacts the lookup gives.
+        lookup (function): Gets the names of these contacts, without arguments."""
+
+    def __init__(self, index, condition, estimate, lookup):
+        self.index = index
+        self.condition = condition
+        self.estimate = estimate
+        self.lookup = lookup
+
+    def __str__(self):
+        return f"{self.index}: {self.condition}"
+
+
+class Plan:
+    """
+    How a query is answered: the contacts found through an index, or all of
+    them, are checked against the whole query.
+
+    Args:
+        query: The root node of the query.
+        path (AccessPath): The chosen path, or None to read the whole book.
+        considered (list): Every path the indexes of the book offered.
+        best (AccessPath): The most selective path, even if it gives too many contacts to be taken.
+        total (int): The number of contacts in the book."""
+
+    def __init__(self, query, path, considered, best, total):
+        self.query = query
+        self.path = path
+        self.considered = considered
+        self.best = best
+        self.total = total
+
+    def explain(self):
+        """
+        Describe the plan.
+
+        Returns:
+            list: The lines of the description."""
+
+        lines = [f"query: {self.query}"]
+        if self.considered:
+            lines.append("indexes:")
+            lines.extend(f"  ~{path.estimate:<8} {path}" for path in self.considered)
+        if self.path is not None:
+            lines.append(f"access: {self.path}, ~{self.path.estimate} of {self.total} contacts")
+        elif self.best is not None:
+            lines.append(f"access: scan of all {self.total} contacts, faster than reading ~{self.best.estimate} through {self.best}")
+        else:
+            lines.append(f"access: scan of all {self.total} contacts, no index narrows the query")
+        lines.append("filter: the whole query, on every contact read")
+        return lines
+
+
+def plan_query(text, access_path, total):
+    """
+    Parse a query and choose how to answer it.
+
+    access_path offers an AccessPath for every predicate the book has an
+    index for. An AND takes the path of its most selective operand, an OR
+    the union of the paths of its operands if they all have one, and a NOT
+    none, since what it matches is not in any index. The query reads the
+    whole book if there is no path, or if the path would give more than
+    INDEX_FRACTION of it.
+
+    Args:
+        text (str): The query.
+        access_path (function): Takes a Predicate and returns an AccessPath, or None.
+        total (int): The number of contacts in the book.
+
+    Returns:
+        Plan: The plan of the query."""
+
+    query = parse_query(text)
+    considered = []
+    best = _choose_path(query, access_path, considered)
+    path = best if best is not None and best.estimate <= total * INDEX_FRACTION else None
+    return Plan(query, path, considered, best, total)
+
+
+def _choose_path(node, access_path, considered):
+    if isinstance(node, Predicate):
+        path = access_path(node)
+        if path is not None:
+            considered.append(path)
+        return path
+    if isinstance(node, Not):
+        return None
+    paths = [_choose_path(operand, access_path, considered) for operand in node.operands]
+    if isinstance(node, And):
+        return min((path for path in paths if path is not None), key=lambda path: path.estimate, default=None)
+    if None in paths:
+        return None
+    return AccessPath(
+        "union",
+        " | ".join(f"({path})" for path in paths),
+        sum(path.estimate for path in paths),
+        lambda: dict.fromkeys(chain.from_iterable(path.lookup() for path in paths)),
+    )
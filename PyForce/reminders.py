@@ -0,0 +1,166 @@
+from datetime import date, datetime, time, timedelta
+import os
+import shlex
+import subprocess
+import sys
+import threading
+
+from indexes import BirthdayHeap
+
+
+class Reminders:
+    """
+    Background thread reminding of the birthdays of an address book.
+
+    The next birthday of every contact is kept in a BirthdayHeap, built once
+    when the thread starts and then updated by the book as contacts change,
+    so no reminder ever scans the book. The thread sleeps until the top of
+    the heap is due, at midnight of the day the reminder is for, and wakes
+    up early only when a change moves a birthday to the top. A reminder is
+    handed to every notifier, a function taking the date, the name and the
+    age the contact turns.
+
+    Args:
+        address_book (AddressBook): The book whose birthdays are reminded.
+        notifiers (list): The functions called with every reminder.
+        days_ahead (int, optional): How many days before the birthday to remind. Defaults to 0."""
+
+    # Longest sleep, so that reminders are not late after the machine was suspended
+    max_wait = 3600.0
+
+    def __init__(self, address_book, notifiers, days_ahead=0):
+        self.address_book = address_book
+        self.notifiers = list(notifiers)
+        self.days_ahead = days_ahead
+        self.heap = BirthdayHeap()
+        self._condition = threading.Condition()
+        self._stopping = False
+        # Changes made while the heap is built, applied once it is
+        self._pending = []
+        self._thread = threading.Thread(target=self._run, name="pyforce-reminders", daemon=True)
+
+    def start(self):
+        # The book is now changed by one thread and read by this one
+        self.address_book.enable_locking()
+        self.address_book._reminders = self
+        self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self.address_book._reminders = None
+
+    def birthday_changed(self, name, birthday_date):
+        """
+        Reschedule a contact. Called by the book for every change of a contact, so it has to be cheap.
+
+        Args:
+            name (str): The name of the contact.
+            birthday_date (datetime.date): Its birthday, or None if it has none or was deleted.
+
+        Returns:
+            None"""
+
+        with self._condition:
+            if self._pending is not None:
+                self._pending.append((name, birthday_date))
+            elif self._schedule(name, birthday_date):
+                self._condition.notify()
+
+    def _schedule(self, name, birthday_date):
+        # True if the contact is now the first one due
+        if birthday_date is None:
+            self.heap.discard(name)
+            return False
+        scheduled = self.heap.add(name, birthday_date.month, birthday_date.day, birthday_date.year, date.today())
+        return scheduled is not None and scheduled == self.heap.peek()
+
+    def _load(self):
+        # The heap is built outside the lock, so the book is not held up by a big one
+        heap = BirthdayHeap()
+        heap.update(self.address_book.birthdays(), date.today())
+        with self._condition:
+            self.heap = heap
+            for name, birthday_date in self._pending:
+                self._schedule(name, birthday_date)
+            self._pending = None
+
+    def _wait_time(self):
+        first = self.heap.peek()
+        if first is None:
+            return self.max_wait
+        due = datetime.combine(first - timedelta(days=self.days_ahead), time())
+        return min(max((due - datetime.now()).total_seconds(), 0.0), self.max_wait)
+
+    def _run(self):
+        self._load()
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                due = self.heap.pop_until(date.today() + timedelta(days=self.days_ahead))
+                if not due:
+                    self._condition.wait(self._wait_time())
+                    continue
+            for birthday, name, age in due:
+                for notify in self.notifiers:
+                    try:
+                        notify(birthday, name, age)
+                    except Exception as ex:
+                        print(f"Reminder failed young Jedi: {ex}", file=sys.stderr)
+
+
+def reminder_text(birthday, name, age):
+    days = (birthday - date.today()).days
+    when = "today" if days <= 0 else "tomorrow" if days == 1 else f"on {birthday.strftime('%d.%m')}"
+    return f"Reminder young Jedi: {name} turns {age} {when}!"
+
+
+def print_reminder(birthday, name, age):
+    print(reminder_text(birthday, name, age))
+
+
+def log_reminders(filename):
+    """
+    Make a notifier appending the reminders to a file.
+
+    Args:
+        filename (str): The name of the log file.
+
+    Returns:
+        function: The notifier."""
+
+    def notify(birthday, name, age):
+        with open(filename, "a", encoding="utf-8") as file:
+            file.write(f"{datetime.now().isoformat(timespec='seconds')} {reminder_text(birthday, name, age)}\n")
+
+    return notify
+
+
+def run_hook(command):
+    """
+    Make a notifier running a command for every reminder.
+
+    The command gets the reminder in the PYFORCE_NAME, PYFORCE_BIRTHDAY
+    (DD.MM.YYYY) and PYFORCE_AGE environment variables, and is not waited for.
+
+    Args:
+        command (str): The command line, split like a shell would.
+
+    Returns:
+        function: The notifier."""
+
+    args = shlex.split(command)
+
+    def notify(birthday, name, age):
+        environment = dict(
+            os.environ,
+            PYFORCE_NAME=name,
+            PYFORCE_BIRTHDAY=birthday.strftime("%d.%m.%Y"),
+            PYFORCE_AGE=str(age),
+        )
+        subprocess.Popen(args, env=environment, stdin=subprocess.DEVNULL)
+
+    return notify
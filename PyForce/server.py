@@ -0,0 +1,241 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import io
+import json
+import os
+import signal
+import sys
+import threading
+
+from dispatcher import EXIT, ErrorMessage, command_name, get_handler, is_write, render
+
+
+class AsyncReadWriteLock:
+    """
+    Asyncio lock letting any number of readers in at once, or one writer.
+
+    Waiting writers are preferred, so a steady stream of reads cannot starve
+    them."""
+
+    def __init__(self):
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire_read(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._writer and not self._waiting_writers)
+            self._readers += 1
+
+    async def release_read(self):
+        async with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    async def acquire_write(self):
+        async with self._condition:
+            self._waiting_writers += 1
+            try:
+                await self._condition.wait_for(lambda: not self._writer and not self._readers)
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    async def release_write(self):
+        async with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+
+class ThreadStdout:
+    """
+    Replacement for sys.stdout sending what a thread prints to its own buffer.
+
+    Threads without a buffer print to the original stream."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        return (self.stream if buffer is None else buffer).write(text)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+def parse_request(line):
+    """
+    Read a request line: a JSON object {"id": ..., "command": ...} or a bare command.
+
+    Args:
+        line (str): The line received from the client, without the newline.
+
+    Returns:
+        tuple: The request id (None for bare commands) and the command line."""
+
+    if line.startswith("{"):
+        request = json.loads(line)
+        return request.get("id"), str(request.get("command", ""))
+    return None, line
+
+
+class Server:
+    """
+    Serve the books to concurrent clients over a Unix socket or localhost TCP.
+
+    Every request is one line holding a command, either bare or as the JSON
+    object {"id": ..., "command": ...}, and gets one JSON line back with the
+    keys "id" (if given), "command", "ok" and "result". Commands run on a
+    thread pool: reads run concurrently, writes one at a time with no read
+    in progress. A client may send requests without waiting for the answers;
+    they are answered in order, and each request sees the writes sent
+    before it on the same connection. A close command ends the connection.
+
+    Args:
+        address_book (AddressBook): The address book to serve.
+        note_book (NotesBook): The notes book to serve.
+        workers (int, optional): The number of threads running commands. Defaults to 8."""
+
+    def __init__(self, address_book, note_book, workers=8):
+        self.address_book = address_book
+        self.note_book = note_book
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pyforce")
+        self.lock = None
+        self.stdout = None
+
+    def execute(self, line):
+        """
+        Run one command in the calling thread, capturing what it prints.
+
+        Args:
+            line (str): The command line.
+
+        Returns:
+            tuple: The handler result and the printed text."""
+
+        handler = get_handler(line)
+        if handler is None:
+            return ErrorMessage("Invalid command young Jedi. Try again!"), ""
+        buffer = self.stdout.local.buffer = io.StringIO()
+        try:
+            result = handler(line, self.address_book, self.note_book)
+            # Generators of lines are consumed here, under the lock of the command
+            return (result if result is EXIT else render(result)), buffer.getvalue()
+        finally:
+            self.stdout.local.buffer = None
+
+    async def run(self, line):
+        loop = asyncio.get_running_loop()
+        write = is_write(line)
+        await (self.lock.acquire_write() if write else self.lock.acquire_read())
+        try:
+            return await loop.run_in_executor(self.executor, self.execute, line)
+        finally:
+            await (self.lock.release_write() if write else self.lock.release_read())
+
+    async def handle_connection(self, reader, writer):
+        responses = asyncio.Queue(maxsize=1024)
+        sender = asyncio.create_task(self.send_responses(responses, writer))
+        since_write = []
+        last_write = None
+        try:
+            while line := await reader.readline():
+                line = line.decode("utf-8").strip()
+                if not line:
+                    continue
+                try:
+                    request_id, command = parse_request(line)
+                except ValueError:
+                    request_id, command = None, ""
+                # A write waits for everything sent before it, a read for the last write
+                if last_write is not None and last_write.done():
+                    last_write = None
+                if is_write(command):
+                    waits_for = since_write + [last_write] if last_write else since_write
+                    task = asyncio.create_task(self.answer(request_id, command, waits_for))
+                    last_write, since_write = task, []
+                else:
+                    task = asyncio.create_task(self.answer(request_id, command, [last_write] if last_write else []))
+                    if len(since_write) >= 256:
+                        since_write = [pending for pending in since_write if not pending.done()]
+                    since_write.append(task)
+                await responses.put(task)
+                if command_name(command) in ("close", "exit", "end", "bye"):
+                    break
+        finally:
+            await responses.put(None)
+            await sender
+
+    async def answer(self, request_id, command, waits_for):
+        if waits_for:
+            await asyncio.wait(waits_for)
+        if not command:
+            result, printed = ErrorMessage("Send a command or a JSON object with a command young Padawan"), ""
+        else:
+            try:
+                result, printed = await self.run(command)
+            except Exception as ex:
+                result, printed = ErrorMessage(f"Unexpected exception young Jedi {ex}"), ""
+        if result is EXIT:
+            result = "Good bye! May the Force be with you!"
+        response = {"command": command_name(command), "ok": not isinstance(result, ErrorMessage)}
+        if result is None:
+            response["result"] = printed.rstrip("\n")
+        else:
+            response["result"] = printed + str(result)
+        if request_id is not None:
+            response = {"id": request_id, **response}
+        return json.dumps(response) + "\n"
+
+    async def send_responses(self, responses, writer):
+        try:
+            while (task := await responses.get()) is not None:
+                writer.write((await task).encode("utf-8"))
+                if responses.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path=None, host="127.0.0.1", port=8765):
+        """
+        Accept connections until the process gets SIGINT or SIGTERM.
+
+        Args:
+            path (str, optional): The Unix socket to listen on. Defaults to None, for TCP.
+            host (str, optional): The TCP host. Defaults to "127.0.0.1".
+            port (int, optional): The TCP port. Defaults to 8765.
+
+        Returns:
+            None"""
+
+        self.lock = AsyncReadWriteLock()
+        self.stdout = ThreadStdout(sys.stdout)
+        sys.stdout = self.stdout
+        loop = asyncio.get_running_loop()
+        stopped = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stopped.set)
+        if path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host=host, port=port)
+        where = path or f"{host}:{port}"
+        print(f"Serving the books on {where}. Press Ctrl+C to stop.", file=sys.stderr)
+        try:
+            async with server:
+                await stopped.wait()
+        finally:
+            sys.stdout = self.stdout.stream
+            self.executor.shutdown()
+            if path and os.path.exists(path):
+                os.remove(path)
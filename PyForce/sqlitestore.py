@@ -0,0 +1,608 @@
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from itertools import islice
+import pickle
+import sqlite3
+
+from indexes import BirthdayArray, FuzzyIndex, PrefixIndex, TextIndex
+from locking import reads, writes
+from models import AddressBook, ContactNotFound, Record
+from modelsfornotes import Notes, NotesBook
+from query import And, Not, Predicate, parse_query
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    name TEXT PRIMARY KEY,
+    address TEXT,
+    birthday TEXT,
+    birthday_month INTEGER,
+    birthday_day INTEGER,
+    email TEXT,
+    search TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS contacts_birthday ON contacts (birthday_month, birthday_day);
+CREATE INDEX IF NOT EXISTS contacts_email ON contacts (email);
+CREATE TABLE IF NOT EXISTS phones (
+    phone TEXT NOT NULL,
+    name TEXT NOT NULL REFERENCES contacts (name) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS phones_phone ON phones (phone);
+CREATE INDEX IF NOT EXISTS phones_name ON phones (name);
+CREATE TABLE IF NOT EXISTS notes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    note TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notes_title ON notes (title);
+CREATE TABLE IF NOT EXISTS tags (
+    note_id INTEGER NOT NULL REFERENCES notes (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS tags_note ON tags (note_id);
+"""
+
+NOTES_TEXT_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS notes_text USING fts5 (
+    title, note, content = 'notes', content_rowid = 'id'
+);
+CREATE TRIGGER IF NOT EXISTS notes_text_insert AFTER INSERT ON notes BEGIN
+    INSERT INTO notes_text (rowid, title, note) VALUES (new.id, new.title, new.note);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_text_delete AFTER DELETE ON notes BEGIN
+    INSERT INTO notes_text (notes_text, rowid, title, note) VALUES ('delete', old.id, old.title, old.note);
+END;
+CREATE TRIGGER IF NOT EXISTS notes_text_update AFTER UPDATE ON notes BEGIN
+    INSERT INTO notes_text (notes_text, rowid, title, note) VALUES ('delete', old.id, old.title, old.note);
+    INSERT INTO notes_text (rowid, title, note) VALUES (new.id, new.title, new.note);
+END;
+INSERT INTO notes_text (notes_text) VALUES ('rebuild');
+"""
+
+# Scripts upgrading the database from the version of their position
+MIGRATIONS = [SCHEMA, NOTES_TEXT_SCHEMA]
+
+CONTACT_COLUMNS = """
+    SELECT c.name, group_concat(p.phone), c.address, c.birthday, c.email
+    FROM contacts c LEFT JOIN phones p ON p.name = c.name
+"""
+
+# Conditions of the query predicates on the "c" alias of contacts, by field and exactness
+QUERY_CONDITIONS = {
+    (None, False): "instr(c.search, ?) > 0",
+    ("name", True): "c.name = ?",
+    ("name", False): "instr(c.name, ?) > 0",
+    ("phone", True): "c.name IN (SELECT name FROM phones WHERE phone = ?)",
+    ("phone", False): "c.name IN (SELECT name FROM phones WHERE instr(phone, ?) > 0)",
+    ("address", True): "c.address = ?",
+    ("address", False): "instr(c.address, ?) > 0",
+    ("email", True): "c.email = ?",
+    ("email", False): "instr(c.email, ?) > 0",
+    ("birthday", True): "c.birthday = ?",
+    ("birthday", False): "instr(c.birthday, ?) > 0",
+    ("birthday.month", True): "c.birthday_month = ?",
+    ("birthday.day", True): "c.birthday_day = ?",
+    ("birthday.year", True): "CAST(substr(c.birthday, -4) AS INTEGER) = ?",
+}
+HAS_CONDITIONS = {
+    "phone": "c.name IN (SELECT name FROM phones)",
+    "address": "c.address IS NOT NULL",
+    "email": "c.email IS NOT NULL",
+    "birthday": "c.birthday_month IS NOT NULL",
+}
+
+
+def connect(database):
+    """
+    Open a PyForce database, creating the schema if needed.
+
+    Args:
+        database (str): The path of the SQLite database file.
+
+    Returns:
+        tuple: The connection and True if the database was just created."""
+
+    connection = sqlite3.connect(database, check_same_thread=False)
+    connection.execute("PRAGMA foreign_keys = ON")
+    connection.execute("PRAGMA journal_mode = WAL")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    created = version == 0
+    for script in MIGRATIONS[version:]:
+        with connection:
+            connection.executescript(script)
+        version += 1
+        connection.execute(f"PRAGMA user_version = {version}")
+    return connection, created
+
+
+def _hydrate(row):
+    name, phones, address, birthday, email = row
+    return Record.from_values(
+        name, phones.split(",") if phones else (), address, birthday, email
+    )
+
+
+def query_condition(node, params):
+    """
+    Turn a parsed query into an SQL condition, so that SQLite plans it with its own indexes.
+
+    Args:
+        node: The root node of the query, from query.parse_query.
+        params (list): The list the parameters of the condition are appended to.
+
+    Returns:
+        str: The condition, using the "c" alias for contacts."""
+
+    if isinstance(node, Predicate):
+        if node.field == "has":
+            return HAS_CONDITIONS[node.value]
+        params.append(node.value)
+        return QUERY_CONDITIONS[node.field, node.exact]
+    if isinstance(node, Not):
+        # A condition on a NULL column is NULL, which NOT would leave NULL instead of true
+        return f"NOT ifnull({query_condition(node.operand, params)}, 0)"
+    operator = " AND " if isinstance(node, And) else " OR "
+    return f"({operator.join(query_condition(operand, params) for operand in node.operands)})"
+
+
+class SQLiteContacts(MutableMapping):
+    """Dict-like view of the contacts table hydrating records on access."""
+
+    def __init__(self, book):
+        self.book = book
+        self.connection = book.connection
+
+    def select(self, where="", params=()):
+        """
+        Stream the records matching an SQL condition in insertion order.
+
+        Args:
+            where (str, optional): The WHERE clause, using the "c" alias for contacts.
+            params (tuple, optional): The parameters of the clause.
+
+        Returns:
+            generator: The hydrated records bound to the book."""
+
+        cursor = self.connection.execute(self._select_sql(where), params)
+        for row in cursor:
+            record = _hydrate(row)
+            record._book = self.book
+            yield record
+
+    def explain(self, where="", params=()):
+        """
+        Get the plan SQLite makes for a select.
+
+        Args:
+            where (str, optional): The WHERE clause, like for select.
+            params (tuple, optional): The parameters of the clause.
+
+        Returns:
+            list: The steps of the plan, indented under the steps they belong to."""
+
+        depths = {0: -1}
+        steps = []
+        for step, parent, _, detail in self.connection.execute(f"EXPLAIN QUERY PLAN {self._select_sql(where)}", params):
+            depths[step] = depths.get(parent, -1) + 1
+            steps.append("  " * depths[step] + detail)
+        return steps
+
+    @staticmethod
+    def _select_sql(where):
+        return f"{CONTACT_COLUMNS} {where} GROUP BY c.name ORDER BY c.rowid"
+
+    def __getitem__(self, name):
+        for record in self.select("WHERE c.name = ?", (name,)):
+            return record
+        raise KeyError(name)
+
+    def __setitem__(self, name, record):
+        with self.connection:
+            self.write(name, record)
+
+    def write(self, name, record):
+        """
+        Write a record without committing, so that several writes share a transaction.
+
+        Args:
+            name (str): The name of the contact.
+            record (Record): The record to be written.
+
+        Returns:
+            None"""
+
+        birthday_date = record.get_birthday_date()
+        self.connection.execute(
+            """
+            INSERT INTO contacts (name, address, birthday, birthday_month, birthday_day, email, search)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (name) DO UPDATE SET
+                address = excluded.address, birthday = excluded.birthday,
+                birthday_month = excluded.birthday_month, birthday_day = excluded.birthday_day,
+                email = excluded.email, search = excluded.search
+            """,
+            (
+                name,
+                record.address.value if record.address else None,
+                record.birthday.value if record.birthday else None,
+                birthday_date.month if birthday_date else None,
+                birthday_date.day if birthday_date else None,
+                record.email.value if record.email else None,
+                record.get_search_string(),
+            ),
+        )
+        self.connection.execute("DELETE FROM phones WHERE name = ?", (name,))
+        self.connection.executemany(
+            "INSERT INTO phones (phone, name) VALUES (?, ?)",
+            [(phone.value, name) for phone in record.phones],
+        )
+
+    def __delitem__(self, name):
+        with self.connection:
+            cursor = self.connection.execute("DELETE FROM contacts WHERE name = ?", (name,))
+        if not cursor.rowcount:
+            raise KeyError(name)
+
+    def __contains__(self, name):
+        cursor = self.connection.execute("SELECT 1 FROM contacts WHERE name = ?", (name,))
+        return cursor.fetchone() is not None
+
+    def __iter__(self):
+        cursor = self.connection.execute("SELECT name FROM contacts ORDER BY rowid")
+        return (name for (name,) in cursor)
+
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM contacts").fetchone()[0]
+
+    def values(self):
+        return self.select()
+
+    def items(self):
+        return ((record.name.value, record) for record in self.select())
+
+
+class SQLiteAddressBook(AddressBook):
+    """
+    AddressBook keeping its records in an SQLite database.
+
+    Records are hydrated only when they are accessed and written back after
+    every change, while lookups run as indexed SQL queries."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.data = SQLiteContacts(self)
+        # Built from the names column on first use, then kept up to date
+        self._name_index = None
+        self._name_prefixes = None
+
+    def _index(self, record):
+        record._book = self
+        if self._name_index is not None:
+            self._name_index.add(record.name.value)
+        if self._name_prefixes is not None:
+            self._name_prefixes.add(record.name.value)
+        self._reindex(record)
+
+    def _unindex(self, record):
+        record._book = None
+        if self._name_index is not None:
+            self._name_index.discard(record.name.value)
+        if self._name_prefixes is not None:
+            self._name_prefixes.discard(record.name.value)
+        self._birthday_changed(record.name.value, None)
+
+    def _reindex(self, record):
+        # The birthday columns are the index; only the reminders need telling
+        if self._reminders is not None:
+            self._birthday_changed(record.name.value, record.get_birthday_date())
+
+    def _rebuild_indexes(self):
+        pass
+
+    def _record_changed(self, record, operation, *args):
+        self.data[record.name.value] = record
+        self._reindex(record)
+
+    def _store_batch(self, records, added):
+        with self.connection:
+            for name, record in records.items():
+                self.data.write(name, record)
+                record._book = self
+                self._reindex(record)
+        if self._name_index is not None:
+            self._name_index.update(added)
+        if self._name_prefixes is not None:
+            self._name_prefixes.update(added)
+
+    @reads
+    def find(self, name):
+        try:
+            return self.data[name]
+        except KeyError:
+            raise ContactNotFound(self, name)
+
+    @reads
+    def suggest_names(self, name, k=3):
+        if self._name_index is None:
+            name_index = FuzzyIndex()
+            for (contact_name,) in self.connection.execute("SELECT name FROM contacts"):
+                name_index.add(contact_name)
+            self._name_index = name_index
+        return self._name_index.nearest(name, k)
+
+    @reads
+    def _sorted_names(self):
+        if self._name_prefixes is None:
+            name_prefixes = PrefixIndex()
+            name_prefixes.update(name for (name,) in self.connection.execute("SELECT name FROM contacts"))
+            self._name_prefixes = name_prefixes
+        return self._name_prefixes
+
+    @reads
+    def find_by_phone(self, phone):
+        return list(
+            self.data.select(
+                "WHERE c.name IN (SELECT name FROM phones WHERE phone = ?)", (phone,)
+            )
+        )
+
+    def iter_by_name(self, first=None, last=None, after=None):
+        # One query per chunk of names instead of one per record
+        names = self._names_between(first, last, after)
+        while chunk := list(islice(names, 500)):
+            records = {
+                record.name.value: record
+                for record in self.data.select(f"WHERE c.name IN ({', '.join('?' * len(chunk))})", chunk)
+            }
+            yield from (records[name] for name in chunk if name in records)
+
+    def iter_matches(self, criteria):
+        # instr() keeps the search case-sensitive, unlike LIKE
+        return self.data.select("WHERE instr(c.search, ?) > 0", (criteria,))
+
+    @reads
+    def query(self, text):
+        params = []
+        where = query_condition(parse_query(text), params)
+        return list(self.data.select(f"WHERE {where}", params))
+
+    @reads
+    def explain(self, text):
+        query = parse_query(text)
+        params = []
+        where = query_condition(query, params)
+        lines = [f"query: {query}", f"sql: WHERE {where}", "plan:"]
+        lines.extend(f"  {step}" for step in self.data.explain(f"WHERE {where}", params))
+        return lines
+
+    @reads
+    def upcoming_birthdays(self, num_of_days=7, start=None, ages=False):
+        if start is None:
+            start = datetime.now().date()
+        if num_of_days <= 0:
+            return {}
+        end = start + timedelta(days=num_of_days - 1)
+        first, last = (start.month, start.day), (end.month, end.day)
+        if last == (2, 28):
+            # 29.02 birthdays are celebrated on 28.02 in non-leap years
+            last = (2, 29)
+        if first <= last and num_of_days < 366:
+            where = "(birthday_month, birthday_day) BETWEEN (?, ?) AND (?, ?)"
+        else:
+            where = "(birthday_month, birthday_day) >= (?, ?) OR (birthday_month, birthday_day) <= (?, ?)"
+        birthdays = BirthdayArray()
+        cursor = self.connection.execute(
+            "SELECT name, birthday_month, birthday_day, birthday FROM contacts"
+            f" WHERE birthday_month IS NOT NULL AND ({where}) ORDER BY rowid",
+            (*first, *last),
+        )
+        for name, month, day, birthday in cursor:
+            # The birthday is stored as typed, always ending with the four digits of the year
+            birthdays.add(name, month, day, int(birthday[-4:]))
+        return birthdays.upcoming(start, num_of_days, ages)
+
+    @reads
+    def birthdays(self):
+        cursor = self.connection.execute(
+            "SELECT name, birthday_month, birthday_day, birthday FROM contacts"
+            " WHERE birthday_month IS NOT NULL ORDER BY rowid"
+        )
+        return [(name, month, day, int(birthday[-4:])) for name, month, day, birthday in cursor]
+
+    @writes
+    def save_to_file(self, filename):
+        with open(filename, "wb") as file:
+            pickle.dump(dict(self.data.items()), file)
+
+    @writes
+    def load_from_file(self, filename):
+        with open(filename, "rb") as file:
+            self._restore(pickle.load(file))
+
+    def _restore(self, data):
+        with self.connection:
+            self.connection.execute("DELETE FROM contacts")
+        self._name_index = None
+        self._name_prefixes = None
+        self._store_batch(data, list(data))
+
+
+class SQLiteNotesBook(NotesBook):
+    """NotesBook keeping its notes in an SQLite database."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _select(self, where="", params=()):
+        cursor = self.connection.execute(
+            f"SELECT n.id, n.title, n.note FROM notes n {where} ORDER BY n.id", params
+        )
+        notes = []
+        for note_id, title, text in cursor.fetchall():
+            tags = [
+                tag
+                for (tag,) in self.connection.execute(
+                    "SELECT tag FROM tags WHERE note_id = ? ORDER BY rowid", (note_id,)
+                )
+            ]
+            note = Notes(title, text, tags)
+            note._book = self
+            note._id = note_id
+            notes.append(note)
+        return notes
+
+    @property
+    @reads
+    def data(self):
+        return self._select()
+
+    @data.setter
+    @writes
+    def data(self, notes):
+        with self.connection:
+            self.connection.execute("DELETE FROM notes")
+        for note in notes:
+            self._insert(note)
+
+    @reads
+    def __iter__(self):
+        return iter(self._select())
+
+    @reads
+    def __len__(self):
+        return self.connection.execute("SELECT count(*) FROM notes").fetchone()[0]
+
+    def _insert(self, note):
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO notes (title, note) VALUES (?, ?)",
+                (note.data["title"], note.data["note"]),
+            )
+            self.connection.executemany(
+                "INSERT INTO tags (note_id, tag) VALUES (?, ?)",
+                [(cursor.lastrowid, tag) for tag in note.data["tags"]],
+            )
+        note._book = self
+        note._id = cursor.lastrowid
+
+    def _note_changed(self, note, operation, *args):
+        with self.connection:
+            self.connection.execute(
+                "INSERT INTO tags (note_id, tag) VALUES (?, ?)", (note._id, *args)
+            )
+
+    @writes
+    def addnote(self, *args):
+        self._insert(Notes(*args))
+
+    @reads
+    def searchbytitle(self, title):
+        found = self._select("WHERE n.id = (SELECT min(id) FROM notes WHERE title = ?)", (title,))
+        return found[0] if found else None
+
+    def _complete(self, query, prefix, limit):
+        # LIKE ignores the case of ASCII letters; wildcards typed in the prefix are escaped
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return [value for (value,) in self.connection.execute(query, (pattern, limit))]
+
+    @reads
+    def complete_titles(self, prefix, limit=20):
+        return self._complete(
+            "SELECT DISTINCT title FROM notes WHERE title LIKE ? ESCAPE '\\'"
+            " ORDER BY title COLLATE NOCASE LIMIT ?",
+            prefix,
+            limit,
+        )
+
+    @reads
+    def complete_tags(self, prefix, limit=20):
+        return self._complete(
+            "SELECT DISTINCT tag FROM tags WHERE tag LIKE ? ESCAPE '\\'"
+            " ORDER BY tag COLLATE NOCASE LIMIT ?",
+            prefix,
+            limit,
+        )
+
+    @writes
+    def removenote(self, title):
+        note_to_remove = self.searchbytitle(title)
+        if note_to_remove:
+            with self.connection:
+                self.connection.execute("DELETE FROM notes WHERE id = ?", (note_to_remove._id,))
+            print("Note deleted")
+
+    @reads
+    def searchbytag(self, tag):
+        return self._select(
+            "WHERE n.id IN (SELECT note_id FROM tags WHERE tag = ?)", (tag,)
+        )
+
+    @reads
+    def searchbytext(self, query, limit=None):
+        groups = TextIndex.parse(query)
+        if not groups:
+            return []
+        # Every word is quoted so that FTS5 operators typed by the user stay plain text
+        match = " OR ".join(
+            "(" + " ".join(
+                f'"{word[:-1]}"*' if word.endswith("*") else f'"{word}"' for word in words
+            ) + ")"
+            for words in groups
+        )
+        ranked = [
+            note_id
+            for (note_id,) in self.connection.execute(
+                "SELECT rowid FROM notes_text WHERE notes_text MATCH ? ORDER BY rank LIMIT ?",
+                (match, -1 if limit is None else limit),
+            )
+        ]
+        notes = {
+            note._id: note
+            for note in self._select(
+                f"WHERE n.id IN ({', '.join('?' * len(ranked))})", ranked
+            )
+        }
+        return [notes[note_id] for note_id in ranked]
+
+    @writes
+    def editbytitle(self, title, newnote):
+        note_to_edit = self.searchbytitle(title)
+        if note_to_edit is not None:
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE notes SET note = ? WHERE id = ?", (newnote, note_to_edit._id)
+                )
+            print("Text was changed")
+
+    @writes
+    def save_to_file(self, filename):
+        with open(filename, "wb") as file:
+            pickle.dump(self.data, file)
+
+    @writes
+    def load_from_file(self, filename):
+        with open(filename, "rb") as file:
+            self.data = pickle.load(file)
+
+
+def migrate_from_pickle(address_book, note_book, contacts="contacts", notes="notes"):
+    """
+    Copy the pickled books, including their journals, into SQLite books.
+
+    Args:
+        address_book (SQLiteAddressBook): The book to copy the contacts into.
+        note_book (SQLiteNotesBook): The book to copy the notes into.
+        contacts (str, optional): The contacts snapshot file. Defaults to "contacts".
+        notes (str, optional): The notes snapshot file. Defaults to "notes".
+
+    Returns:
+        None"""
+
+    source_address_book = AddressBook()
+    if source_address_book.load_journal(contacts):
+        address_book._restore(source_address_book.data)
+    source_note_book = NotesBook([])
+    if source_note_book.load_journal(notes):
+        note_book.data = source_note_book.data
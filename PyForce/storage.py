@@ -0,0 +1,186 @@
+from contextlib import ExitStack, contextmanager
+import os
+
+from autosave import Autosaver
+from models import AddressBook
+from modelsfornotes import NotesBook
+
+
+class PickleStorage:
+    """
+    Default storage: pickled snapshots with append-only journals.
+
+    Args:
+        contacts (str, optional): The contacts snapshot file. Defaults to "contacts".
+        notes (str, optional): The notes snapshot file. Defaults to "notes"."""
+
+    def __init__(self, contacts="contacts", notes="notes"):
+        self.contacts = contacts
+        self.notes = notes
+        self.autosaver = None
+
+    def open_address_book(self):
+        """
+        Open the address book.
+
+        Returns:
+            tuple: The book and True if saved data was found."""
+
+        address_book = AddressBook()
+        return address_book, address_book.open_journal(self.contacts)
+
+    def open_notes_book(self):
+        """
+        Open the notes book.
+
+        Returns:
+            tuple: The book and True if saved data was found."""
+
+        note_book = NotesBook([])
+        return note_book, note_book.open_journal(self.notes)
+
+    def batch(self, address_book, note_book):
+        """
+        Defer the fsync of both journals while a batch of commands runs.
+
+        Returns:
+            A context manager that checkpoints both books when it exits."""
+
+        stack = ExitStack()
+        stack.enter_context(address_book.deferred_sync())
+        stack.enter_context(note_book.deferred_sync())
+        return stack
+
+    def autosave(self, address_book, note_book, interval=60.0, changes=1000):
+        """
+        Save snapshots of both books from a background thread.
+
+        Args:
+            interval (float, optional): Seconds between saves of a changed book. Defaults to 60.
+            changes (int, optional): Changes that trigger a save right away. Defaults to 1000.
+
+        Returns:
+            None"""
+
+        self.autosaver = Autosaver([address_book, note_book], interval, changes)
+        self.autosaver.start()
+
+    def close(self, address_book, note_book):
+        if self.autosaver is not None:
+            self.autosaver.stop()
+            self.autosaver = None
+        address_book.close_journal()
+        note_book.close_journal()
+
+
+class SQLiteStorage:
+    """
+    SQLite storage keeping both books in one database file.
+
+    When the database is created, the contacts and notes of the pickle
+    storage found next to it are migrated into it once.
+
+    Args:
+        database (str, optional): The database file. Defaults to "pyforce.db".
+        contacts (str, optional): The contacts file to migrate. Defaults to "contacts".
+        notes (str, optional): The notes file to migrate. Defaults to "notes"."""
+
+    def __init__(self, database="pyforce.db", contacts="contacts", notes="notes"):
+        # The backends are imported when they are chosen, so that the default one starts without sqlite3
+        from sqlitestore import SQLiteAddressBook, SQLiteNotesBook, connect, migrate_from_pickle
+
+        self.connection, created = connect(database)
+        self.address_book = SQLiteAddressBook(self.connection)
+        self.note_book = SQLiteNotesBook(self.connection)
+        if created:
+            migrate_from_pickle(self.address_book, self.note_book, contacts, notes)
+
+    def open_address_book(self):
+        return self.address_book, self.address_book.count_records() > 0
+
+    def open_notes_book(self):
+        return self.note_book, len(self.note_book) > 0
+
+    def autosave(self, address_book, note_book, interval=60.0, changes=1000):
+        # Every change is committed to the database, there is nothing to save
+        pass
+
+    @contextmanager
+    def batch(self, address_book, note_book):
+        """
+        Commit without syncing the write-ahead log while a batch of commands runs.
+
+        Every command still commits its own transaction; the log is folded
+        into the database and synced once, when the batch ends."""
+
+        self.connection.execute("PRAGMA synchronous = OFF")
+        try:
+            yield
+        finally:
+            self.connection.execute("PRAGMA synchronous = NORMAL")
+            self.connection.execute("PRAGMA wal_checkpoint(FULL)")
+
+    def close(self, address_book, note_book):
+        self.connection.close()
+
+
+class MappedStorage(PickleStorage):
+    """
+    Storage mapping the contacts from a contact map file, for very large books.
+
+    Notes are stored like in the default storage. When the map file does not
+    exist yet, the contacts of the default storage are migrated into it once.
+
+    Args:
+        contacts (str, optional): The contact map file. Defaults to "contacts.map".
+        notes (str, optional): The notes snapshot file. Defaults to "notes".
+        legacy_contacts (str, optional): The contacts file to migrate. Defaults to "contacts"."""
+
+    def __init__(self, contacts="contacts.map", notes="notes", legacy_contacts="contacts"):
+        super().__init__(contacts, notes)
+        self.legacy_contacts = legacy_contacts
+
+    def open_address_book(self):
+        from mmapstore import MappedAddressBook
+
+        address_book = MappedAddressBook()
+        # The log is folded into a new map file rarely, since that rewrites the whole map
+        loaded = address_book.open_journal(self.contacts, checkpoint_every=100000)
+        if not loaded:
+            legacy_book = AddressBook()
+            if legacy_book.load_journal(self.legacy_contacts):
+                address_book._restore(legacy_book.data)
+                address_book.checkpoint()
+                loaded = True
+        return address_book, loaded
+
+    def autosave(self, address_book, note_book, interval=60.0, changes=1000):
+        # Contact changes are in the journal, only the notes are saved in the background
+        self.autosaver = Autosaver([note_book], interval, changes)
+        self.autosaver.start()
+
+
+STORAGE_BACKENDS = {
+    "pickle": PickleStorage,
+    "mmap": MappedStorage,
+    "sqlite": SQLiteStorage,
+}
+
+
+def open_storage(backend=None):
+    """
+    Create the storage backend selected by name or by the PYFORCE_STORAGE variable.
+
+    Args:
+        backend (str, optional): The backend name. Defaults to $PYFORCE_STORAGE or "pickle".
+
+    Raises:
+        ValueError: If the backend is unknown.
+
+    Returns:
+        The storage backend."""
+
+    backend = backend or os.environ.get("PYFORCE_STORAGE", "pickle")
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend '{backend}'")
+    return STORAGE_BACKENDS[backend]()
@@ -0,0 +1,13 @@
+"""
+Benchmark suite of PyForce.
+
+Run ``python -m benchmarks --help`` from the repository root. The books are
+made by the deterministic generators of ``benchmarks.generators``, the
+scenarios are registered in ``benchmarks.scenarios``, and the results are
+written as JSON that a later run is compared with.
+"""
+import os
+import sys
+
+# The PyForce modules import each other by their flat names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PyForce"))
@@ -0,0 +1,86 @@
+"""
+Check that importing and then deleting contacts leaves no index entries behind.
+
+Generated contacts are imported into the in-memory, SQLite and mmap books
+in small batches, with names repeated inside a batch and across batches so
+that many rows are merged into contacts already in the book. After every
+contact is deleted again, the name, prefix, search, phone and birthday
+indexes of each book have to be empty; a merged contact indexed a second
+time would keep its name in them.
+
+Usage: python benchmarks/check_import.py [number of contacts]
+"""
+import os
+import random
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PyForce"))
+
+from generators import generate_contacts  # noqa: E402
+from mmapstore import MappedAddressBook  # noqa: E402
+from models import AddressBook  # noqa: E402
+from sqlitestore import SQLiteAddressBook, connect  # noqa: E402
+
+
+def make_rows(size, seed=0):
+    rows = list(generate_contacts(size))
+    rng = random.Random(seed)
+    # Every third row is another phone for a contact met before or later
+    repeated = [dict(rng.choice(rows), phones=[f"{2000000000 + i}"]) for i in range(size // 3)]
+    rows.extend(repeated)
+    rng.shuffle(rows)
+    return rows
+
+
+def make_books(directory):
+    connection, _ = connect(os.path.join(directory, "contacts.db"))
+    mapped = MappedAddressBook()
+    mapped.open_journal(os.path.join(directory, "contacts.map"))
+    return {"memory": AddressBook(), "sqlite": SQLiteAddressBook(connection), "mmap": mapped}
+
+
+def leftovers(book):
+    indexes = {
+        "name": book._name_index.keys,
+        "prefix": book._name_prefixes.counts,
+        "search": getattr(book, "_search_index", None) and book._search_index.documents,
+        "phone": getattr(book, "_phone_index", None) and book._phone_index.terms,
+        "birthday": getattr(book, "_birthdays", None) and book._birthdays.slots,
+    }
+    return {index: len(keys) for index, keys in indexes.items() if keys}
+
+
+def check(book, rows):
+    book.bulk_import(rows[: len(rows) // 2], batch_size=100)
+    # The lazy indexes of the SQLite and mmap books are built before the rest is merged in
+    book.suggest_names("Luke")
+    book.complete_names("L")
+    book.upcoming_birthdays()
+    book.find_by_phone("0000000000")
+    book.find_by_criteria("Luke")
+    book.bulk_import(rows[len(rows) // 2:], batch_size=100)
+    names = list(book.data)
+    for name in names:
+        book.delete(name)
+    return len(names), leftovers(book)
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    rows = make_rows(size)
+    print(f"{len(rows)} rows for {size} contacts, batches of 100")
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        for kind, book in make_books(directory).items():
+            imported, left = check(book, rows)
+            failed = failed or bool(left)
+            print(f"{kind:>8}: {imported} contacts deleted, {left or 'no index entries'} left")
+            if kind == "mmap":
+                book.close_journal()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
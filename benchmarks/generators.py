@@ -0,0 +1,145 @@
+"""
+Deterministic generators of synthetic contacts and notes.
+
+The same count and seed always give the same rows, whatever the machine, so
+that results of different runs measure the same books. Names and phones are
+derived from the position of the contact, so a scenario can pick an existing
+contact without keeping the rows around; the other fields are drawn from a
+seeded random generator. Rows are streamed, so books of 10M contacts can be
+made without holding the rows in memory twice.
+"""
+import csv
+import random
+
+from models import AddressBook
+from modelsfornotes import Notes, NotesBook
+
+FIRST_NAMES = [
+    "Luke", "Leia", "Han", "Anakin", "Padme", "Obiwan", "Yoda", "Mace", "Quigon", "Rey",
+    "Finn", "Poe", "Lando", "Jyn", "Cassian", "Ahsoka", "Din", "Hera", "Kanan", "Sabine",
+    "Ezra", "Wedge", "Biggs", "Chewie", "Boba", "Jango", "Dooku", "Kylo", "Rose", "Maz",
+]
+LAST_NAMES = [
+    "Skywalker", "Organa", "Solo", "Amidala", "Kenobi", "Windu", "Jinn", "Calrissian",
+    "Erso", "Andor", "Tano", "Djarin", "Syndulla", "Jarrus", "Wren", "Bridger", "Antilles",
+    "Darklighter", "Dameron", "Kryze", "Fett", "Tico", "Kanata", "Ren", "Palpatine",
+]
+STREETS = ["Jedi Temple", "Mos Eisley", "Echo Base", "Cloud City", "Theed Palace", "Canto Bight"]
+WORDS = [
+    "force", "droid", "rebel", "empire", "saber", "hyperdrive", "moon", "base", "plans",
+    "cantina", "bounty", "council", "padawan", "master", "blaster", "falcon", "destroyer",
+    "holocron", "kyber", "crystal", "speeder", "walker", "senate", "republic", "order",
+    "smuggler", "trench", "shield", "generator", "outpost", "asteroid", "carbonite",
+]
+TAGS = ["rebels", "empire", "jedi", "sith", "droids", "ships", "planets", "bounties", "council", "family"]
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(text):
+    """
+    Parse a book size such as 1000, 10k or 1m.
+
+    Args:
+        text (str): The size, with an optional k or m suffix.
+
+    Returns:
+        int: The number of contacts."""
+
+    text = text.strip().lower()
+    if text[-1:] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def contact_name(i):
+    return f"{FIRST_NAMES[i % len(FIRST_NAMES)]}{LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]}{i}"
+
+
+def contact_phone(i):
+    # 7919 is prime to 10 ** 10, so every position gets its own number
+    return f"{(1_000_000_000 + i * 7919) % 10 ** 10:010d}"
+
+
+def note_title(i):
+    return f"{WORDS[i % len(WORDS)].capitalize()} {WORDS[i * 7 % len(WORDS)]} {i}"
+
+
+def generate_contacts(count, seed=0):
+    """
+    Stream synthetic contacts.
+
+    Args:
+        count (int): The number of contacts.
+        seed (int, optional): The seed of the optional fields. Defaults to 0.
+
+    Returns:
+        generator: Dicts accepted by AddressBook.bulk_import."""
+
+    rng = random.Random(seed)
+    for i in range(count):
+        name = contact_name(i)
+        phones = [contact_phone(i)]
+        if rng.random() < 0.2:
+            phones.append(f"{rng.randrange(10 ** 10):010d}")
+        yield {
+            "name": name,
+            "phones": phones,
+            "address": f"{rng.randrange(1, 500)} {rng.choice(STREETS)}" if rng.random() < 0.6 else None,
+            "birthday": f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2010)}"
+            if rng.random() < 0.8
+            else None,
+            "email": f"{name.lower()}@example.com" if rng.random() < 0.5 else None,
+        }
+
+
+def generate_notes(count, seed=0):
+    """
+    Stream synthetic notes.
+
+    Args:
+        count (int): The number of notes.
+        seed (int, optional): The seed of the texts and tags. Defaults to 0.
+
+    Returns:
+        generator: (title, note, tags) tuples accepted by Notes."""
+
+    rng = random.Random(seed)
+    for i in range(count):
+        text = " ".join(rng.choices(WORDS, k=rng.randint(5, 20)))
+        tags = rng.sample(TAGS, rng.randint(0, 3))
+        if rng.random() < 0.3:
+            # A long tail of rare tags next to the common ones
+            tags.append(f"tag{rng.randrange(max(count // 10, 1))}")
+        yield note_title(i), text, tags
+
+
+def make_address_book(count, seed=0):
+    address_book = AddressBook()
+    address_book.bulk_import(generate_contacts(count, seed))
+    return address_book
+
+
+def make_notes_book(count, seed=0):
+    return NotesBook([Notes(title, text, tags) for title, text, tags in generate_notes(count, seed)])
+
+
+def write_contacts_csv(filename, count, seed=0):
+    """
+    Write synthetic contacts to a CSV file in the format of the import command.
+
+    Args:
+        filename (str): The name of the file.
+        count (int): The number of contacts.
+        seed (int, optional): The seed of the optional fields. Defaults to 0.
+
+    Returns:
+        None"""
+
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["name", "phone", "address", "birthday", "email"])
+        for row in generate_contacts(count, seed):
+            writer.writerow(
+                [row["name"], ";".join(row["phones"]), row["address"] or "", row["birthday"] or "", row["email"] or ""]
+            )
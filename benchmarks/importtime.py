@@ -0,0 +1,95 @@
+"""
+Check that importing main stays fast and does not load what the mode in use does not need.
+
+Usage: python -m benchmarks.importtime [--budget-ms 35] [--runs 15] [--top 10]
+
+"python -X importtime -c 'import main'" is run several times in fresh
+interpreters, and the fastest cumulative time of main is compared with the
+budget. The modules only some modes need, such as prompt_toolkit for the
+terminal or sqlite3 for its storage backend, must not be imported at all.
+The exit status is 1 if the budget is exceeded or one of them is imported.
+"""
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+
+PYFORCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "PyForce")
+
+# Imported by the code that needs them, never by importing main
+DEFERRED_MODULES = [
+    "prompt_toolkit", "sqlite3", "mmap", "tracemalloc", "json", "csv", "asyncio", "subprocess", "query", "calendar",
+]
+
+# Importing main took about 45 ms before the optional modules were deferred, and about 25 ms after
+BUDGET_MS = 35.0
+RUNS = 15
+
+
+def import_times():
+    """
+    Import main in a fresh interpreter and read what -X importtime reports.
+
+    Returns:
+        dict: Module names mapped to (self, cumulative) microseconds."""
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=PYFORCE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_time), int(cumulative))
+    return times
+
+
+def fastest_import(runs=RUNS):
+    """
+    Byte-compile PyForce, then import main in fresh interpreters and keep the fastest import.
+
+    Args:
+        runs (int, optional): The number of imports measured after a first one warming the disk cache.
+
+    Returns:
+        dict: Module names mapped to (self, cumulative) microseconds, for the fastest import of main."""
+
+    # Installed packages are byte-compiled; with PYTHONDONTWRITEBYTECODE set, every import would compile the sources
+    compileall.compile_dir(PYFORCE, quiet=1)
+    import_times()
+    return min((import_times() for _ in range(runs)), key=lambda times: times["main"][1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.importtime", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS, help="the slowest acceptable import of main")
+    parser.add_argument("--runs", type=int, default=RUNS, help="imports measured, the fastest counts")
+    parser.add_argument("--top", type=int, default=10, help="modules listed by their own import time")
+    args = parser.parse_args(argv)
+
+    fastest = fastest_import(args.runs)
+    elapsed = fastest["main"][1] / 1000
+
+    print(f"{'module':<32} {'self':>10} {'cumulative':>12}")
+    for name, (self_time, cumulative) in sorted(fastest.items(), key=lambda item: item[1][0], reverse=True)[: args.top]:
+        print(f"{name:<32} {self_time / 1000:>7.2f} ms {cumulative / 1000:>9.2f} ms")
+
+    failed = False
+    loaded = [name for name in DEFERRED_MODULES if name in fastest]
+    if loaded:
+        print(f"\nImported but not needed at startup: {', '.join(loaded)}")
+        failed = True
+    verdict = "over" if elapsed > args.budget_ms else "within"
+    print(f"\nimport main took {elapsed:.2f} ms, {verdict} the budget of {args.budget_ms:g} ms")
+    failed = failed or elapsed > args.budget_ms
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
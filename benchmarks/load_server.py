@@ -0,0 +1,85 @@
+"""
+Load a running PyForce server with concurrent clients and report latency and throughput.
+
+Each connection keeps a number of requests in flight, mostly reads (phone,
+whois, show-birthday, findall) with a share of writes (add-phone) on the
+contacts it finds with 'all' at the start.
+
+Usage: python benchmarks/load_server.py [--socket PATH | --port N] [--connections 16]
+           [--depth 8] [--requests 20000] [--writes 0.05]
+"""
+import argparse
+import asyncio
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PyForce"))
+
+from client import AsyncClient  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def make_command(contacts, write_share):
+    name, phone = random.choice(contacts)
+    if random.random() < write_share:
+        return f"add-phone {name} {random.randrange(10**9, 10**10)}"
+    return random.choice(
+        [f"phone {name}", f"whois {phone}", f"show-birthday {name}", f"findall {name}"]
+    )
+
+
+async def worker(args, contacts, latencies, counter):
+    client = await AsyncClient.connect(path=args.socket, host=args.host, port=args.port)
+
+    async def one():
+        while counter[0] < args.requests:
+            counter[0] += 1
+            command = make_command(contacts, args.writes)
+            started = time.perf_counter()
+            await client.call(command)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one() for _ in range(args.depth)))
+    await client.close()
+
+
+async def run(args):
+    client = await AsyncClient.connect(path=args.socket, host=args.host, port=args.port)
+    listing = (await client.call("all"))["result"]
+    await client.close()
+    contacts = re.findall(r"Contact name: (\S+), phones: (\d+)", listing)
+    if not contacts:
+        sys.exit("The served address book is empty, add or import some contacts first")
+
+    latencies, counter = [], [0]
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(args, contacts, latencies, counter) for _ in range(args.connections)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"{len(latencies)} requests over {args.connections} connection(s), {args.depth} in flight each")
+    print(f"throughput: {len(latencies) / elapsed:.0f} req/s")
+    print(f"latency p50: {percentile(latencies, 0.50) * 1000:.2f} ms")
+    print(f"latency p99: {percentile(latencies, 0.99) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", metavar="PATH")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--depth", type=int, default=8, help="requests in flight per connection")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--writes", type=float, default=0.05, help="share of write requests")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
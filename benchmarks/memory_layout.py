@@ -0,0 +1,75 @@
+"""
+Compare the memory taken by contacts in the legacy and the packed Record layouts.
+
+Usage: python benchmarks/memory_layout.py [number of contacts]
+"""
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PyForce"))
+
+from models import Address, Birthday, Email, Name, Phone, Record  # noqa: E402
+
+
+class LegacyField:
+    def __init__(self, value):
+        self.value = value
+
+
+class LegacyPhone(LegacyField):
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __hash__(self):
+        return hash(self.value)
+
+
+class LegacyRecord:
+    """The layout used before Record got __slots__: one object with a __dict__ per field."""
+
+    def __init__(self, name, phone, address=None, birthday=None, email=None):
+        assert Name.is_valid(name) and Phone.is_valid(phone)
+        self.name = LegacyField(name)
+        self.phones = {LegacyPhone(phone)}
+        self.address = LegacyField(address) if address and Address.is_valid(address) else None
+        self.birthday = LegacyField(birthday) if birthday and Birthday.is_valid(birthday) else None
+        self.email = LegacyField(email) if email and Email.is_valid(email) else None
+
+
+def generate_contacts(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield (
+            f"contact{i}",
+            f"{rng.randrange(10 ** 10):010d}",
+            f"{rng.randrange(1, 200)} Main street" if rng.random() < 0.5 else None,
+            f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(1950, 2010)}"
+            if rng.random() < 0.7
+            else None,
+            f"contact{i}@example.com" if rng.random() < 0.5 else None,
+        )
+
+
+def measure(record_class, contacts):
+    tracemalloc.start()
+    records = {contact[0]: record_class(*contact) for contact in contacts}
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def main(count=100_000):
+    contacts = list(generate_contacts(count))
+    legacy = measure(LegacyRecord, contacts)
+    packed = measure(Record, contacts)
+    print(f"contacts: {count}")
+    print(f"legacy layout: {legacy / count:8.1f} bytes per contact")
+    print(f"packed layout: {packed / count:8.1f} bytes per contact")
+    print(f"ratio: {legacy / packed:.2f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,180 @@
+"""
+Run the benchmark scenarios and compare the results with a baseline.
+
+Usage: python -m benchmarks [--sizes 1k,10k,100k] [--scenario PATTERN ...] [--seed 0]
+           [--min-time 0.5] [--repeat 5] [--output results.json]
+           [--baseline baseline.json] [--threshold 0.25] [--list]
+
+Every scenario is timed on books of every size. The results are written as
+JSON with the machine they were measured on; given a baseline, a scenario
+whose median time grew by more than the threshold is reported as a
+regression and the exit status is 1.
+"""
+import argparse
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+from .generators import parse_size
+from .scenarios import SCENARIOS, Fixture, uncovered_commands
+
+
+def measure(operation, min_time=0.5, repeat=5):
+    """
+    Time an operation, with the garbage collector off like timeit does.
+
+    The operation is run in rounds of as many calls as fit in min_time /
+    repeat seconds. An operation slower than min_time is run only once.
+
+    Args:
+        operation (function): The operation, without arguments.
+        min_time (float, optional): The time to spend on the operation. Defaults to 0.5.
+        repeat (int, optional): The number of rounds. Defaults to 5.
+
+    Returns:
+        dict: The best and median seconds per call, the calls per round and the rounds."""
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        operation()
+        first = time.perf_counter() - started
+        if first >= min_time:
+            return {"best": first, "median": first, "loops": 1, "repeat": 1}
+        loops = max(1, int(min_time / repeat / max(first, 1e-9)))
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(loops):
+                operation()
+            times.append((time.perf_counter() - started) / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return {"best": min(times), "median": statistics.median(times), "loops": loops, "repeat": repeat}
+
+
+def compare(results, baseline, threshold=0.25):
+    """
+    Compare results with a baseline.
+
+    Args:
+        results (list): The results of this run.
+        baseline (list): The results of the baseline run.
+        threshold (float, optional): The relative change of the median time
+            reported as a regression or an improvement. Defaults to 0.25.
+
+    Returns:
+        list: (scenario, size, baseline median, median, ratio, verdict) tuples
+        for the scenarios and sizes found in both, where the verdict is
+        "regression", "improvement" or ""."""
+
+    known = {(result["scenario"], result["size"]): result["median"] for result in baseline}
+    rows = []
+    for result in results:
+        before = known.get((result["scenario"], result["size"]))
+        if before is None:
+            continue
+        ratio = result["median"] / before if before else float("inf")
+        if ratio > 1 + threshold:
+            verdict = "regression"
+        elif ratio < 1 / (1 + threshold):
+            verdict = "improvement"
+        else:
+            verdict = ""
+        rows.append((result["scenario"], result["size"], before, result["median"], ratio, verdict))
+    return rows
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def run(sizes, names, seed=0, min_time=0.5, repeat=5):
+    """
+    Time the scenarios on books of the given sizes.
+
+    Args:
+        sizes (list): The numbers of contacts and notes of the books.
+        names (list): The names of the scenarios.
+        seed (int, optional): The seed of the generators and of the random picks. Defaults to 0.
+        min_time (float, optional): The time to spend on each scenario. Defaults to 0.5.
+        repeat (int, optional): The number of rounds of each scenario. Defaults to 5.
+
+    Returns:
+        list: One result dict per scenario and size."""
+
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="pyforce-bench-") as directory:
+            fixture = Fixture(size, seed, directory)
+            for name in names:
+                operation = SCENARIOS[name](fixture)
+                result = {"scenario": name, "size": size, **measure(operation, min_time, repeat)}
+                results.append(result)
+                print(f"{name:<28} {size:>10} {format_time(result['median']):>12}", flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1k,10k,100k", help="comma-separated book sizes, such as 1k,1m,10m")
+    parser.add_argument("--scenario", action="append", metavar="PATTERN", help="run the scenarios matching a glob")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent on each scenario")
+    parser.add_argument("--repeat", type=int, default=5, help="rounds of each scenario")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25, help="relative slowdown reported as a regression")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    args = parser.parse_args(argv)
+
+    patterns = args.scenario or ["*"]
+    names = [name for name in SCENARIOS if any(fnmatch(name, pattern) for pattern in patterns)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    if not names:
+        parser.error(f"no scenario matches {', '.join(patterns)}")
+    if missing := uncovered_commands():
+        print(f"Commands without a scenario: {', '.join(missing)}", file=sys.stderr)
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = run(sizes, names, args.seed, args.min_time, args.repeat)
+
+    if args.output:
+        report = {
+            "meta": {
+                "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    rows = compare(results, baseline, args.threshold)
+    print(f"\n{'scenario':<28} {'size':>10} {'baseline':>12} {'now':>12} {'ratio':>7}")
+    for name, size, before, after, ratio, verdict in rows:
+        print(f"{name:<28} {size:>10} {format_time(before):>12} {format_time(after):>12} {ratio:>6.2f}x {verdict}".rstrip())
+    regressions = sum(1 for row in rows if row[5] == "regression")
+    print(f"\n{len(rows)} compared, {regressions} regression(s)")
+    return 1 if regressions else 0
@@ -0,0 +1,338 @@
+"""
+Benchmark scenarios: the book operations and every command path.
+
+A scenario is registered with the ``scenario`` decorator. It is given the
+Fixture of the current size, does its setup, and returns the operation to
+be timed, a function without arguments. Operations that change a book
+either undo their change or only rewrite fields, so that repeating them
+measures a book of the same size.
+"""
+from contextlib import redirect_stdout
+from datetime import date
+from itertools import islice
+import os
+import random
+
+from .generators import (
+    LAST_NAMES,
+    TAGS,
+    WORDS,
+    contact_name,
+    contact_phone,
+    generate_contacts,
+    make_address_book,
+    make_notes_book,
+    note_title,
+    write_contacts_csv,
+)
+
+import main  # registers the command handlers
+from dispatcher import COMMANDS, command_name, get_handler, render
+from importers import read_contacts
+from indexes import BirthdayHeap
+from models import AddressBook, handle_all_birthdays
+from modelsfornotes import NotesBook
+
+# Commands take everything on one line instead of asking questions, like in batch mode
+main.INTERACTIVE = False
+
+# Scenario name -> setup function taking a Fixture and returning the operation
+SCENARIOS = {}
+
+# Command lines run through the dispatcher, one scenario each. The fields are
+# filled in with a random contact or note for every run; a line list is run
+# as a whole, so that a command adding something is followed by its undoing.
+COMMAND_LINES = {
+    "hello": ["hello"],
+    "help": ["?"],
+    "notes-help": ["notes-help"],
+    "add-contact": ["add-contact Newcomer{i} 0123456789 - 01.01.2000", "delete Newcomer{i}"],
+    "phone": ["phone {name}"],
+    "whois": ["whois {phone}"],
+    "show-birthday": ["show-birthday {name}"],
+    "birthdays": ["birthdays 30"],
+    "birthdays-month": ["birthdays-month"],
+    "all": ["all --page 2 --size 50"],
+    "all-after": ["all --after {name} --size 50"],
+    "all-range": ["all --from {last_name} --to {last_name} --limit 50"],
+    "export": ["export {export}"],
+    "findall": ["findall {name}"],
+    "findall-broad": ["findall {last_name} --limit 100"],
+    "fuzzy": ["fuzzy {typo}"],
+    "query": ["query name:{last_name} birthday.month:3 has:email"],
+    "query-union": ["query phone={phone} OR name={name}"],
+    "query-explain": ["query --explain name:{last_name} NOT has:address"],
+    "add-phone": ["add-contact Newcomer{i} 0123456789", "add-phone Newcomer{i} 0123456780", "delete Newcomer{i}"],
+    "change-phone": ["change-phone {name} {phone} {phone}"],
+    "add-address": ["add-address {name} 1 Jedi Temple"],
+    "add-email": ["add-email {name} {name}@example.com"],
+    "change-birthday": ["change-birthday {name} 01.01.1990"],
+    "import": ["import {csv}"],
+    "noteadd": ["noteadd : Bench {i} : benchmark note : {tag}", "notesremove:Bench {i}"],
+    "notesedit": [
+        "noteadd : Bench {i} : benchmark note : {tag}", "notesedit:Bench {i}:edited text", "notesremove:Bench {i}"
+    ],
+    "notesfind": ["notesfind:{title}"],
+    "notessearch": ["notessearch {word} {word}"],
+    "findbytag": ["findbytag:{rare_tag}"],
+    "addtag": ["noteadd : Bench {i} : benchmark note : {tag}", "addtag:Bench {i}:{tag}", "notesremove:Bench {i}"],
+    "notesall": ["notesall"],
+    "stats": ["stats"],
+}
+
+# Rows of the CSV file of the import command
+IMPORT_ROWS = 1000
+
+
+class Fixture:
+    """
+    The books and files the scenarios of one size work on.
+
+    The books are made on first use and shared by the scenarios, so the
+    scenarios that change them must undo their changes or only rewrite fields.
+
+    Args:
+        size (int): The number of contacts and notes.
+        seed (int): The seed of the generators and of the random picks.
+        directory (str): A directory for the files of the scenarios."""
+
+    def __init__(self, size, seed, directory):
+        self.size = size
+        self.seed = seed
+        self.directory = directory
+        self.rng = random.Random(seed)
+        self._address_book = None
+        self._note_book = None
+
+    @property
+    def address_book(self):
+        if self._address_book is None:
+            self._address_book = make_address_book(self.size, self.seed)
+        return self._address_book
+
+    @property
+    def note_book(self):
+        if self._note_book is None:
+            self._note_book = make_notes_book(self.size, self.seed)
+        return self._note_book
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def pick(self):
+        return self.rng.randrange(self.size)
+
+    def typo(self, name):
+        i = self.rng.randrange(len(name))
+        return name[:i] + name[i + 1:]
+
+
+def scenario(name):
+    """
+    Register a scenario.
+
+    Args:
+        name (str): The name of the scenario in the results.
+
+    Returns:
+        function: The decorator, which returns the setup function unchanged."""
+
+    def register(setup):
+        SCENARIOS[name] = setup
+        return setup
+
+    return register
+
+
+def run_command(line, address_book, note_book):
+    # Whatever the handler prints goes to the null device, like the prompt output would go to the terminal
+    with open(os.devnull, "w") as null, redirect_stdout(null):
+        return render(get_handler(line)(line, address_book, note_book))
+
+
+def uncovered_commands():
+    """
+    Get the registered commands that no command scenario runs.
+
+    Returns:
+        list: The command names, without the aliases of close."""
+
+    covered = {COMMANDS[command_name(line)] for lines in COMMAND_LINES.values() for line in lines}
+    covered.add(COMMANDS["close"])
+    return sorted(name for name, call in COMMANDS.items() if call not in covered)
+
+
+def _command_scenario(lines):
+    def setup(fixture):
+        address_book, note_book = fixture.address_book, fixture.note_book
+        csv_filename = fixture.path("import.csv")
+        if any("{csv}" in line for line in lines) and not os.path.exists(csv_filename):
+            # The first contacts of the book, so that importing them again only merges
+            write_contacts_csv(csv_filename, min(IMPORT_ROWS, fixture.size), fixture.seed)
+        counter = iter(range(10 ** 12))
+
+        def operation():
+            i = fixture.pick()
+            name = contact_name(i)
+            fields = {
+                "i": next(counter),
+                "name": name,
+                "phone": contact_phone(i),
+                "last_name": fixture.rng.choice(LAST_NAMES),
+                "typo": fixture.typo(name),
+                "title": note_title(i),
+                "word": fixture.rng.choice(WORDS),
+                "tag": fixture.rng.choice(TAGS),
+                "rare_tag": f"tag{fixture.rng.randrange(max(fixture.size // 10, 1))}",
+                "csv": csv_filename,
+                "export": fixture.path("export.csv"),
+            }
+            for line in lines:
+                run_command(line.format(**fields), address_book, note_book)
+
+        return operation
+
+    return setup
+
+
+for _name, _lines in COMMAND_LINES.items():
+    scenario(f"cmd:{_name}")(_command_scenario(_lines))
+
+
+@scenario("find")
+def find(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.find(contact_name(fixture.pick()))
+
+
+@scenario("iter_by_name")
+def iter_by_name(fixture):
+    # A seek in the sorted name index and the page after it
+    address_book = fixture.address_book
+    return lambda: list(islice(address_book.iter_by_name(after=contact_name(fixture.pick())), 50))
+
+
+@scenario("find_by_phone")
+def find_by_phone(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.find_by_phone(contact_phone(fixture.pick()))
+
+
+@scenario("find_by_criteria")
+def find_by_criteria(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.find_by_criteria(contact_name(fixture.pick()))
+
+
+@scenario("find_by_criteria_broad")
+def find_by_criteria_broad(fixture):
+    # One last name in 25, so the result grows with the book
+    address_book = fixture.address_book
+    return lambda: address_book.find_by_criteria(fixture.rng.choice(LAST_NAMES))
+
+
+@scenario("suggest_names")
+def suggest_names(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.suggest_names(fixture.typo(contact_name(fixture.pick())))
+
+
+@scenario("complete_names")
+def complete_names(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.complete_names(contact_name(fixture.pick())[:3])
+
+
+@scenario("upcoming_birthdays")
+def upcoming_birthdays(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.upcoming_birthdays(30)
+
+
+@scenario("birthdays_in_month")
+def birthdays_in_month(fixture):
+    address_book = fixture.address_book
+    return lambda: address_book.birthdays_in_month()
+
+
+@scenario("birthday_heap")
+def birthday_heap(fixture):
+    # Building the reminder schedule when the assistant starts with --remind
+    birthdays = fixture.address_book.birthdays()
+    return lambda: BirthdayHeap().update(birthdays, date.today())
+
+
+@scenario("handle_all_birthdays")
+def all_birthdays(fixture):
+    address_book = fixture.address_book
+
+    def operation():
+        with open(os.devnull, "w") as null, redirect_stdout(null):
+            handle_all_birthdays(address_book, 30)
+
+    return operation
+
+
+@scenario("save_to_file")
+def save_to_file(fixture):
+    address_book, filename = fixture.address_book, fixture.path("contacts")
+    return lambda: address_book.save_to_file(filename)
+
+
+@scenario("load_from_file")
+def load_from_file(fixture):
+    filename = fixture.path("contacts")
+    fixture.address_book.save_to_file(filename)
+    return lambda: AddressBook().load_from_file(filename)
+
+
+@scenario("journal_replay")
+def journal_replay(fixture):
+    # A snapshot of the book followed by a journal of 1000 changes
+    filename = fixture.path("journaled")
+    if not os.path.exists(filename):
+        address_book = AddressBook()
+        address_book.open_journal(filename)
+        address_book.bulk_import(generate_contacts(fixture.size, fixture.seed))
+        for i in range(1000):
+            address_book.find(contact_name(i % fixture.size)).add_birthday("01.01.1990")
+        address_book.close_journal()
+    return lambda: AddressBook().load_journal(filename)
+
+
+@scenario("bulk_import")
+def bulk_import(fixture):
+    filename = fixture.path("contacts.csv")
+    write_contacts_csv(filename, fixture.size, fixture.seed)
+    return lambda: AddressBook().bulk_import(read_contacts(filename))
+
+
+@scenario("notes_searchbytag")
+def notes_searchbytag(fixture):
+    note_book = fixture.note_book
+    return lambda: note_book.searchbytag(f"tag{fixture.rng.randrange(max(fixture.size // 10, 1))}")
+
+
+@scenario("notes_searchbytitle")
+def notes_searchbytitle(fixture):
+    note_book = fixture.note_book
+    return lambda: note_book.searchbytitle(note_title(fixture.pick()))
+
+
+@scenario("notes_searchbytext")
+def notes_searchbytext(fixture):
+    note_book = fixture.note_book
+    return lambda: note_book.searchbytext(" ".join(fixture.rng.sample(WORDS, 2)), limit=20)
+
+
+@scenario("notes_save_to_file")
+def notes_save_to_file(fixture):
+    note_book, filename = fixture.note_book, fixture.path("notes")
+    return lambda: note_book.save_to_file(filename)
+
+
+@scenario("notes_load_from_file")
+def notes_load_from_file(fixture):
+    filename = fixture.path("notes")
+    fixture.note_book.save_to_file(filename)
+    return lambda: NotesBook([]).load_from_file(filename)
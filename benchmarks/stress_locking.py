@@ -0,0 +1,122 @@
+"""
+Stress a thread-safe AddressBook with concurrent readers and a writer.
+
+For 1, 2, 4 and 8 reader threads, the readers run find_by_criteria and
+find_by_phone in a loop for a few seconds while one writer adds and deletes
+contacts and phones about a thousand times a second. The same run is
+repeated with the reader-writer lock and with a plain mutex in its place,
+first with reads that only use the CPU, then with reads that keep the lock
+for 0.2 ms without the GIL, like a reader streaming its result to a socket.
+Under the GIL only the second kind can scale with threads; it shows that
+readers do not queue behind each other. At the end of every run the indexes
+are checked against the records.
+
+Usage: python benchmarks/stress_locking.py [number of contacts] [seconds per run]
+"""
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "PyForce"))
+
+from locking import ReadWriteLock  # noqa: E402
+from models import AddressBook  # noqa: E402
+
+
+class MutexLock(ReadWriteLock):
+    """A ReadWriteLock that lets one thread in at a time, readers included."""
+
+    def acquire_read(self):
+        self.acquire_write()
+
+    def release_read(self):
+        self.release_write()
+
+
+def make_book(size, lock_class):
+    book = AddressBook()
+    for i in range(size):
+        book.add_record(f"Jedi{i}", f"{1000000000 + i}", None, f"{1 + i % 28:02d}.{1 + i % 12:02d}.1990")
+    book._lock = lock_class()
+    return book
+
+
+def reader(book, size, hold, stop, counts, errors):
+    done = 0
+    try:
+        while not stop.is_set():
+            i = random.randrange(size)
+            with book._lock.reading():
+                book.find_by_criteria(f"Jedi{i}")
+                book.find_by_phone(f"{1000000000 + i}")
+                if hold:
+                    time.sleep(hold)
+            done += 2
+    except Exception as ex:
+        errors.append(ex)
+    counts.append(done)
+
+
+def writer(book, size, stop, errors):
+    i = 0
+    try:
+        while not stop.is_set():
+            name = f"Sith{i % 100}"
+            if name in book.data:
+                book.delete(name)
+            else:
+                book.add_record(name, f"{2000000000 + i % 100}")
+            record = book.find(f"Jedi{random.randrange(size)}")
+            record.add_phone(f"{3000000000 + i}")
+            record.remove_phone(f"{3000000000 + i}")
+            i += 1
+            time.sleep(0.001)
+    except Exception as ex:
+        errors.append(ex)
+
+
+def check_indexes(book):
+    for name, record in book.data.items():
+        for phone in record.phones:
+            assert record in book.find_by_phone(phone.value), f"{name} is missing from the phone index"
+        assert name in book._search_index.search(name), f"{name} is missing from the search index"
+    assert len(book._phone_index.terms) == len(book.data), "the phone index has stale contacts"
+
+
+def run(book, size, threads, hold, seconds):
+    stop = threading.Event()
+    counts, errors = [], []
+    workers = [threading.Thread(target=reader, args=(book, size, hold, stop, counts, errors)) for _ in range(threads)]
+    workers.append(threading.Thread(target=writer, args=(book, size, stop, errors)))
+    for worker in workers:
+        worker.start()
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+    if errors:
+        raise errors[0]
+    return sum(counts) / seconds
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    print(f"{size} contacts, {seconds:g} s per run, one writer")
+    for hold, title in ((0, "CPU-only reads"), (0.0002, "reads holding the lock 0.2 ms")):
+        print(f"\n{title}")
+        print(f"{'readers':>8} {'rw lock reads/s':>16} {'mutex reads/s':>14}")
+        for threads in (1, 2, 4, 8):
+            results = []
+            for lock_class in (ReadWriteLock, MutexLock):
+                book = make_book(size, lock_class)
+                results.append(run(book, size, threads, hold, seconds))
+                check_indexes(book)
+            print(f"{threads:>8} {results[0]:>16.0f} {results[1]:>14.0f}")
+    print("\nindexes consistent after every run")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,10 +13,10 @@ setup(
         "kucherkovpromotion@gmail.com",
     ],
     license="MIT",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     entry_points={
         "console_scripts": [
-            "pyforce = pyforce.main:main_function",
+            "pyforce = PyForce.launcher:launch",
             "pyforce-models = pyforce.models:function_in_models",
             "pyforce-notes = pyforce.modelsfornotes:function_in_modelsfornotes",
         ]
@@ -24,4 +24,8 @@ setup(
     install_requires=[
         "prompt_toolkit >= 3.0.43",
     ],
+    extras_require={
+        # Vectorized birthday lists, for books of millions of contacts
+        "fast": ["numpy"],
+    },
 )
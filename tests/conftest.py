@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# The PyForce modules import each other by their flat names; the benchmarks are a package of the repository
+sys.path.insert(0, os.path.join(ROOT, "PyForce"))
+sys.path.insert(1, ROOT)
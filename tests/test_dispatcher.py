@@ -0,0 +1,48 @@
+"""
+Handlers returning their lines lazily report errors raised while the lines are made.
+
+The error ends the output as its last line instead of escaping the loop
+printing it, and batch runs count the command as failed.
+"""
+import io
+import json
+
+import main
+from dispatcher import ErrorMessage, render, run_batch
+from models import AddressBook
+from modelsfornotes import NotesBook
+
+
+class FailingBook(AddressBook):
+    # Fails on the second match, once the handler has returned its generator
+    def iter_matches(self, criteria):
+        for number, record in enumerate(super().iter_matches(criteria)):
+            if number:
+                raise RuntimeError("the archives are incomplete")
+            yield record
+
+
+def make_book():
+    book = FailingBook()
+    book.add_record("Obi-Wan", "1000000001")
+    book.add_record("Qui-Gon", "1000000002")
+    return book
+
+
+def test_generator_errors_become_the_last_line():
+    lines = list(main.handle_find_by_criteria("findall 100000000", make_book()))
+    assert lines[0].startswith("Contact name: Obi-Wan")
+    assert lines[-1] == "Unexpected exception young Jedi the archives are incomplete: in def handle_find_by_criteria()"
+    assert isinstance(lines[-1], ErrorMessage)
+
+
+def test_render_and_batch_report_generator_errors_as_failures():
+    book = make_book()
+    assert isinstance(render(main.handle_find_by_criteria("findall 100000000", book)), ErrorMessage)
+    assert not isinstance(render(main.handle_find_by_criteria("findall Qui-Gon", book)), ErrorMessage)
+    output = io.StringIO()
+    executed, failed = run_batch(["findall 100000000", "findall Qui-Gon"], book, NotesBook(), output)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert (executed, failed) == (2, 1)
+    assert [result["ok"] for result in results] == [False, True]
+    assert results[0]["result"].endswith("the archives are incomplete: in def handle_find_by_criteria()")
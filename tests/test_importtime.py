@@ -0,0 +1,14 @@
+"""
+Importing main stays within its budget and leaves the optional modules unloaded.
+
+The same check as "python -m benchmarks.importtime", with its default budget
+and number of runs.
+"""
+from benchmarks.importtime import BUDGET_MS, DEFERRED_MODULES, fastest_import
+
+
+def test_import_main_within_budget_without_deferred_modules():
+    times = fastest_import()
+    assert [name for name in DEFERRED_MODULES if name in times] == []
+    elapsed = times["main"][1] / 1000
+    assert elapsed <= BUDGET_MS, f"import main took {elapsed:.2f} ms, over the budget of {BUDGET_MS:g} ms"
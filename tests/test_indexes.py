@@ -0,0 +1,27 @@
+"""
+Edge cases of the indexes behind name completion.
+"""
+from indexes import PrefixIndex
+
+
+def test_complete_stops_at_the_limit_within_case_variants():
+    index = PrefixIndex()
+    index.update(["ab", "Ab", "aB", "AB", "abc", "ABC", "Abd", "b"])
+    for limit in range(1, 9):
+        found = index.complete("ab", limit)
+        assert len(found) == min(limit, 7)
+        assert found == index.complete("ab", 20)[:limit]
+    assert sorted(index.complete("AB", 20)) == sorted(["ab", "Ab", "aB", "AB", "abc", "ABC", "Abd"])
+    assert index.complete("abc", 1) in (["abc"], ["ABC"])
+
+
+def test_complete_matches_a_scan_across_buckets():
+    names = [f"{jedi}{i}" for i in range(3000) for jedi in ("jedi", "Jedi", "JEDI")]
+    index = PrefixIndex()
+    index.update(names)
+    for prefix in ("jedi1", "JEDI29", "Jedi2999", "sith"):
+        expected = sorted((name for name in names if name.casefold().startswith(prefix.casefold())), key=str.casefold)
+        for limit in (1, 2, 4, 20, 500):
+            found = index.complete(prefix, limit)
+            assert len(found) == min(limit, len(expected))
+            assert [name.casefold() for name in found] == [name.casefold() for name in expected[:limit]]
@@ -0,0 +1,95 @@
+"""
+Concurrent readers, a writer and background checkpoints on a locked, journaled book.
+
+After the threads stop, every index has to agree with the records, and the
+book loaded back from its snapshot and log has to hold the same contacts.
+"""
+import random
+import threading
+import time
+
+from models import AddressBook
+
+SIZE = 2000
+SECONDS = 1.5
+
+
+def make_book(path):
+    book = AddressBook()
+    book.open_journal(str(path / "contacts"))
+    for i in range(SIZE):
+        book.add_record(f"Jedi{i}", f"{1000000000 + i}", None, f"{1 + i % 28}.{1 + i % 12}.1990")
+    book.enable_locking()
+    return book
+
+
+def run_threads(targets, seconds):
+    stop = threading.Event()
+    errors = []
+
+    def guarded(target):
+        try:
+            while not stop.is_set():
+                target()
+        except Exception as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=guarded, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert not errors, errors
+
+
+def check_indexes(book):
+    names = set(book.data)
+    assert set(book._search_index.documents) == names
+    assert set(book._phone_index.terms) == names
+    assert book._name_index.keys == names
+    assert set(book._name_prefixes.counts) == names
+    assert all(count == 1 for count in book._name_prefixes.counts.values())
+    for name, record in book.data.items():
+        assert book._search_index.documents[name] == record.get_search_string()
+        for phone in record.phones:
+            assert record in book.find_by_phone(phone.value)
+        assert name in book._search_index.search(name)
+        birthday = record.get_birthday_date()
+        assert (name in book._birthdays.slots) == (birthday is not None)
+
+
+def test_readers_writer_and_background_checkpoints(tmp_path):
+    book = make_book(tmp_path)
+    rng = random.Random(0)
+    counter = iter(range(10**9))
+
+    def read():
+        i = rng.randrange(SIZE)
+        book.find_by_criteria(f"Jedi{i}")
+        book.find_by_phone(f"{1000000000 + i}")
+        book.upcoming_birthdays(30)
+
+    def write():
+        i = next(counter)
+        name = f"Sith{i % 100}"
+        if name in book.data:
+            book.delete(name)
+        else:
+            book.add_record(name, f"{2000000000 + i % 100}", None, "3.4.1977" if i % 2 else None)
+        record = book.find(f"Jedi{i % SIZE}")
+        record.add_phone(f"{3000000000 + i}")
+        if i % 3:
+            record.remove_phone(f"{3000000000 + i}")
+
+    run_threads([read, read, read, write, book.background_checkpoint], SECONDS)
+    check_indexes(book)
+
+    expected = {name: str(record) for name, record in book.data.items()}
+    book.close_journal()
+    loaded = AddressBook()
+    loaded.open_journal(str(tmp_path / "contacts"))
+    assert {name: str(record) for name, record in loaded.data.items()} == expected
+    check_indexes(loaded)
+    loaded.close_journal()
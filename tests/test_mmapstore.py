@@ -0,0 +1,62 @@
+"""
+The memory-mapped book answers phone lookups, searches and queries like the in-memory one.
+
+Its phone and search indexes are built from the map on first use and then
+kept up to date by every change, including changes made before they were
+built, changes folded into a new map by a checkpoint and imported batches.
+"""
+from mmapstore import MappedAddressBook
+from models import AddressBook
+
+SIZE = 500
+
+
+def fill(book):
+    for i in range(SIZE):
+        book.add_record(f"Jedi{i}", f"{1000000000 + i}", f"Temple {i % 7}", f"{1 + i % 28}.{1 + i % 12}.1990")
+
+
+def change(book):
+    book.data["Jedi1"].add_phone("2000000001")
+    book.data["Jedi2"].remove_phone("1000000002")
+    book.data["Jedi3"].add_address("Tatooine")
+    book.delete("Jedi4")
+    book.add_record("Sith1", "3000000001", "Moraband")
+    book.bulk_import([{"name": "Jedi5", "phones": ["2000000005"]}, {"name": "Sith2", "phones": ["3000000002"]}])
+
+
+def answers(book):
+    phones = ["1000000001", "2000000001", "1000000002", "1000000004", "2000000005", "3000000001", "3000000002"]
+    searches = ["Jedi1", "Temple 3", "Tatooine", "Moraband", "Sith", "200000000"]
+    queries = ["phone:2000000001", "address:Temple", "name:Sith2", "Jedi4"]
+    return (
+        {phone: [record.name.value for record in book.find_by_phone(phone)] for phone in phones},
+        {criteria: sorted(book.find_by_criteria(criteria)) for criteria in searches},
+        {text: [record.name.value for record in book.query(text)] for text in queries},
+    )
+
+
+def test_indexes_agree_with_the_in_memory_book(tmp_path):
+    expected = AddressBook()
+    fill(expected)
+    mapped = MappedAddressBook()
+    mapped.open_journal(str(tmp_path / "contacts.map"))
+    fill(mapped)
+    mapped.checkpoint()
+    # Part of the changes land before the indexes are built, part after
+    expected.delete("Jedi0")
+    mapped.delete("Jedi0")
+    assert answers(mapped) == answers(expected)
+    assert mapped._phone_index is not None and mapped._search_index is not None
+    change(expected)
+    change(mapped)
+    assert answers(mapped) == answers(expected)
+    mapped.checkpoint()
+    assert answers(mapped) == answers(expected)
+    mapped.close_journal()
+
+    reopened = MappedAddressBook()
+    reopened.open_journal(str(tmp_path / "contacts.map"))
+    assert reopened._phone_index is None and reopened._search_index is None
+    assert answers(reopened) == answers(expected)
+    reopened.close_journal()